@@ -1,33 +1,81 @@
 from fastapi import Header, HTTPException, Depends
-import firebase_admin
-from firebase_admin import auth, credentials
 import os
+import threading
+from services.aio import run_io
+from services.metrics import span, cache_samples, register_collector
 
 # Initialize Firebase Admin SDK
 import json
 
+# firebase_admin (and google-auth under it) is a large part of a cold start,
+# so it is imported and initialized on the first token that needs verifying.
 cred = None
 firebase_credentials = os.environ.get("FIREBASE_CREDENTIALS")
+_firebase_ready = False
+_firebase_lock = threading.Lock()
 
-try:
-    if firebase_credentials:
-        # Load from Environment Variable (JSON String)
-        cred_dict = json.loads(firebase_credentials)
-        cred = credentials.Certificate(cred_dict)
-        firebase_admin.initialize_app(cred)
-        print("Firebase Admin initialized with credentials from Environment.")
-    elif os.path.exists("serviceAccountKey.json"):
-        # Load from File (Local Dev)
-        cred = credentials.Certificate("serviceAccountKey.json")
-        firebase_admin.initialize_app(cred)
-        print("Firebase Admin initialized with local serviceAccountKey.json.")
-    else:
-        # Fallback (Mock/ADC) - Verification will fail for real tokens without creds
-        if not firebase_admin._apps:
-            firebase_admin.initialize_app()
-            print("Warning: Firebase Admin initialized without explicit credentials.")
-except Exception as e:
-    print(f"Warning: Firebase Admin init failed: {e}")
+def _init_firebase():
+    global cred, _firebase_ready
+    if _firebase_ready:
+        return
+    with _firebase_lock:
+        if _firebase_ready:
+            return
+        import firebase_admin
+        from firebase_admin import credentials
+
+        try:
+            if firebase_credentials:
+                # Load from Environment Variable (JSON String)
+                cred_dict = json.loads(firebase_credentials)
+                cred = credentials.Certificate(cred_dict)
+                firebase_admin.initialize_app(cred)
+                print("Firebase Admin initialized with credentials from Environment.")
+            elif os.path.exists("serviceAccountKey.json"):
+                # Load from File (Local Dev)
+                cred = credentials.Certificate("serviceAccountKey.json")
+                firebase_admin.initialize_app(cred)
+                print("Firebase Admin initialized with local serviceAccountKey.json.")
+            else:
+                # Fallback (Mock/ADC) - Verification will fail for real tokens without creds
+                if not firebase_admin._apps:
+                    firebase_admin.initialize_app()
+                    print("Warning: Firebase Admin initialized without explicit credentials.")
+        except Exception as e:
+            print(f"Warning: Firebase Admin init failed: {e}")
+        _firebase_ready = True
+
+def _project_id():
+    # Firebase project the ID tokens are issued for (their aud claim)
+    project_id = os.environ.get("FIREBASE_PROJECT_ID")
+    if project_id:
+        return project_id
+    try:
+        if firebase_credentials:
+            return json.loads(firebase_credentials).get("project_id")
+        if os.path.exists("serviceAccountKey.json"):
+            with open("serviceAccountKey.json") as f:
+                return json.load(f).get("project_id")
+    except Exception as e:
+        print(f"Warning: could not read the Firebase project id: {e}")
+    return os.environ.get("GOOGLE_CLOUD_PROJECT")
+
+def _verify_with_firebase(token):
+    _init_firebase()
+    from firebase_admin import auth
+    return auth.verify_id_token(token)
+
+_verifier = None
+register_collector(lambda: cache_samples("tokens", _verifier.cache.stats()) if _verifier is not None else [])
+
+def get_token_verifier():
+    # Verified-token cache + local signature checks (services/token_verifier.py).
+    # Without a known project id, tokens go through firebase_admin, still cached.
+    global _verifier
+    if _verifier is None:
+        from services.token_verifier import TokenVerifier
+        _verifier = TokenVerifier(_project_id(), fallback=_verify_with_firebase)
+    return _verifier
 
 async def verify_token(authorization: str = Header(...)):
     if not authorization.startswith("Bearer "):
@@ -40,9 +88,17 @@ async def verify_token(authorization: str = Header(...)):
     if token == "test-token":
         return {"uid": "test_user", "email": "test@example.com"}
 
+    verifier = get_token_verifier()
+    # Token seen before and not expired: no parsing, no signature check
+    decoded_token = verifier.cached(token)
+    if decoded_token is not None:
+        return decoded_token
+
     try:
         # Verify the ID token
-        decoded_token = auth.verify_id_token(token)
+        # Can block (key fetch, SDK import), keep it off the event loop
+        with span("auth"):
+            decoded_token = await run_io(verifier.verify, token)
         return decoded_token
     except Exception as e:
         print(f"Token verification failed: {e}")
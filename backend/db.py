@@ -1,17 +1,170 @@
-import boto3
 import os
+import threading
 
 # Initialize DynamoDB client
 # IF running locally, you might want to point to specific credentials or Local DynamoDB
 # For now, we assume standard AWS credentials or Lambda execution role
 
-dynamodb = boto3.resource('dynamodb')
+# Client registry: one DynamoDB resource and one Redis connection pool per
+# container, created on first use (importing boto3/redis is a large share of
+# a cold start, and routes like / never touch either) and reused by every
+# request afterwards.
 
 MOVIES_TABLE_NAME = os.environ.get("MOVIES_TABLE", "movies-table")
 RATINGS_TABLE_NAME = os.environ.get("RATINGS_TABLE", "ratings-table")
 
+# botocore: enough pooled connections for the I/O threads (services/aio.py),
+# kept alive between invocations, adaptive (client-side rate limited) retries
+DYNAMODB_MAX_POOL = int(os.environ.get("DYNAMODB_MAX_POOL", 64))
+DYNAMODB_CONNECT_TIMEOUT = float(os.environ.get("DYNAMODB_CONNECT_TIMEOUT", 2))
+DYNAMODB_READ_TIMEOUT = float(os.environ.get("DYNAMODB_READ_TIMEOUT", 5))
+DYNAMODB_MAX_ATTEMPTS = int(os.environ.get("DYNAMODB_MAX_ATTEMPTS", 5))
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", 32))
+REDIS_TIMEOUT = float(os.environ.get("REDIS_TIMEOUT", 1))
+REDIS_CONNECT_TIMEOUT = float(os.environ.get("REDIS_CONNECT_TIMEOUT", 0.5))
+
+_lock = threading.Lock()
+_dynamodb = None
+_redis_pool = None
+_async_redis = {}
+
+# Pool usage, for GET /diagnostics/clients
+_counters = {
+    "dynamodb_requests": 0,
+    "redis_checkouts": 0,
+    "redis_connections_opened": 0,
+    "async_redis_checkouts": 0,
+    "async_redis_connections_opened": 0,
+}
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+def get_dynamodb():
+    global _dynamodb
+    if _dynamodb is None:
+        with _lock:
+            if _dynamodb is None:
+                import boto3
+                from botocore.config import Config
+
+                config = Config(
+                    max_pool_connections=DYNAMODB_MAX_POOL,
+                    tcp_keepalive=True,
+                    connect_timeout=DYNAMODB_CONNECT_TIMEOUT,
+                    read_timeout=DYNAMODB_READ_TIMEOUT,
+                    retries={"mode": "adaptive", "max_attempts": DYNAMODB_MAX_ATTEMPTS},
+                )
+                resource = boto3.resource('dynamodb', config=config)
+                resource.meta.client.meta.events.register(
+                    "before-send.dynamodb", lambda **kwargs: _count("dynamodb_requests"),
+                )
+                # Per-operation latency and consumed capacity (services/metrics.py)
+                from services.metrics import instrument_dynamodb
+                instrument_dynamodb(resource.meta.client)
+                _dynamodb = resource
+    return _dynamodb
+
+def __getattr__(name):
+    # `from db import dynamodb` still works (builds the resource at that point)
+    if name == "dynamodb":
+        return get_dynamodb()
+    raise AttributeError(f"module 'db' has no attribute '{name}'")
+
 def get_movies_table():
-    return dynamodb.Table(MOVIES_TABLE_NAME)
+    return get_dynamodb().Table(MOVIES_TABLE_NAME)
 
 def get_ratings_table():
-    return dynamodb.Table(RATINGS_TABLE_NAME)
+    return get_dynamodb().Table(RATINGS_TABLE_NAME)
+
+def _redis_options():
+    return dict(
+        host=REDIS_HOST, port=REDIS_PORT, db=0,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        socket_timeout=REDIS_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        socket_keepalive=True,
+        health_check_interval=30,
+    )
+
+def get_redis():
+    # Clients are cheap wrappers; the shared pool holds the sockets. Blocking
+    # pool: past REDIS_MAX_CONNECTIONS callers wait (up to the timeout)
+    # instead of failing.
+    global _redis_pool
+    import redis
+
+    if _redis_pool is None:
+        with _lock:
+            if _redis_pool is None:
+                class CountingPool(redis.BlockingConnectionPool):
+                    def get_connection(self, *args, **kwargs):
+                        _count("redis_checkouts")
+                        return super().get_connection(*args, **kwargs)
+
+                    def make_connection(self):
+                        _count("redis_connections_opened")
+                        return super().make_connection()
+
+                _redis_pool = CountingPool(timeout=REDIS_TIMEOUT, **_redis_options())
+    return redis.Redis(connection_pool=_redis_pool)
+
+def get_async_redis():
+    # redis.asyncio client with its own pool, one per event loop (asyncio
+    # connections are bound to the loop that opened them)
+    import asyncio
+    import redis.asyncio as aioredis
+
+    loop_id = id(asyncio.get_running_loop())
+    client = _async_redis.get(loop_id)
+    if client is None:
+        class CountingAsyncPool(aioredis.BlockingConnectionPool):
+            async def get_connection(self, *args, **kwargs):
+                _count("async_redis_checkouts")
+                return await super().get_connection(*args, **kwargs)
+
+            def make_connection(self):
+                _count("async_redis_connections_opened")
+                return super().make_connection()
+
+        client = aioredis.Redis(connection_pool=CountingAsyncPool(timeout=REDIS_TIMEOUT, **_redis_options()))
+        _async_redis[loop_id] = client
+    return client
+
+def _http_pool_stats(client):
+    # urllib3 pools behind the botocore client (private attributes, best effort)
+    try:
+        manager = client._endpoint.http_session._manager
+        pools = [manager.pools[key] for key in manager.pools.keys()]
+    except Exception:
+        return {}
+    return {
+        "http_pools": len(pools),
+        "http_connections_opened": sum(p.num_connections for p in pools),
+        "http_requests": sum(p.num_requests for p in pools),
+        "http_idle_connections": sum(p.pool.qsize() for p in pools if p.pool is not None),
+    }
+
+def client_stats():
+    with _lock:
+        stats = dict(_counters)
+
+    stats["dynamodb_initialized"] = _dynamodb is not None
+    if _dynamodb is not None:
+        stats["dynamodb_max_pool"] = DYNAMODB_MAX_POOL
+        stats.update(_http_pool_stats(_dynamodb.meta.client))
+        opened = stats.get("http_connections_opened", 0)
+        if stats["dynamodb_requests"]:
+            stats["dynamodb_connection_reuse"] = 1 - opened / stats["dynamodb_requests"]
+
+    stats["redis_initialized"] = _redis_pool is not None
+    if _redis_pool is not None:
+        stats["redis_max_connections"] = REDIS_MAX_CONNECTIONS
+        if stats["redis_checkouts"]:
+            stats["redis_connection_reuse"] = 1 - stats["redis_connections_opened"] / stats["redis_checkouts"]
+    stats["async_redis_clients"] = len(_async_redis)
+    return stats
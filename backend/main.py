@@ -1,7 +1,17 @@
+import os
+import time
+
+# STARTUP_PROFILE=1 prints how long the app takes to come up (imports +
+# initialization). Per-module numbers: scripts/profile_startup.py, or
+# PYTHONPROFILEIMPORTTIME=1 on the Lambda itself.
+_startup_began = time.perf_counter()
+
 from fastapi import FastAPI
 from mangum import Mangum
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+from services.metrics import MetricsMiddleware
+from services.deadline import invocation_deadline
 
 load_dotenv()
 
@@ -14,16 +24,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],  # pagination, metrics
 )
+# Request latency, Server-Timing header (services/metrics.py)
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/")
 def read_root():
     return {"message": "Movie Recommendation API is running!"}
 
-from routers import movies, recommendations, ratings
+from routers import movies, recommendations, ratings, diagnostics, metrics
 
 app.include_router(movies.router)
 app.include_router(recommendations.router)
 app.include_router(ratings.router)
+app.include_router(diagnostics.router)
+app.include_router(metrics.router)
+
+asgi_handler = Mangum(app)
+
+def handler(event, context):
+    # Waits on other containers stop before the function timeout (services/deadline.py)
+    with invocation_deadline(context):
+        return asgi_handler(event, context)
 
-handler = Mangum(app)
+if os.environ.get("STARTUP_PROFILE"):
+    print(f"Startup: app ready in {(time.perf_counter() - _startup_began) * 1000:.1f} ms")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, computed_field
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 class Movie(BaseModel):
     movie_id: str
@@ -25,3 +25,13 @@ class Rating(BaseModel):
 class RecommendationRequest(BaseModel):
     user_id: str
     num_recommendations: int = 5
+    mode: Optional[Literal["user", "item", "als"]] = None  # None = deployment default
+
+class BatchRecommendationRequest(BaseModel):
+    user_ids: List[str]
+    num_recommendations: int = 5
+    mode: Optional[Literal["user", "item", "als"]] = None
+
+class ScoredMovie(BaseModel):
+    movie_id: str
+    score: float
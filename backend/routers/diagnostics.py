@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Depends
+from auth import get_current_user
+from db import client_stats
+
+router = APIRouter(
+    prefix="/diagnostics",
+    tags=["diagnostics"]
+)
+
+@router.get("/clients")
+async def get_client_stats(user: dict = Depends(get_current_user)):
+    # Shared DynamoDB/Redis clients: pool sizes, requests and connection reuse
+    # (1 - connections opened / requests) since the container started
+    return client_stats()
@@ -0,0 +1,30 @@
+import hmac
+import os
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Response
+from db import client_stats
+from services.metrics import gauge, register_collector, render
+
+# Prometheus scrape target (services/metrics.py). Off (404) unless METRICS_TOKEN
+# is set; scrapers send it as a bearer token.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+router = APIRouter(tags=["metrics"])
+
+def _client_metrics():
+    # Same numbers as /diagnostics/clients
+    return [
+        gauge("client_stat", "Shared DynamoDB/Redis client pool statistics", value, stat=name)
+        for name, value in client_stats().items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
+
+register_collector(_client_metrics)
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,59 +1,75 @@
-from fastapi import APIRouter
-from typing import List
+from fastapi import APIRouter, Query, Request
+from typing import List, Optional
 from models import Movie
 from db import get_movies_table
-from boto3.dynamodb.conditions import Key
+from services.aio import run_io
+from services.movie_store import MOVIE_PROJECTION, MOVIE_PROJECTION_NAMES, get_movies_by_ids_async
+from services.pagination import PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from services.response_cache import cached_json
+from services.metrics import span
 
 router = APIRouter(
     prefix="/movies",
     tags=["movies"]
 )
 
+async def _with_pending_votes(items: List[dict]) -> List[dict]:
+    # Add the votes still buffered in Redis (services/vote_buffer.py) to items
+    # just read from the table. Only a buffer this container already opened is
+    # used, so a cold /movies never loads redis.
+    if not items:
+        return items
+    from services.vote_buffer import peek_vote_buffer, with_pending
+    buffer = peek_vote_buffer()
+    if buffer is None:
+        return items
+    _, pending = await buffer.pending_async([item['movie_id'] for item in items])
+    return [with_pending(item, pending) for item in items]
+
 @router.get("/", response_model=List[Movie])
-def get_movies(search: str = None):
-    table = get_movies_table()
+async def get_movies(
+    request: Request,
+    search: str = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    start_key = decode_cursor(cursor)
     try:
         if search:
-            # DynamoDB 'contains' is case-sensitive. 
-            # For case-insensitive search without a separate index, we scan and filter in Python.
-            # Dataset is small (~10k movies, <1MB projected), so this is performant for a prototype.
-            
-            scan_kwargs = {
-                'ProjectionExpression': "movie_id, title, genres, #y, average_rating",
-                'ExpressionAttributeNames': {"#y": "year"}
-            }
-            
-            done = False
-            start_key = None
-            items = []
-            search_lower = search.lower()
-            
-            while not done:
-                if start_key:
-                    scan_kwargs['ExclusiveStartKey'] = start_key
-                
-                response = table.scan(**scan_kwargs)
-                chunk = response.get('Items', [])
-                
-                for item in chunk:
-                    if search_lower in item.get('title', '').lower():
-                        items.append(item)
-                        if len(items) >= 20: 
-                            break
-                            
-                if len(items) >= 20:
-                    break
-                
-                start_key = response.get('LastEvaluatedKey', None)
-                done = start_key is None
-            
-            print(f"Search: '{search}', Found: {len(items)}")
-            return items
+            # Matched on the in-memory title index (case/accent-insensitive,
+            # prefix + substring). Imported here so the plain listing never loads numpy.
+            # The catalog's vote aggregates are up to MOVIE_CATALOG_TTL old, so
+            # the hits are hydrated through the movie cache, which drops them
+            # when the vote buffer flushes and adds the pending votes.
+            async def search_movies():
+                from services.movie_catalog import get_catalog
+                catalog = await run_io(get_catalog)
+                with span("search"):
+                    movie_ids = [item['movie_id'] for item in catalog.search(search)]
+                print(f"Search: '{search}', Found: {len(movie_ids)}")
+                movies = await get_movies_by_ids_async(movie_ids)
+                return [movies[mid] for mid in movie_ids if mid in movies]
+
+            # Whole responses cached per query (services/response_cache.py)
+            return await cached_json(request, f"search:{search.strip().lower()}", search_movies)
         
-        # Default behavior: Access Pattern: Get some movies
-        response = table.scan(Limit=50)
-        items = response.get('Items', [])
-        return items
+        # Default behavior: Access Pattern: Get some movies, a page at a time
+        # (table order; the next page's cursor is in X-Next-Cursor)
+        async def scan_page():
+            table = await run_io(get_movies_table)
+            scan_kwargs = dict(
+                Limit=limit,
+                ProjectionExpression=MOVIE_PROJECTION,
+                ExpressionAttributeNames=MOVIE_PROJECTION_NAMES,
+            )
+            if start_key:
+                scan_kwargs['ExclusiveStartKey'] = start_key
+            response = await run_io(table.scan, **scan_kwargs)
+            items = await _with_pending_votes(response.get('Items', []))
+            next_cursor = encode_cursor(response.get('LastEvaluatedKey'))
+            return [Movie(**item) for item in items], {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+        return await cached_json(request, f"movies:{limit}:{cursor or ''}", scan_page, connect=False)
     except Exception as e:
         print(f"Error accessing DynamoDB: {e}")
         return []
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
 from pydantic import BaseModel
-from models import Rating, Movie
 from db import get_ratings_table, get_movies_table
 from auth import get_current_user
+from services.movie_store import get_movies_by_ids_async, invalidate_movie
+from services.results_store import get_results_store
+from services.response_cache import invalidate as invalidate_responses
+from services.aio import run_io
+from services.aggregates import vote_delta
+from services.vote_buffer import get_vote_buffer
+from services.pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor, stream_json, single_page
+from services.bulk_ratings import import_ratings, BULK_MAX_RATINGS
 import time
 from decimal import Decimal
 
@@ -12,31 +19,21 @@ router = APIRouter(
     tags=["ratings"]
 )
 
-# Need raw dynamo resource for batch_get_item
-import boto3
-import os
-REGION = os.environ.get("AWS_DEFAULT_REGION", "us-east-1")
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
-
 class RatingRequest(BaseModel):
     movie_id: str
     rating: float
 
+class BulkRatingRequest(BaseModel):
+    ratings: List[RatingRequest]
+
 @router.post("/")
-def rate_movie(request: RatingRequest, user: dict = Depends(get_current_user)):
+async def rate_movie(request: RatingRequest, user: dict = Depends(get_current_user)):
     user_id = user.get('uid')
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID not found")
 
-    ratings_table = get_ratings_table()
-    movies_table = get_movies_table()
-    
-    # Check for existing rating to handle atomic updates correctly
-    old_rating = 0.0
-    existing_rating = ratings_table.get_item(Key={'user_id': user_id, 'movie_id': request.movie_id})
-    
-    if 'Item' in existing_rating:
-        old_rating = float(existing_rating['Item']['rating'])
+    ratings_table = await run_io(get_ratings_table)
+    movies_table = await run_io(get_movies_table)
     
     # Save rating to DynamoDB
     item = {
@@ -47,136 +44,169 @@ def rate_movie(request: RatingRequest, user: dict = Depends(get_current_user)):
     }
     
     try:
-        ratings_table.put_item(Item=item)
-        
-        # Update Movie Aggregation
+        # The put hands back the rating it replaced (atomically, so concurrent
+        # re-rates each see the value they overwrote): no read before the write
+        response = await run_io(ratings_table.put_item, Item=item, ReturnValues='ALL_OLD')
+        old = response.get('Attributes')
+        old_rating = float(old['rating']) if old else None
         rating_val = float(request.rating)
-        
-        if 'Item' in existing_rating:
-             # User is updating their rating. Count stays same, Total changes by difference.
-             diff = rating_val - old_rating
-             # Avoid DB call if no change
-             if diff != 0:
-                 movies_table.update_item(
-                    Key={'movie_id': request.movie_id},
-                    UpdateExpression="SET vote_total = vote_total + :diff",
-                    ExpressionAttributeValues={':diff': Decimal(str(diff))}
-                )
-        else:
-            # New Rating. Count +1, Total +Rating
-            movies_table.update_item(
-                Key={'movie_id': request.movie_id},
-                UpdateExpression="SET vote_count = vote_count + :inc, vote_total = vote_total + :val",
-                ExpressionAttributeValues={':inc': 1, ':val': Decimal(str(rating_val))}
-            )
+
+        # Update Movie Aggregation: new rating -> count +1, total +rating;
+        # re-rate -> total changes by the difference (nothing if unchanged).
+        # Buffered and coalesced per movie (services/vote_buffer.py).
+        count_delta, total_delta = vote_delta(old_rating, rating_val)
+        buffer = await run_io(get_vote_buffer)
+        await run_io(buffer.add, movies_table, request.movie_id, count_delta, total_delta)
+
+        # Feed the change to the in-process model (imported here to keep it out of cold starts)
+        from services.recommendation_engine import engine
+        invalidate_movie(request.movie_id)
+        await run_io(lambda: get_results_store().invalidate(user_id))
+        await run_io(invalidate_responses, user_id, [request.movie_id])
+        engine.record_rating(user_id, request.movie_id, rating_val)
 
         return {"message": "Rating saved and aggregated successfully"}
     except Exception as e:
         print(f"Error saving rating: {e}")
         raise HTTPException(status_code=500, detail="Failed to save rating")
 
+@router.post("/bulk")
+async def rate_movies_bulk(request: BulkRatingRequest, user: dict = Depends(get_current_user)):
+    user_id = user.get('uid')
+    if not user_id:
+        raise HTTPException(status_code=401, detail="User ID not found")
+    if len(request.ratings) > BULK_MAX_RATINGS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_RATINGS} ratings per request")
+    if not request.ratings:
+        return {"message": "No ratings to save", "ratings_written": 0, "movies_updated": 0}
+
+    rows = [(user_id, r.movie_id, float(r.rating), None) for r in request.ratings]
+    try:
+        # Batched writes plus one aggregate update per movie (services/bulk_ratings.py)
+        result = await run_io(import_ratings, rows)
+    except Exception as e:
+        print(f"Error saving bulk ratings: {e}")
+        raise HTTPException(status_code=500, detail="Failed to save ratings")
+
+    from services.recommendation_engine import engine
+    movie_ids = {r.movie_id for r in request.ratings}
+    for movie_id in movie_ids:
+        invalidate_movie(movie_id)
+    await run_io(lambda: get_results_store().invalidate(user_id))
+    await run_io(invalidate_responses, user_id, movie_ids)
+    for _, movie_id, rating, _ in rows:
+        engine.record_rating(user_id, movie_id, rating)
+
+    return {"message": "Ratings saved and aggregated successfully", **result}
+
 @router.delete("/{movie_id}")
-def delete_rating(movie_id: str, user: dict = Depends(get_current_user)):
+async def delete_rating(movie_id: str, user: dict = Depends(get_current_user)):
     user_id = user.get('uid')
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID not found")
 
-    ratings_table = get_ratings_table()
-    movies_table = get_movies_table()
+    ratings_table = await run_io(get_ratings_table)
+    movies_table = await run_io(get_movies_table)
     
-    # Get rating value before deleting to update aggregation
-    resp = ratings_table.get_item(Key={'user_id': user_id, 'movie_id': movie_id})
-    if 'Item' not in resp:
+    # Delete and get the removed rating back in one call; of concurrent
+    # deletes only one gets the item, so the aggregate is decremented once
+    resp = await run_io(
+        ratings_table.delete_item,
+        Key={
+            'user_id': user_id,
+            'movie_id': movie_id
+        },
+        ReturnValues='ALL_OLD'
+    )
+    if 'Attributes' not in resp:
         raise HTTPException(status_code=404, detail="Rating not found")
         
-    rating_val = float(resp['Item']['rating'])
+    rating_val = float(resp['Attributes']['rating'])
     
     try:
-        ratings_table.delete_item(
-            Key={
-                'user_id': user_id,
-                'movie_id': movie_id
-            }
-        )
-        
         # Decrement Aggregation
-        movies_table.update_item(
-            Key={'movie_id': movie_id},
-            UpdateExpression="SET vote_count = vote_count - :dec, vote_total = vote_total - :val",
-            ExpressionAttributeValues={':dec': 1, ':val': Decimal(str(rating_val))}
-        )
+        count_delta, total_delta = vote_delta(rating_val, None)
+        buffer = await run_io(get_vote_buffer)
+        await run_io(buffer.add, movies_table, movie_id, count_delta, total_delta)
         
+        from services.recommendation_engine import engine
+        invalidate_movie(movie_id)
+        await run_io(lambda: get_results_store().invalidate(user_id))
+        await run_io(invalidate_responses, user_id, [movie_id])
+        engine.record_removal(user_id, movie_id)
+
         return {"message": "Rating removed/deleted successfully"}
     except Exception as e:
         print(f"Error deleting rating: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete rating")
 
+async def _rated_movies(ratings: List[dict]) -> List[dict]:
+    # Movie details for a page of ratings (BatchGetItem chunks in parallel, through the shared movie cache)
+    if not ratings:
+        return []
+    movies_map = await get_movies_by_ids_async([r['movie_id'] for r in ratings])
+
+    results = []
+    for r in ratings:
+         movie = movies_map.get(r['movie_id'])
+         
+         if movie:
+             # Pydantic model computes average_rating
+             dump = movie.model_dump()
+             dump['my_rating'] = r['rating']
+             results.append(dump)
+    return results
+
 @router.get("/", response_model=List[dict])
-def get_user_ratings(user: dict = Depends(get_current_user)):
+async def get_user_ratings(
+    user: dict = Depends(get_current_user),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    # Without `limit`: every rating, streamed as the query pages come in.
+    # With `limit`: one page, the next page's cursor in X-Next-Cursor.
     user_id = user.get('uid')
     if not user_id:
         raise HTTPException(status_code=401, detail="User ID not found")
 
-    ratings_table = get_ratings_table()
-    movies_table = get_movies_table()
-    
-    try:
-        # 1. Get all ratings for user
-        response = ratings_table.query(
+    start_key = decode_cursor(cursor)
+    if start_key and start_key.get('user_id') != user_id:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    ratings_table = await run_io(get_ratings_table)
+
+    def query_page(exclusive_start_key):
+        kwargs = dict(
             KeyConditionExpression='user_id = :uid',
-            ExpressionAttributeValues={
-                ':uid': user_id
-            }
+            ExpressionAttributeValues={':uid': user_id},
+            ProjectionExpression='movie_id, rating',
         )
-        ratings = response.get('Items', [])
-        
-        if not ratings:
-            return []
-            
-        # 2. Get details for each movie (Optimized with BatchGetItem)
-        if not ratings:
-            return []
-            
-        movie_ids = list(set([r['movie_id'] for r in ratings]))
-        movies_map = {}
-        
-        # BatchGetItem has a limit of 100 keys
-        chunk_size = 100
-        for i in range(0, len(movie_ids), chunk_size):
-            chunk = movie_ids[i:i + chunk_size]
-            keys = [{'movie_id': mid} for mid in chunk]
-            
-            batch_keys = {
-                movies_table.name: {
-                    'Keys': keys
-                }
-            }
-            
-            response = dynamodb.batch_get_item(RequestItems=batch_keys)
-            
-            # Collect results
-            for item in response.get('Responses', {}).get(movies_table.name, []):
-                movies_map[item['movie_id']] = item
-                
-            # Handle manual pagination for UnprocessedKeys if needed (rare for small batches but good practice)
-            while response.get('UnprocessedKeys'):
-                response = dynamodb.batch_get_item(RequestItems=response['UnprocessedKeys'])
-                for item in response.get('Responses', {}).get(movies_table.name, []):
-                    movies_map[item['movie_id']] = item
-
-        results = []
-        for r in ratings:
-             movie = movies_map.get(r['movie_id'])
-             
-             if movie:
-                 # Use Pydantic model to compute average_rating
-                 movie_obj = Movie(**movie)
-                 dump = movie_obj.model_dump()
-                 dump['my_rating'] = r['rating']
-                 results.append(dump)
-                 
-        return results
+        if limit:
+            kwargs['Limit'] = limit
+        if exclusive_start_key:
+            kwargs['ExclusiveStartKey'] = exclusive_start_key
+        return ratings_table.query(**kwargs)
 
+    try:
+        # 1. Get the user's ratings (first page)
+        response = await run_io(query_page, start_key)
     except Exception as e:
         print(f"Error fetching ratings: {e}")
         return []
+
+    if limit:
+        # 2. Get details for each movie
+        page = await _rated_movies(response.get('Items', []))
+        return stream_json(single_page(page), encode_cursor(response.get('LastEvaluatedKey')))
+
+    async def pages():
+        # Follow LastEvaluatedKey to the end (each query page is up to 1 MB)
+        page_response = response
+        while True:
+            yield await _rated_movies(page_response.get('Items', []))
+            last_key = page_response.get('LastEvaluatedKey')
+            if not last_key:
+                return
+            page_response = await run_io(query_page, last_key)
+
+    return stream_json(pages())
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends
-from typing import List
-from models import Movie, RecommendationRequest
-from services.recommendation_engine import engine
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request
+from typing import Dict, List, Optional
+from models import Movie, RecommendationRequest, BatchRecommendationRequest, ScoredMovie
 from auth import get_current_user
+from services.aio import run_io
+from services.response_cache import cached_json, user_tag
+
+# Users per POST /recommendations/batch (scored in one request, within the Lambda timeout)
+BATCH_MAX_USERS = int(os.environ.get("BATCH_MAX_USERS", 500))
 
 router = APIRouter(
     prefix="/recommendations",
@@ -10,7 +15,45 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=List[Movie])
-def get_recommendations(request: RecommendationRequest, user_id: dict = Depends(get_current_user)):
+async def get_recommendations(request: RecommendationRequest, http_request: Request, user_id: dict = Depends(get_current_user)):
     # In real app, use user_id from token, not just request body
     # user_uid = user_id['uid'] 
-    return engine.get_recommendations(request.user_id, request.num_recommendations)
+    # The engine (numpy, model state) loads on the first recommendation request, not at cold start
+    from services.recommendation_engine import engine, RECOMMENDATION_MODE
+    mode = request.mode or RECOMMENDATION_MODE
+    # Cached per user/k/mode until the user rates something (or a movie in it changes)
+    return await cached_json(
+        http_request, f"recs:{request.user_id}:{request.num_recommendations}:{mode}",
+        lambda: engine.get_recommendations_async(request.user_id, request.num_recommendations, mode=mode),
+        tags=[user_tag(request.user_id)], private=True,
+    )
+
+@router.post("/batch", response_model=Dict[str, List[ScoredMovie]])
+async def get_batch_recommendations(request: BatchRecommendationRequest, user_id: dict = Depends(get_current_user)):
+    # Ranked movie ids + scores for many users, scored in one pass (no hydration).
+    # Homepage/email jobs hydrate what they show. The lists are also saved to
+    # the results store, so those users' next POST /recommendations/ (same
+    # mode) is served without scoring.
+    if len(request.user_ids) > BATCH_MAX_USERS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_USERS} users per request")
+    from services.recommendation_engine import engine, RECOMMENDATION_MODE
+    from services.results_store import get_results_store
+    mode = request.mode or RECOMMENDATION_MODE
+    results = await run_io(engine.recommend_many, request.user_ids, request.num_recommendations, mode=mode)
+    try:
+        await run_io(lambda: get_results_store().put_many(results, mode=mode))
+    except Exception as e:
+        print(f"Results store error: {e}")
+    return {
+        uid: [{"movie_id": movie_id, "score": score} for movie_id, score in ranked]
+        for uid, ranked in results.items()
+    }
+
+@router.get("/popular", response_model=List[Movie])
+async def get_popular(request: Request, k: int = 20, genre: Optional[str] = None, year: Optional[int] = None):
+    # Cold-start ranking, optionally narrowed to a genre and/or release year
+    from services.recommendation_engine import engine
+    return await cached_json(
+        request, f"popular:{k}:{genre or ''}:{year or ''}",
+        lambda: engine.get_popular_async(k, genre=genre, year=year),
+    )
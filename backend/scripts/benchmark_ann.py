@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+# Recall@k / latency of the approximate neighbor search against the exact
+# all-pairs path, for a range of nprobe values.
+#
+#   python scripts/benchmark_ann.py --users 20000 --movies 5000
+#   python scripts/benchmark_ann.py --snapshot --side items --k 30
+#
+# Synthetic data has taste clusters (users rate mostly inside a few genres),
+# which is where an inverted file pays off; uniform random ratings have no
+# neighbors worth finding.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.rating_matrix import RatingMatrix
+from services.neighbors import NeighborIndex, NEIGHBOR_BLOCK_SIZE
+from services.ann import CosineANN, recall_at_k, ANN_DIMS, ANN_LISTS, ANN_CANDIDATES
+
+
+def synthetic_matrix(n_users, n_movies, per_user, n_clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    movie_cluster = rng.integers(0, n_clusters, n_movies)
+    cluster_movies = [np.nonzero(movie_cluster == c)[0] for c in range(n_clusters)]
+    user_cluster = rng.integers(0, n_clusters, n_users)
+
+    users, movies = [], []
+    for u in range(n_users):
+        own = cluster_movies[user_cluster[u]]
+        # 80% of a user's ratings come from their own cluster
+        n_own = min(int(per_user * 0.8), len(own))
+        picks = np.concatenate([rng.choice(own, n_own, replace=False), rng.integers(0, n_movies, per_user - n_own)])
+        users.append(np.full(len(picks), u))
+        movies.append(picks)
+    users, movies = np.concatenate(users), np.concatenate(movies)
+    ratings = rng.integers(1, 11, len(users)) / 2.0
+    return RatingMatrix.from_codes(
+        [f"u{i}" for i in range(n_users)], [f"m{j}" for j in range(n_movies)],
+        users, movies, ratings.astype(np.float32), max_bytes=float("inf"),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ANN recall@k against exact neighbors")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--movies", type=int, default=2000)
+    parser.add_argument("--per-user", type=int, default=40, help="ratings per synthetic user")
+    parser.add_argument("--clusters", type=int, default=50, help="synthetic taste clusters")
+    parser.add_argument("--snapshot", action="store_true", help="use the real ratings instead")
+    parser.add_argument("--side", choices=["users", "items"], default="users")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--dims", type=int, default=ANN_DIMS)
+    parser.add_argument("--lists", type=int, default=ANN_LISTS)
+    parser.add_argument("--candidates", type=int, default=ANN_CANDIDATES)
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32")
+    parser.add_argument("--sample", type=int, default=2000, help="query rows measured")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        from services.recommendation_engine import RecommendationEngine
+        engine = RecommendationEngine()
+        engine._fetch_data()
+        matrix = engine.matrix
+        if matrix is None:
+            print("No ratings found.")
+            return
+    else:
+        matrix = synthetic_matrix(args.users, args.movies, args.per_user, args.clusters)
+
+    if args.side == "users":
+        csr, transposed, norms = matrix.by_user, matrix.by_movie, matrix.norms
+    else:
+        csr, transposed, norms = matrix.by_movie, matrix.by_user, matrix.by_movie.row_norms()
+    n = csr.shape[0]
+    rows = np.random.default_rng(1).choice(n, min(args.sample, n), replace=False)
+    print(f"{n} rows x {csr.shape[1]} columns, {csr.nnz} ratings, {len(rows)} query rows")
+
+    start = time.perf_counter()
+    exact = NeighborIndex.build(csr, transposed, norms, k=args.k, block_size=NEIGHBOR_BLOCK_SIZE)
+    exact_seconds = time.perf_counter() - start
+    print(f"exact: full build {exact_seconds:.2f}s")
+
+    start = time.perf_counter()
+    ann = CosineANN(csr, norms, dims=args.dims, n_lists=args.lists)
+    ann_build = time.perf_counter() - start
+    print(f"ann: index build {ann_build:.2f}s ({len(ann.ivf.centroids)} lists, {ann.nbytes / 1e6:.1f} MB)")
+
+    results = {"rows": n, "k": args.k, "exact_build_s": exact_seconds, "ann_build_s": ann_build, "runs": []}
+    for nprobe in [int(p) for p in args.nprobe.split(",")]:
+        start = time.perf_counter()
+        approx = np.concatenate([
+            ann.query(rows[i:i + NEIGHBOR_BLOCK_SIZE], args.k, nprobe=nprobe, candidates=args.candidates)[0]
+            for i in range(0, len(rows), NEIGHBOR_BLOCK_SIZE)
+        ])
+        seconds = time.perf_counter() - start
+        recall = recall_at_k(exact.neighbors[rows], approx)
+        run = {"nprobe": nprobe, "recall": recall, "ms_per_query": seconds * 1000 / len(rows),
+               "projected_build_s": seconds * n / len(rows) + ann_build}
+        results["runs"].append(run)
+        print(f"nprobe={nprobe:<3} recall@{args.k}={recall:.3f}  {run['ms_per_query']:.3f} ms/query  "
+              f"projected build {run['projected_build_s']:.2f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+import argparse
+import asyncio
+import bisect
+import contextlib
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+import numpy as np
+
+# End-to-end benchmark of the API routes on synthetic MovieLens-scale data:
+# latency percentiles, throughput and peak RSS for
+#   recommendations   POST /recommendations/
+#   search            GET /movies/?search=
+#   user_ratings      GET /ratings/
+#   rate              POST /ratings/
+#
+#   python scripts/benchmark_api.py --scale 10k --json results.json
+#   python scripts/benchmark_api.py --users 2000 --movies 5000 --concurrency 16
+#   python scripts/benchmark_api.py --scale 10k --compare results.json   # against an earlier run
+#
+# DynamoDB is an in-memory stand-in (--backend memory, the default: the subset
+# of DynamoDB the routes use, so the numbers are this code's) or moto
+# (--backend moto: full request validation, but a moto Query is linear in the
+# table size and dominates what it measures). Nothing leaves the machine.
+# Redis is used if one answers on REDIS_HOST, otherwise every cache runs in
+# process, as on a container without Redis. Requests go through the ASGI app
+# (routing, validation, serialization) with authentication replaced by an
+# X-Bench-User header.
+#
+# The model is built straight from the synthetic ratings (a scan of millions
+# of items would only measure the stand-in); the ratings table holds the
+# ratings of the --table-users users the requests are made as. Compare runs
+# made on the same machine with the same backend.
+
+SCALES = {"1k": 1000, "10k": 10000, "100k": 100000}
+SCENARIOS = ("recommendations", "search", "user_ratings", "rate")
+GENRES = ["Action", "Adventure", "Animation", "Comedy", "Crime", "Documentary", "Drama",
+          "Fantasy", "Horror", "Musical", "Mystery", "Romance", "Sci-Fi", "Thriller", "War", "Western"]
+WORDS = ["Night", "City", "Love", "Star", "River", "Dark", "Last", "Lost", "Blue", "King",
+         "Storm", "Dream", "Fire", "Ghost", "Island", "Journey", "Secret", "Shadow", "Silver", "Summer",
+         "Winter", "Wild", "Road", "House", "Moon", "Ocean", "Empire", "Garden", "Hunter", "Mirror",
+         "Music", "Queen", "Rain", "Return", "Song", "Stone", "Time", "Train", "Valley", "Zero"]
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def generate(n_users, n_movies, per_user, seed=0):
+    # Ratings with a long-tailed movie popularity (Zipf-like), like real
+    # catalogs: a few movies have most of the votes
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, n_movies + 1) ** 0.9
+    counts = np.clip(rng.geometric(1.0 / per_user, n_users), 1, n_movies)
+    users = np.repeat(np.arange(n_users, dtype=np.int64), counts)
+    movies = rng.choice(n_movies, len(users), p=weights / weights.sum())
+    # One rating per (user, movie)
+    pairs = np.unique(users * n_movies + movies)
+    users, movies = (pairs // n_movies).astype(np.int32), (pairs % n_movies).astype(np.int32)
+    ratings = (rng.integers(1, 11, len(pairs)) / 2.0).astype(np.float32)
+
+    movie_items = []
+    vote_count = np.bincount(movies, minlength=n_movies)
+    vote_total = np.bincount(movies, weights=ratings, minlength=n_movies)
+    for j in range(n_movies):
+        words = rng.choice(len(WORDS), 2, replace=False)
+        movie_items.append({
+            "movie_id": f"m{j}",
+            "title": f"{WORDS[words[0]]} {WORDS[words[1]]} {j}",
+            "genres": [GENRES[g] for g in rng.choice(len(GENRES), int(rng.integers(1, 4)), replace=False)],
+            "year": int(rng.integers(1950, 2025)),
+            "vote_count": int(vote_count[j]),
+            "vote_total": Decimal(str(round(float(vote_total[j]), 1))),
+        })
+    return users, movies, ratings, movie_items
+
+
+class MemoryTable:
+    # Items by (hash key, range key) with the operations the routes and
+    # services use; expressions are the forms this code base writes
+    def __init__(self, name, hash_key, range_key=None):
+        self.name = name
+        self.hash_key, self.range_key = hash_key, range_key
+        self.items = {}
+        self.partitions = {}
+        self.lock = threading.Lock()
+        self.meta = SimpleNamespace(client=self)
+
+    def _key(self, item):
+        return item[self.hash_key], item.get(self.range_key) if self.range_key else None
+
+    def _project(self, item, kwargs):
+        if "ProjectionExpression" not in kwargs:
+            return dict(item)
+        names = kwargs.get("ExpressionAttributeNames", {})
+        attributes = [names.get(a.strip(), a.strip()) for a in kwargs["ProjectionExpression"].split(",")]
+        return {a: item[a] for a in attributes if a in item}
+
+    def _page(self, keys, kwargs):
+        if "ExclusiveStartKey" in kwargs:
+            keys = keys[bisect.bisect_right(keys, self._key(kwargs["ExclusiveStartKey"])):]
+        limit = kwargs.get("Limit", 1000)
+        page = keys[:limit]
+        response = {"Items": [self._project(self.items[key], kwargs) for key in page]}
+        if len(keys) > limit:
+            last = self.items[page[-1]]
+            response["LastEvaluatedKey"] = {k: last[k] for k in (self.hash_key, self.range_key) if k}
+        return response
+
+    def put_item(self, Item, ReturnValues=None):
+        key = self._key(Item)
+        with self.lock:
+            old = self.items.get(key)
+            self.items[key] = dict(Item)
+            if old is None:
+                bisect.insort(self.partitions.setdefault(key[0], []), key)
+        return {"Attributes": old} if old is not None and ReturnValues == "ALL_OLD" else {}
+
+    def delete_item(self, Key, ReturnValues=None):
+        key = self._key(Key)
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.partitions[key[0]].remove(key)
+        return {"Attributes": old} if old is not None and ReturnValues == "ALL_OLD" else {}
+
+    def get_item(self, Key, **kwargs):
+        item = self.items.get(self._key(Key))
+        return {"Item": self._project(item, kwargs)} if item is not None else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues):
+        # "SET a = if_not_exists(a, :zero) + :x, ..." (services/aggregates.py)
+        assignments = re.findall(r"(\w+) = if_not_exists\(\1, :zero\) \+ (:\w+)", UpdateExpression)
+        if not assignments:
+            raise NotImplementedError(UpdateExpression)
+        key = self._key(Key)
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                # Upsert, like UpdateItem
+                item = self.items[key] = dict(Key)
+                bisect.insort(self.partitions.setdefault(key[0], []), key)
+            for attribute, value in assignments:
+                item[attribute] = Decimal(item.get(attribute, 0)) + Decimal(ExpressionAttributeValues[value])
+        return {}
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        # "<hash key> = :value"
+        hash_value = ExpressionAttributeValues[KeyConditionExpression.split("=")[1].strip()]
+        with self.lock:
+            return self._page(list(self.partitions.get(hash_value, [])), kwargs)
+
+    def scan(self, TableName=None, Segment=0, TotalSegments=1, **kwargs):
+        with self.lock:
+            keys = sorted(self.items)[Segment::TotalSegments]
+            return self._page(keys, kwargs)
+
+    def batch_writer(self):
+        return contextlib.nullcontext(self)
+
+
+class MemoryDynamoDB:
+    def __init__(self):
+        self.tables = {}
+        # No botocore client behind it (db.client_stats reports no HTTP pools)
+        self.meta = SimpleNamespace(client=None)
+
+    def create_table(self, name, hash_key, range_key=None):
+        self.tables[name] = MemoryTable(name, hash_key, range_key)
+
+    def Table(self, name):
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.tables[name]
+            found = [table.get_item(Key=key, **request).get("Item") for key in request["Keys"]]
+            responses[name] = [item for item in found if item is not None]
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+
+def start_memory():
+    import db
+
+    dynamodb = MemoryDynamoDB()
+    dynamodb.create_table(db.MOVIES_TABLE_NAME, "movie_id")
+    dynamodb.create_table(db.RATINGS_TABLE_NAME, "user_id", "movie_id")
+    db._dynamodb = dynamodb
+
+    def stop():
+        db._dynamodb = None
+    return stop
+
+
+def start_moto():
+    from moto import mock_aws
+    mock = mock_aws()
+    mock.start()
+    from scripts.create_tables import create_movies_table, create_ratings_table
+    create_movies_table()
+    create_ratings_table()
+    return mock.stop
+
+
+BACKENDS = {"memory": start_memory, "moto": start_moto}
+
+
+def load_tables(users, movies, ratings, movie_items, table_users):
+    from db import get_movies_table, get_ratings_table
+
+    with get_movies_table().batch_writer() as batch:
+        for item in movie_items:
+            batch.put_item(Item=item)
+    stored = np.nonzero(users < table_users)[0]
+    with get_ratings_table().batch_writer() as batch:
+        for i in stored.tolist():
+            batch.put_item(Item={
+                "user_id": f"u{users[i]}", "movie_id": f"m{movies[i]}",
+                "rating": Decimal(str(float(ratings[i]))), "timestamp": 0,
+            })
+    return len(stored)
+
+
+def build_model(users, movies, ratings, n_users, n_movies):
+    from services.snapshot import RatingsSnapshot
+    from services.recommendation_engine import engine
+
+    snapshot = RatingsSnapshot(
+        [f"u{i}" for i in range(n_users)], [f"m{j}" for j in range(n_movies)],
+        users, movies, ratings.astype(np.float16),
+    )
+    engine._load_snapshot(snapshot)
+    return engine
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def make_requests(name, n, table_users, n_movies, rng):
+    # (method, path, user, params, json body) for one scenario
+    for _ in range(n):
+        user = f"u{rng.randrange(table_users)}"
+        if name == "recommendations":
+            yield "POST", "/recommendations/", user, None, {"user_id": user, "num_recommendations": 10}
+        elif name == "search":
+            word = rng.choice(WORDS).lower()
+            yield "GET", "/movies/", user, {"search": word[:rng.randint(3, len(word))]}, None
+        elif name == "user_ratings":
+            yield "GET", "/ratings/", user, None, None
+        else:
+            body = {"movie_id": f"m{rng.randrange(n_movies)}", "rating": rng.randint(1, 10) / 2}
+            yield "POST", "/ratings/", user, None, body
+
+
+async def run_scenario(client, requests, concurrency, warmup):
+    requests = list(requests)
+    for method, path, user, params, body in requests[:warmup]:
+        await client.request(method, path, params=params, json=body, headers={"X-Bench-User": user})
+    requests = iter(requests[warmup:])
+    samples, errors = [], []
+
+    async def worker():
+        for method, path, user, params, body in requests:
+            start = time.perf_counter()
+            response = await client.request(method, path, params=params, json=body, headers={"X-Bench-User": user})
+            samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(samples),
+        "errors": len(errors),
+        "concurrency": concurrency,
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "mean_ms": sum(samples) / len(samples),
+        "p50_ms": percentile(samples, 50),
+        "p90_ms": percentile(samples, 90),
+        "p99_ms": percentile(samples, 99),
+        "max_ms": max(samples),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def run_all(args, n_movies, table_users):
+    import httpx
+    from fastapi import Header
+    from main import app
+    from auth import get_current_user
+
+    async def bench_user(x_bench_user: str = Header(...)):
+        return {"uid": x_bench_user}
+
+    app.dependency_overrides[get_current_user] = bench_user
+    rng = random.Random(args.seed)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name in args.scenarios.split(","):
+            requests = make_requests(name, args.requests + args.warmup, table_users, n_movies, rng)
+            results[name] = await run_scenario(client, requests, args.concurrency, args.warmup)
+            r = results[name]
+            print(f"{name:<16} {r['throughput_rps']:8.1f} req/s   p50 {r['p50_ms']:7.2f} ms   "
+                  f"p90 {r['p90_ms']:7.2f} ms   p99 {r['p99_ms']:7.2f} ms   errors {r['errors']}   "
+                  f"peak RSS {r['peak_rss_mb']:.0f} MB")
+    return results
+
+
+def compare(results, baseline_path):
+    # Change against an earlier run's JSON, per scenario (positive = slower/less)
+    with open(baseline_path) as f:
+        baseline = json.load(f)["scenarios"]
+    print(f"\nagainst {baseline_path}:")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        change = {
+            key: (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            for key in ("p50_ms", "p99_ms", "throughput_rps", "peak_rss_mb")
+        }
+        print(f"{name:<16} p50 {change['p50_ms']:+6.1f}%   p99 {change['p99_ms']:+6.1f}%   "
+              f"throughput {change['throughput_rps']:+6.1f}%   peak RSS {change['peak_rss_mb']:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API routes on synthetic data")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="memory", help="DynamoDB stand-in")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="1k", help="number of users")
+    parser.add_argument("--users", type=int, help="overrides --scale")
+    parser.add_argument("--movies", type=int, default=10000)
+    parser.add_argument("--per-user", type=int, default=20, help="mean ratings per user")
+    parser.add_argument("--table-users", type=int, default=1000,
+                        help="users whose ratings are loaded into the table (requests are made as them)")
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="an earlier --json output to compare against")
+    args = parser.parse_args()
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    n_users = args.users or SCALES[args.scale]
+    table_users = min(args.table_users, n_users)
+
+    # Local caches in a scratch directory, fake credentials for moto
+    scratch = tempfile.mkdtemp(prefix="benchmark-api-")
+    os.environ["SNAPSHOT_PATH"] = os.path.join(scratch, "ratings.snapshot")
+    os.environ["MOVIE_CATALOG_PATH"] = os.path.join(scratch, "movie_catalog.json")
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        os.environ.setdefault(name, "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    setup = {}
+    start = time.perf_counter()
+    users, movies, ratings, movie_items = generate(n_users, args.movies, args.per_user, args.seed)
+    setup["generate_s"] = time.perf_counter() - start
+    print(f"Generated {len(ratings)} ratings, {n_users} users x {args.movies} movies "
+          f"in {setup['generate_s']:.1f}s")
+
+    stop_backend = BACKENDS[args.backend]()
+    try:
+        start = time.perf_counter()
+        stored = load_tables(users, movies, ratings, movie_items, table_users)
+        setup["load_tables_s"] = time.perf_counter() - start
+        print(f"Loaded {len(movie_items)} movies and {stored} ratings ({args.backend}) in {setup['load_tables_s']:.1f}s")
+
+        start = time.perf_counter()
+        engine = build_model(users, movies, ratings, n_users, args.movies)
+        setup["build_model_s"] = time.perf_counter() - start
+        setup["model"] = engine.memory_usage()
+        setup["peak_rss_mb"] = peak_rss_mb()
+        print(f"Built the model in {setup['build_model_s']:.1f}s, peak RSS {setup['peak_rss_mb']:.0f} MB")
+
+        results = asyncio.run(run_all(args, args.movies, table_users))
+    finally:
+        stop_backend()
+
+    from services.response_cache import get_response_cache
+    report = {
+        "config": {
+            "backend": args.backend, "users": n_users, "movies": args.movies, "ratings": int(len(ratings)),
+            "table_users": table_users, "requests": args.requests, "warmup": args.warmup,
+            "concurrency": args.concurrency, "seed": args.seed,
+        },
+        "setup": setup,
+        "scenarios": results,
+        "response_cache": get_response_cache(connect=False).stats(),
+    }
+    if args.compare:
+        compare(results, args.compare)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# Per-request authentication overhead: verifying every token (what
+# auth.verify_id_token did on each call) against the verified-token cache.
+#
+#   python scripts/benchmark_auth.py --requests 5000 --users 200
+#   python scripts/benchmark_auth.py --firebase-token <real ID token>   # + firebase_admin, needs network
+#
+# Tokens are signed with a locally generated RSA key served as a fake JWKS,
+# so nothing leaves the machine (except with --firebase-token).
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.token_verifier import TokenVerifier, PublicKeyCache
+
+PROJECT = "benchmark-project"
+
+
+def make_tokens(n_users):
+    import jwt
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update(kid="bench", alg="RS256")
+    now = int(time.time())
+    tokens = [
+        jwt.encode({"iss": f"https://securetoken.google.com/{PROJECT}", "aud": PROJECT, "sub": f"user{u}",
+                    "iat": now, "exp": now + 3600}, private_key, algorithm="RS256", headers={"kid": "bench"})
+        for u in range(n_users)
+    ]
+    return tokens, lambda: ({"keys": [jwk]}, 3600)
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def run(label, verify, tokens, n_requests):
+    samples = []
+    for i in range(n_requests):
+        token = tokens[i % len(tokens)]
+        start = time.perf_counter()
+        verify(token)
+        samples.append((time.perf_counter() - start) * 1e6)
+    result = {
+        "mean_us": sum(samples) / len(samples),
+        "p50_us": percentile(samples, 50),
+        "p99_us": percentile(samples, 99),
+    }
+    print(f"{label:<28} mean {result['mean_us']:8.1f} us   p50 {result['p50_us']:8.1f} us   p99 {result['p99_us']:8.1f} us")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-request token verification")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200, help="distinct tokens (requests cycle through them)")
+    parser.add_argument("--firebase-token", help="also time firebase_admin.auth.verify_id_token on this token")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    tokens, jwks = make_tokens(args.users)
+    keys = PublicKeyCache(jwks)
+    results = {}
+
+    uncached = TokenVerifier(PROJECT, keys, cache_size=1)
+    results["verify_every_request"] = run(
+        "verify every request", lambda t: uncached._decode(t), tokens, args.requests,
+    )
+
+    cached = TokenVerifier(PROJECT, keys)
+    results["cached"] = run("verified-token cache", cached.verify, tokens, args.requests)
+    results["cache"] = cached.stats()
+    print(f"cache hit ratio: {results['cache']['hit_ratio']:.3f} ({args.users} distinct tokens)")
+
+    if args.firebase_token:
+        from auth import _verify_with_firebase
+        results["firebase_admin"] = run(
+            "firebase_admin (before)", _verify_with_firebase, [args.firebase_token], min(args.requests, 200),
+        )
+
+    speedup = results["verify_every_request"]["mean_us"] / results["cached"]["mean_us"]
+    print(f"speedup: {speedup:.1f}x")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
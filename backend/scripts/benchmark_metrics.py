@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# Cost of the in-process instrumentation (services/metrics.py): one span,
+# on and off, and one bare histogram observation.
+#
+#   python scripts/benchmark_metrics.py --iterations 200000
+#
+# A span should stay in the low microseconds; it wraps every hot section.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import metrics
+from services.metrics import Registry, span
+
+
+def timed(label, fn, iterations):
+    start = time.perf_counter()
+    fn(iterations)
+    per_call = (time.perf_counter() - start) / iterations * 1e6
+    print(f"{label:<24} {per_call:8.3f} us")
+    return per_call
+
+
+def spans(iterations):
+    for _ in range(iterations):
+        with span("benchmark"):
+            pass
+
+
+def empty(iterations):
+    for _ in range(iterations):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the metrics instrumentation overhead")
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = {"empty_loop_us": timed("empty loop", empty, args.iterations)}
+    results["span_us"] = timed("span", spans, args.iterations)
+
+    registry = Registry()
+    labels = (("span", "benchmark"),)
+    results["observe_us"] = timed(
+        "histogram observe", lambda n: [registry.observe("span_duration_seconds", labels, 0.001) for _ in range(n)],
+        args.iterations,
+    )
+
+    metrics.METRICS_ENABLED = False
+    results["span_disabled_us"] = timed("span (METRICS_ENABLED=0)", spans, args.iterations)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# Title search latency (services/search_index.py) on a synthetic catalog:
+# index build time, then mean/p99 per query against a linear scan of the
+# titles (what a substring filter without the index costs).
+#
+#   python scripts/benchmark_search.py --titles 50000 --repeat 200
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.search_index import TitleSearchIndex, normalize
+
+WORDS = ["star", "love", "night", "dark", "story", "return", "king", "city", "blue", "last"]
+QUERIES = ["sta", "love night", "ing", "9999", "k", "ark 12", "zzz"]
+
+
+def catalog(n):
+    return [f"{WORDS[i % 10]} {WORDS[(i // 10) % 10]} {WORDS[(i // 100) % 10]} {i}" for i in range(n)]
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def run(label, search, repeat):
+    samples = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            start = time.perf_counter()
+            search(query)
+            samples.append((time.perf_counter() - start) * 1e3)
+    result = {"mean_ms": sum(samples) / len(samples), "p99_ms": percentile(samples, 99)}
+    print(f"{label:<12} mean {result['mean_ms']:8.3f} ms   p99 {result['p99_ms']:8.3f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark title search")
+    parser.add_argument("--titles", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    titles = catalog(args.titles)
+    start = time.perf_counter()
+    index = TitleSearchIndex(titles)
+    results = {"build_s": time.perf_counter() - start}
+    print(f"index built in {results['build_s']:.2f}s ({args.titles} titles)")
+
+    results["index"] = run("index", index.search, args.repeat)
+    def scan(query):
+        query = normalize(query)
+        return [d for d, t in enumerate(index.titles) if query in t][:20]
+
+    results["scan"] = run("linear scan", scan, args.repeat)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
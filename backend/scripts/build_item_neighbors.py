@@ -0,0 +1,44 @@
+import argparse
+import os
+import sys
+import time
+
+# Offline job: build the pruned item-item similarity table used by the
+# item-based recommendation mode and save it where the engine loads it.
+#
+#   python scripts/build_item_neighbors.py --k 30 --min-support 3
+#
+# Movies are scored in blocks against the whole catalog with sparse products,
+# so the full movie x movie matrix is never held in memory.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.neighbors import NeighborIndex, ITEM_NEIGHBOR_K, ITEM_MIN_SUPPORT, ITEM_NEIGHBORS_PATH, NEIGHBOR_BLOCK_SIZE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the item neighbor table")
+    parser.add_argument("--k", type=int, default=ITEM_NEIGHBOR_K, help="neighbors kept per movie")
+    parser.add_argument("--min-support", type=int, default=ITEM_MIN_SUPPORT, help="minimum users who rated both movies")
+    parser.add_argument("--block-size", type=int, default=NEIGHBOR_BLOCK_SIZE, help="movies scored per block")
+    parser.add_argument("--output", default=ITEM_NEIGHBORS_PATH)
+    args = parser.parse_args()
+
+    from services.recommendation_engine import RecommendationEngine
+
+    engine = RecommendationEngine()
+    engine._fetch_data()
+    if engine.matrix is None:
+        print("No ratings found.")
+        return
+
+    start = time.time()
+    matrix = engine.matrix
+    table = NeighborIndex.for_items(matrix, k=args.k, block_size=args.block_size, min_support=args.min_support)
+    table.save(args.output, matrix.movie_ids[:table.neighbors.shape[0]])
+    print(f"Built {table.neighbors.shape[0]} x {table.k} item neighbors in {time.time() - start:.2f}s "
+          f"({table.nbytes / 1e6:.1f} MB) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
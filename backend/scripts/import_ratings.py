@@ -0,0 +1,91 @@
+import argparse
+import csv
+import os
+import sys
+import time
+
+# Bulk-load ratings into DynamoDB, streaming the input file (memory is bounded
+# by --chunk-size, not the file size).
+#
+#   python scripts/import_ratings.py ratings.csv                    # user_id,movie_id,rating[,timestamp]
+#   python scripts/import_ratings.py ml-latest/ratings.csv --format movielens
+#   python scripts/import_ratings.py ml-1m/ratings.dat --format movielens --user-prefix ml-
+#   python scripts/import_ratings.py history.csv --user <firebase uid>   # movie_id,rating[,timestamp]
+#
+# MovieLens: ratings.csv (userId,movieId,rating,timestamp with a header) or
+# the older "::"-separated ratings.dat. Aggregates are applied once per movie
+# at the end of the run.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.bulk_ratings import import_ratings, BULK_CHUNK_SIZE
+
+
+def _is_header(fields):
+    # Data rows end in a number (rating or timestamp)
+    try:
+        float(fields[-1])
+        return False
+    except ValueError:
+        return True
+
+
+def read_ratings(lines, fmt="csv", user=None, user_prefix=""):
+    # Yields (user_id, movie_id, rating, timestamp or None), one line at a time
+    if fmt == "movielens":
+        first = next(lines, None)
+        if first is None:
+            return
+        if "::" in first:
+            rows = (line.rstrip("\r\n").split("::") for line in _chain(first, lines))
+        else:
+            rows = csv.reader(_chain(first, lines))
+    else:
+        rows = csv.reader(lines)
+
+    for number, fields in enumerate(rows, 1):
+        if not fields or not "".join(fields).strip():
+            continue
+        if number == 1 and _is_header(fields):
+            continue
+        if user is not None:
+            # movie_id,rating[,timestamp] for a single user
+            fields = [user] + fields
+        else:
+            fields = [user_prefix + fields[0]] + fields[1:]
+        try:
+            timestamp = int(float(fields[3])) if len(fields) > 3 and fields[3] else None
+            yield fields[0], fields[1], float(fields[2]), timestamp
+        except (IndexError, ValueError):
+            print(f"Skipping malformed line {number}: {fields}")
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load ratings from a CSV or MovieLens file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "movielens"], default="csv")
+    parser.add_argument("--user", help="attribute every rating to this user (file has no user column)")
+    parser.add_argument("--user-prefix", default="", help="prepended to user ids from the file")
+    parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    start = time.time()
+
+    def progress(written):
+        print(f"  {written} ratings written ({written / max(time.time() - start, 1e-9):.0f}/s)")
+
+    with open(args.path, newline="", encoding="utf-8") as f:
+        rows = read_ratings(iter(f), args.format, args.user, args.user_prefix)
+        result = import_ratings(rows, chunk_size=args.chunk_size, on_chunk=progress)
+
+    print(f"Imported {result['ratings_written']} ratings, updated {result['movies_updated']} movies "
+          f"in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
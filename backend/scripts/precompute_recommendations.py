@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+# Offline job: compute recommendations for many users and write them to the
+# precomputed-results store that POST /recommendations/ checks first.
+#
+#   python scripts/precompute_recommendations.py --k 20 --workers 4
+#   python scripts/precompute_recommendations.py --users-file users.txt --output recs.json
+#
+# Scores with the deployment's RECOMMENDATION_MODE (or --mode), which is stored
+# with the results: the API only serves them for that mode.
+#
+# For "user" and "item", the rating matrix and the user/movie neighbor table
+# are placed in shared memory once; each worker process attaches to them and
+# scores its chunk of users as one sparse matrix product. "als" scores in this
+# process (one dense product per chunk).
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.sparse import CSRMatrix
+from services.neighbors import NeighborIndex
+from services.scoring import score_users, score_users_by_items
+
+
+def share_array(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+_attached = []
+_csr = None
+_neighbors = None
+_scorer = None
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    # The parent owns (and unlinks) the segment, not this worker
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    _attached.append(shm)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+def _init_worker(specs, shape, mode="user"):
+    # neighbors/scores: the user neighbor index, or the movie table for "item"
+    global _csr, _neighbors, _scorer
+    indptr, indices, data, neighbors, scores = (_attach(spec) for spec in specs)
+    _csr = CSRMatrix(indptr, indices, data, shape)
+    _neighbors = NeighborIndex(neighbors, scores)
+    _scorer = score_users_by_items if mode == "item" else score_users
+
+
+def _score_chunk(user_indices, k):
+    return _scorer(_csr, _neighbors, user_indices, k)
+
+
+def main():
+    from services.recommendation_engine import RecommendationEngine, MODES, RECOMMENDATION_MODE
+    from services.results_store import get_results_store
+
+    parser = argparse.ArgumentParser(description="Precompute recommendations for many users")
+    parser.add_argument("--k", type=int, default=20, help="recommendations per user")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=512, help="users per worker task")
+    parser.add_argument("--users-file", help="one user id per line (default: every known user)")
+    parser.add_argument("--output", help="write JSON here instead of the results store")
+    parser.add_argument("--mode", choices=MODES, default=RECOMMENDATION_MODE,
+                        help="recommendation mode to score with (default: RECOMMENDATION_MODE)")
+    args = parser.parse_args()
+
+    start = time.time()
+    engine = RecommendationEngine()
+    engine._fetch_data()
+    if engine.matrix is None:
+        print("No ratings found.")
+        return
+    matrix, neighbors = engine.matrix, engine.neighbors
+    print(f"Model ready in {time.time() - start:.2f}s: {engine.memory_usage()}")
+
+    if args.users_file:
+        with open(args.users_file) as f:
+            user_ids = [line.strip() for line in f if line.strip()]
+    else:
+        user_ids = matrix.user_ids[:matrix.n_users]
+
+    results = {}
+    known = []
+    for user_id in user_ids:
+        idx = matrix.find_user(user_id)
+        if idx is None:
+            results[user_id] = engine._popular_scores(args.k)
+        else:
+            known.append(idx)
+
+    def store(chunk, top, top_scores, movie_ids):
+        for row, idx in enumerate(chunk):
+            found = top[row] >= 0
+            results[matrix.user_ids[idx]] = [
+                (movie_ids[j], float(s))
+                for j, s in zip(top[row][found].tolist(), top_scores[row][found].tolist())
+            ]
+
+    chunks = [known[i:i + args.chunk_size] for i in range(0, len(known), args.chunk_size)]
+    scoring = args.mode
+    if scoring == "als":
+        model, movie_map = engine._get_factor_model(matrix)
+        if model is None:
+            # As the API does for this mode
+            print("No factor model, falling back to user-based CF.")
+            scoring = "user"
+        else:
+            for chunk in chunks:
+                known_users = [(matrix.user_ids[idx], idx) for idx in chunk]
+                store(chunk, *engine._score_by_factors(model, movie_map, matrix, known_users, args.k), model.movie_ids)
+
+    if scoring != "als":
+        table = engine._get_item_neighbors(matrix) if scoring == "item" else neighbors
+        csr = matrix.by_user
+        shared = [share_array(a) for a in (csr.indptr, csr.indices, csr.data, table.neighbors, table.scores)]
+        try:
+            with ProcessPoolExecutor(
+                max_workers=args.workers,
+                initializer=_init_worker,
+                initargs=([spec for _, spec in shared], csr.shape, scoring),
+            ) as pool:
+                futures = [pool.submit(_score_chunk, chunk, args.k) for chunk in chunks]
+                for chunk, future in zip(chunks, futures):
+                    store(chunk, *future.result(), matrix.movie_ids)
+        finally:
+            for shm, _ in shared:
+                shm.close()
+                shm.unlink()
+
+    print(f"Scored {len(results)} users ({args.mode} mode) in {time.time() - start:.2f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"mode": args.mode, "results": results}, f)
+        print(f"Wrote {args.output}")
+    else:
+        get_results_store().put_many(results, mode=args.mode)
+        print(f"Saved to the results store for {args.mode} mode.")
+
+
+if __name__ == "__main__":
+    main()
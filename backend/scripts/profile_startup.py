@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Startup profiling: what a Lambda cold start pays for before the first request.
+#
+#   python scripts/profile_startup.py              # import main, per-module times
+#   python scripts/profile_startup.py --init       # + lazily initialized clients
+#   python scripts/profile_startup.py --budget-ms 800
+#
+# Every measurement runs in a fresh interpreter (python -X importtime), so
+# nothing is already imported.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must stay out of `import main`, / and /movies (loaded by the routes that need them)
+HEAVY_MODULES = [
+    "pandas", "numpy", "firebase_admin", "google.auth", "redis",
+    "boto3", "botocore", "services.recommendation_engine",
+]
+
+_PROBE = """
+import json, sys, time
+began = time.perf_counter()
+import main
+result = {"import_ms": (time.perf_counter() - began) * 1000}
+result["loaded"] = [m for m in %(heavy)r if m in sys.modules]
+init = {}
+if %(init)r:
+    for name, step in [
+        ("dynamodb", lambda: __import__("db").get_dynamodb()),
+        ("firebase", lambda: __import__("auth")._init_firebase()),
+        ("recommendation_engine", lambda: __import__("services.recommendation_engine")),
+    ]:
+        began = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"{name} init failed: {e}")
+        init[name] = (time.perf_counter() - began) * 1000
+result["init_ms"] = init
+print("PROFILE " + json.dumps(result))
+"""
+
+
+def parse_importtime(stderr):
+    # "import time: self [us] | cumulative | imported package" lines
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def profile_startup(init=False, env=None):
+    code = _PROBE % {"init": init, "heavy": HEAVY_MODULES}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+        env={**os.environ, "AWS_DEFAULT_REGION": os.environ.get("AWS_DEFAULT_REGION", "us-east-1"), **(env or {})},
+    )
+    result = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("PROFILE "):
+            result = json.loads(line[len("PROFILE "):])
+    if result is None:
+        raise RuntimeError(f"Startup probe failed:\n{proc.stdout}\n{proc.stderr}")
+    result["modules"] = parse_importtime(proc.stderr)
+    return result
+
+
+def package_totals(modules):
+    # Self time summed per top-level package
+    totals = {}
+    for name, self_us, _, _ in modules:
+        top = name.split(".")[0]
+        totals[top] = totals.get(top, 0) + self_us
+    return sorted(totals.items(), key=lambda kv: -kv[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile cold start import and initialization time")
+    parser.add_argument("--init", action="store_true", help="also time the lazily created clients")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, help="exit 1 when importing main takes longer")
+    args = parser.parse_args()
+
+    result = profile_startup(init=args.init)
+    print(f"import main: {result['import_ms']:.1f} ms")
+    print(f"heavy modules loaded by the import: {', '.join(result['loaded']) or 'none'}")
+
+    print("\nTop packages by import time (self, summed):")
+    for package, us in package_totals(result["modules"])[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {package}")
+
+    print("\nApp modules (cumulative):")
+    for name, _, cumulative, _ in result["modules"]:
+        if name.split(".")[0] in ("main", "db", "auth", "models", "routers", "services"):
+            print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    if result["init_ms"]:
+        print("\nLazy initialization (first use):")
+        for name, ms in result["init_ms"].items():
+            print(f"  {ms:8.1f} ms  {name}")
+
+    if args.budget_ms is not None and result["import_ms"] > args.budget_ms:
+        print(f"\nOver budget: {result['import_ms']:.1f} ms > {args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+import time
+
+# Offline job: train the latent factor model served by the "als"
+# recommendation mode and save its float32 factors where the engine loads them.
+#
+#   python scripts/train_als.py --factors 32 --iterations 10
+#   python scripts/train_als.py --implicit --alpha 10
+#
+# Trains on the ratings snapshot (local file, else Redis/DynamoDB through the
+# engine's usual loading path).
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.factorization import FactorModel, ALS_FACTORS, ALS_REG, ALS_ITERATIONS, ALS_ALPHA, ALS_FACTORS_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the ALS factor model")
+    parser.add_argument("--factors", type=int, default=ALS_FACTORS, help="latent dimensions")
+    parser.add_argument("--reg", type=float, default=ALS_REG, help="regularization")
+    parser.add_argument("--iterations", type=int, default=ALS_ITERATIONS)
+    parser.add_argument("--implicit", action="store_true", help="treat ratings as confidence weights")
+    parser.add_argument("--alpha", type=float, default=ALS_ALPHA, help="implicit confidence scale")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=ALS_FACTORS_PATH)
+    args = parser.parse_args()
+
+    from services.recommendation_engine import RecommendationEngine
+
+    engine = RecommendationEngine()
+    engine._fetch_data()
+    if engine.matrix is None:
+        print("No ratings found.")
+        return
+
+    start = time.time()
+    model = FactorModel.train(
+        engine.matrix, factors=args.factors, reg=args.reg, iterations=args.iterations,
+        implicit=args.implicit, alpha=args.alpha, seed=args.seed, verbose=True,
+    )
+    model.save(args.output)
+    print(f"Trained {len(model.user_ids)} users x {len(model.movie_ids)} movies x {args.factors} factors "
+          f"in {time.time() - start:.2f}s ({model.nbytes / 1e6:.1f} MB) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
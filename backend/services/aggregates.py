@@ -0,0 +1,35 @@
+from decimal import Decimal
+
+# Per-movie vote aggregates (vote_count, vote_total) live on the movie item and
+# are only ever changed with atomic in-place arithmetic, so concurrent writers
+# never overwrite each other's deltas. Missing attributes (or items: ratings may
+# arrive for movies not in the catalog, e.g. a MovieLens import) start at zero.
+
+
+def vote_delta(old_rating, new_rating):
+    # (count delta, total delta) for one rating change; None = no rating
+    count = (new_rating is not None) - (old_rating is not None)
+    total = (new_rating or 0.0) - (old_rating or 0.0)
+    return count, total
+
+
+def apply_vote_delta(movies_table, movie_id: str, count_delta: int, total_delta: float):
+    # One UpdateItem per movie, skipped when nothing changes
+    if count_delta == 0 and total_delta == 0:
+        return False
+    if count_delta == 0:
+        movies_table.update_item(
+            Key={'movie_id': movie_id},
+            UpdateExpression="SET vote_total = if_not_exists(vote_total, :zero) + :val",
+            ExpressionAttributeValues={':val': Decimal(str(total_delta)), ':zero': 0}
+        )
+    else:
+        movies_table.update_item(
+            Key={'movie_id': movie_id},
+            UpdateExpression=(
+                "SET vote_count = if_not_exists(vote_count, :zero) + :inc, "
+                "vote_total = if_not_exists(vote_total, :zero) + :val"
+            ),
+            ExpressionAttributeValues={':inc': int(count_delta), ':val': Decimal(str(total_delta)), ':zero': 0}
+        )
+    return True
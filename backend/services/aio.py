@@ -0,0 +1,37 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Async data access for the routers.
+# boto3 has no asyncio API and aioboto3 is too heavy for the Lambda package,
+# so blocking DynamoDB calls run on a dedicated I/O pool (the boto3 client is
+# thread-safe and shared) and independent calls are fanned out with
+# asyncio.gather. The pool is sized for I/O, not CPU, and is separate from
+# the framework's threadpool, so requests don't queue behind each other.
+# Redis uses redis.asyncio natively (db.get_async_redis).
+IO_THREADS = int(os.environ.get("IO_THREADS", 64))
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="io")
+    return _executor
+
+
+async def run_io(fn, *args, **kwargs):
+    # Await a blocking call without holding up the event loop. Runs in a copy
+    # of the caller's context, so its spans/DynamoDB calls count towards the
+    # request (services/metrics.py)
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await loop.run_in_executor(_get_executor(), call)
+
+
+async def gather_io(calls):
+    # calls: [(fn, args...), ...] run concurrently, results in order
+    return await asyncio.gather(*(run_io(fn, *args) for fn, *args in calls))
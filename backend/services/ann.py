@@ -0,0 +1,258 @@
+import numpy as np
+import os
+from services.sparse import expand_ranges
+from services.neighbors import top_k_rows
+
+# Approximate nearest neighbors (cosine) for rows of a sparse matrix, pure NumPy.
+#   1. every row is sketched to ANN_DIMS dense dimensions with a Gaussian
+#      random projection (cosine is roughly preserved)
+#   2. the sketches are clustered (spherical k-means) into an inverted file
+#   3. a query probes its `nprobe` closest lists, keeps the best candidates by
+#      sketch similarity and re-ranks them with the exact sparse cosine
+# More lists probed / more candidates kept = better recall, slower queries.
+ANN_DIMS = int(os.environ.get("ANN_DIMS", 128))
+ANN_LISTS = int(os.environ.get("ANN_LISTS", 0))  # 0 = sqrt(rows)
+ANN_NPROBE = int(os.environ.get("ANN_NPROBE", 8))
+# Candidates re-ranked exactly, as a multiple of k
+ANN_CANDIDATES = int(os.environ.get("ANN_CANDIDATES", 4))
+ANN_KMEANS_ITERATIONS = int(os.environ.get("ANN_KMEANS_ITERATIONS", 10))
+
+# Dense temporaries per block stay around this size
+_BLOCK_BYTES = 32 * 1024 * 1024
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def sketch_rows(csr, dims=ANN_DIMS, seed=0):
+    # Unit-length random projections of the CSR rows, shape (rows, dims)
+    projection = np.random.default_rng(seed).standard_normal((csr.shape[1], dims)).astype(np.float32)
+    n = csr.shape[0]
+    out = np.zeros((n, dims), dtype=np.float32)
+    counts = np.diff(csr.indptr)
+    block_nnz = max(1, _BLOCK_BYTES // (dims * 4))
+
+    start = 0
+    while start < n:
+        end = int(np.searchsorted(csr.indptr, csr.indptr[start] + block_nnz, side='right')) - 1
+        end = min(max(end, start + 1), n)
+        lo, hi = csr.indptr[start], csr.indptr[end]
+        nonempty = counts[start:end] > 0
+        if hi > lo:
+            contributions = csr.data[lo:hi, None] * projection[csr.indices[lo:hi]]
+            block = out[start:end]
+            block[nonempty] = np.add.reduceat(contributions, (csr.indptr[start:end] - lo)[nonempty], axis=0)
+        start = end
+
+    return normalize_rows(out)
+
+
+class IVFIndex:
+    # Inverted file over unit vectors: rows grouped by their closest centroid.
+    # lists[c] = order[offsets[c]:offsets[c + 1]]
+
+    def __init__(self, vectors, centroids, order, offsets):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, vectors, n_lists=ANN_LISTS, iterations=ANN_KMEANS_ITERATIONS, seed=0):
+        vectors = normalize_rows(vectors)
+        n = len(vectors)
+        if n == 0:
+            return cls(vectors, np.zeros((1, vectors.shape[1]), np.float32), np.zeros(0, np.int32), np.zeros(2, np.int64))
+        if n_lists <= 0:
+            n_lists = int(np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+
+        # Spherical k-means, centroids seeded from random rows
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(n, n_lists, replace=False)]
+        for _ in range(iterations):
+            assign = cls._nearest(vectors, centroids)
+            order = np.argsort(assign, kind='stable')
+            sizes = np.bincount(assign, minlength=n_lists)
+            empty = sizes == 0
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(vectors[order], (np.cumsum(sizes) - sizes)[~empty], axis=0)
+            # Empty lists are re-seeded rather than left dead
+            sums[empty] = vectors[rng.choice(n, int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        assign = cls._nearest(vectors, centroids)
+        order = np.argsort(assign, kind='stable').astype(np.int32)
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=len(centroids)), out=offsets[1:])
+        return cls(vectors, centroids, order, offsets)
+
+    @staticmethod
+    def _nearest(vectors, centroids):
+        block = max(1, _BLOCK_BYTES // (len(centroids) * 4))
+        return np.concatenate([
+            np.argmax(vectors[i:i + block] @ centroids.T, axis=1) for i in range(0, len(vectors), block)
+        ])
+
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes + self.centroids.nbytes + self.order.nbytes + self.offsets.nbytes
+
+    def search(self, queries, k, nprobe=ANN_NPROBE, exclude=None):
+        # Approximate top-k rows by sketch cosine, same layout as top_k_rows.
+        # exclude: one row per query to skip (e.g. the query itself).
+        # Each probed list is scored with one matrix product for all the
+        # queries probing it, and only its best k per query are kept.
+        queries = normalize_rows(queries)
+        n_queries = len(queries)
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        width = max(1, min(k, int(np.diff(self.offsets).max())))
+
+        ids = np.full((n_queries, nprobe, width), -1, dtype=np.int64)
+        # Shifted to (1, 3] so negative cosines still rank (top_k_rows drops <= 0)
+        scores = np.full((n_queries, nprobe, width), -np.inf)
+        flat = probes.ravel()
+        by_list = np.argsort(flat, kind='stable')
+        lists, first = np.unique(flat[by_list], return_index=True)
+        for c, group in zip(lists.tolist(), np.split(by_list, first[1:])):
+            members = self.order[self.offsets[c]:self.offsets[c + 1]]
+            if len(members) == 0:
+                continue
+            q, p = np.divmod(group, nprobe)
+            list_scores = (queries[q] @ self.vectors[members].T).astype(np.float64) + 2
+            if exclude is not None:
+                list_scores[np.asarray(exclude)[q][:, None] == members[None, :]] = -np.inf
+            w = min(width, len(members))
+            if w < len(members):
+                part = np.argpartition(-list_scores, w - 1, axis=1)[:, :w]
+            else:
+                part = np.broadcast_to(np.arange(w), list_scores.shape)
+            ids[q, p, :w] = members[part]
+            scores[q, p, :w] = np.take_along_axis(list_scores, part, axis=1)
+
+        ids, scores = ids.reshape(n_queries, -1), scores.reshape(n_queries, -1)
+        top, top_scores = top_k_rows(scores, k)
+        found = top >= 0
+        out = np.full(top.shape, -1, dtype=np.int32)
+        out[found] = np.take_along_axis(ids, np.maximum(top, 0), axis=1)[found]
+        top_scores[found] -= 2
+        return pad_columns(out, top_scores, k)
+
+
+def top_k_ragged(owner, rows, scores, n_queries, k):
+    # top_k_rows over per-query candidate lists of different lengths,
+    # ties broken by lower row.
+    order = np.lexsort((rows, owner))
+    owner, rows, scores = owner[order], rows[order], scores[order]
+    counts = np.bincount(owner, minlength=n_queries)
+    width = max(int(counts.max()) if len(counts) else 0, 1)
+    slot = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    padded = np.full((n_queries, width), -np.inf)
+    padded[owner, slot] = scores
+    labels = np.full((n_queries, width), -1, dtype=np.int64)
+    labels[owner, slot] = rows
+
+    top, top_scores = top_k_rows(padded, k)
+    found = top >= 0
+    out = np.full(top.shape, -1, dtype=np.int32)
+    out[found] = np.take_along_axis(labels, np.maximum(top, 0), axis=1)[found]
+    return pad_columns(out, top_scores, k)
+
+
+def pad_columns(top, top_scores, k):
+    # top_k_rows returns fewer than k columns when there are fewer candidates
+    if top.shape[1] < k:
+        pad = k - top.shape[1]
+        top = np.hstack([top, np.full((len(top), pad), -1, dtype=np.int32)])
+        top_scores = np.hstack([top_scores, np.zeros((len(top_scores), pad), dtype=np.float32)])
+    return top, top_scores
+
+
+def pair_dots(csr, rows, owner, others, return_counts=False):
+    # Exact csr[rows[owner[p]]] . csr[others[p]] for every pair p.
+    # Matching columns are found by binary search in the (sorted) entries of
+    # the query rows, so memory is O(pairs x row length), never rows x columns.
+    rows = np.asarray(rows, dtype=np.int64)
+    n_cols = max(csr.shape[1], 1)
+    starts = csr.indptr[rows]
+    counts = csr.indptr[rows + 1] - starts
+    pos = expand_ranges(starts, counts)
+    query_keys = np.repeat(np.arange(len(rows), dtype=np.int64), counts) * n_cols + csr.indices[pos]
+    query_values = csr.data[pos]
+
+    other_starts = csr.indptr[others]
+    other_counts = csr.indptr[others + 1] - other_starts
+    other_pos = expand_ranges(other_starts, other_counts)
+    pair = np.repeat(np.arange(len(others)), other_counts)
+    keys = np.repeat(owner, other_counts) * n_cols + csr.indices[other_pos]
+
+    if len(query_keys) == 0:
+        match = np.zeros(len(keys), dtype=bool)
+        products = np.zeros(len(keys))
+    else:
+        hit = np.minimum(np.searchsorted(query_keys, keys), len(query_keys) - 1)
+        match = query_keys[hit] == keys
+        products = np.where(match, query_values[hit] * csr.data[other_pos], 0)
+
+    dots = np.bincount(pair, weights=products, minlength=len(others))
+    if return_counts:
+        return dots, np.bincount(pair, weights=match, minlength=len(others))
+    return dots
+
+
+class CosineANN:
+    # Queryable ANN over the rows of a sparse matrix (users: by_user,
+    # movies: by_movie), candidates from the IVF, exact re-rank.
+
+    def __init__(self, matrix, norms=None, dims=ANN_DIMS, n_lists=ANN_LISTS, seed=0):
+        self.matrix = matrix
+        self.norms = matrix.row_norms() if norms is None else norms
+        self.ivf = IVFIndex.build(sketch_rows(matrix, dims, seed), n_lists=n_lists, seed=seed)
+
+    @classmethod
+    def for_users(cls, rating_matrix, **kwargs):
+        return cls(rating_matrix.by_user, rating_matrix.norms, **kwargs)
+
+    @classmethod
+    def for_items(cls, rating_matrix, **kwargs):
+        return cls(rating_matrix.by_movie, **kwargs)
+
+    @property
+    def nbytes(self):
+        return self.ivf.nbytes
+
+    def query(self, rows, k, nprobe=ANN_NPROBE, candidates=ANN_CANDIDATES, min_support=1):
+        # Top-k similar rows for each of `rows` (itself excluded), exact cosine
+        # scores, same layout as top_k_rows.
+        rows = np.asarray(rows, dtype=np.int64)
+        candidate_rows, _ = self.ivf.search(
+            self.ivf.vectors[rows], max(k * candidates, k), nprobe=nprobe, exclude=rows,
+        )
+        owner, slot = np.nonzero(candidate_rows >= 0)
+        others = candidate_rows[owner, slot].astype(np.int64)
+
+        if min_support > 1:
+            dots, support = pair_dots(self.matrix, rows, owner, others, return_counts=True)
+            dots[support < min_support] = 0
+        else:
+            dots = pair_dots(self.matrix, rows, owner, others)
+        norms = self.norms.astype(np.float64)
+        denom = norms[rows][owner] * norms[others]
+        sims = np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+        return top_k_ragged(owner, others, sims, len(rows), k)
+
+
+def recall_at_k(exact, approx):
+    # Fraction of the exact neighbor lists (-1 padded) recovered by approx
+    hits = total = 0
+    for want, got in zip(exact, approx):
+        want = want[want >= 0]
+        total += len(want)
+        hits += len(np.intersect1d(want, got[got >= 0]))
+    return hits / total if total else 1.0
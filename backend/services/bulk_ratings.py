@@ -0,0 +1,110 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db import get_ratings_table, get_movies_table
+from services.aggregates import vote_delta, apply_vote_delta
+from services.movie_store import batch_get_keys, BATCH_GET_LIMIT
+
+# Bulk rating import, shared by POST /ratings/bulk and scripts/import_ratings.py.
+# Ratings are written with batch_writer (BatchWriteItem, 25 items per call)
+# and the vote aggregates are summed per movie, then applied with a single
+# UpdateItem per movie at the end, instead of get/put/update per rating.
+#
+# batch_writer can't return the items it replaced, so each chunk first reads
+# the existing ratings with BatchGetItem (100 keys per call) to tell new
+# ratings from re-rates. Unlike POST /ratings/ this is not atomic against a
+# concurrent write of the same (user, movie) pair.
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", 1000))
+BULK_MAX_RATINGS = int(os.environ.get("BULK_MAX_RATINGS", 5000))
+BULK_UPDATE_THREADS = int(os.environ.get("BULK_UPDATE_THREADS", 8))
+
+# (user_id, movie_id, rating, timestamp or None)
+RatingRow = Tuple[str, str, float, Optional[int]]
+
+
+def _chunks(rows: Iterable[RatingRow], size: int):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _existing_ratings(table_name: str, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], float]:
+    existing = {}
+    for i in range(0, len(pairs), BATCH_GET_LIMIT):
+        keys = [{'user_id': u, 'movie_id': m} for u, m in pairs[i:i + BATCH_GET_LIMIT]]
+        for item in batch_get_keys(table_name, keys):
+            existing[(item['user_id'], item['movie_id'])] = float(item['rating'])
+    return existing
+
+
+def apply_deltas(movies_table, deltas: Dict[str, List[float]]) -> int:
+    # One UpdateItem per movie with a non-zero delta, a few in flight at once
+    if not deltas:
+        return 0
+    with ThreadPoolExecutor(max_workers=BULK_UPDATE_THREADS) as pool:
+        applied = pool.map(
+            lambda kv: apply_vote_delta(movies_table, kv[0], kv[1][0], kv[1][1]),
+            deltas.items(),
+        )
+        return sum(applied)
+
+
+def import_ratings(rows: Iterable[RatingRow], chunk_size: int = BULK_CHUNK_SIZE, on_chunk=None) -> dict:
+    # rows is consumed lazily, chunk_size at a time, so memory stays bounded
+    # by the chunk plus one running delta per movie
+    ratings_table = get_ratings_table()
+    movies_table = get_movies_table()
+    now = int(time.time())
+
+    deltas: Dict[str, List[float]] = {}
+    written = 0
+    try:
+        for chunk in _chunks(rows, chunk_size):
+            # Last one wins for a pair repeated within the chunk (BatchWriteItem
+            # rejects duplicate keys in one request)
+            latest = {}
+            for user_id, movie_id, rating, timestamp in chunk:
+                latest[(str(user_id), str(movie_id))] = (float(rating), timestamp)
+
+            existing = _existing_ratings(ratings_table.name, list(latest))
+            chunk_deltas = {}
+            with ratings_table.batch_writer() as batch:
+                for (user_id, movie_id), (rating, timestamp) in latest.items():
+                    batch.put_item(Item={
+                        'user_id': user_id,
+                        'movie_id': movie_id,
+                        'rating': Decimal(str(rating)),
+                        'timestamp': int(timestamp) if timestamp is not None else now,
+                    })
+                    count, total = vote_delta(existing.get((user_id, movie_id)), rating)
+                    delta = chunk_deltas.setdefault(movie_id, [0, 0.0])
+                    delta[0] += count
+                    delta[1] += total
+
+            # Merged only once the chunk's writes are flushed
+            for movie_id, (count, total) in chunk_deltas.items():
+                delta = deltas.setdefault(movie_id, [0, 0.0])
+                delta[0] += count
+                delta[1] += total
+            written += len(latest)
+            if on_chunk:
+                on_chunk(written)
+    except BaseException:
+        # Also after a failed chunk, so the ratings already written are
+        # counted; the import's own error is the one raised
+        try:
+            apply_deltas(movies_table, deltas)
+        except Exception as e:
+            print(f"Vote aggregates not updated after a failed import: {e}")
+        raise
+
+    movies_updated = apply_deltas(movies_table, deltas)
+    return {"ratings_written": written, "movies_updated": movies_updated}
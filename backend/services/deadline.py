@@ -0,0 +1,31 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Time left in the current Lambda invocation, for code that waits on other
+# containers (e.g. for the model snapshot another one is scanning) and must
+# give up before the function timeout kills it. main.handler sets it from
+# the Lambda context; worker threads inherit it (services/aio.run_io copies
+# the context). Outside Lambda there is no deadline.
+#
+# Standard library only: main imports this on every cold start.
+_deadline: ContextVar[Optional[float]] = ContextVar("invocation_deadline", default=None)
+
+
+@contextmanager
+def invocation_deadline(context):
+    remaining = getattr(context, "get_remaining_time_in_millis", None)
+    token = _deadline.set(time.time() + remaining() / 1000 if remaining else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left() -> Optional[float]:
+    # Seconds until the invocation times out, None outside one
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.time())
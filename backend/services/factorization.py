@@ -0,0 +1,178 @@
+import numpy as np
+import os
+from typing import List
+from services.neighbors import top_k_rows
+from services.scoring import SCORE_BATCH_SIZE
+
+# Latent factor model (alternating least squares), pure NumPy.
+#   explicit: minimize sum (r_ui - x_u . y_i)^2 + reg * (n_u |x_u|^2 + n_i |y_i|^2)
+#   implicit: Hu/Koren/Volinsky, preference 1 for rated movies with
+#             confidence 1 + alpha * rating, 0 elsewhere
+# Trained offline (scripts/train_als.py) and served with one matrix-vector
+# product per user. Users unknown to the model (or whose ratings changed
+# since training) are folded in from their current ratings.
+ALS_FACTORS = int(os.environ.get("ALS_FACTORS", 32))
+ALS_REG = float(os.environ.get("ALS_REG", 0.1))
+ALS_ITERATIONS = int(os.environ.get("ALS_ITERATIONS", 10))
+ALS_ALPHA = float(os.environ.get("ALS_ALPHA", 10.0))
+ALS_FACTORS_PATH = os.environ.get("ALS_FACTORS_PATH", "/tmp/als_factors.npz")
+
+# Rows solved per block are capped so the (nnz, f, f) outer products stay ~64 MB
+_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def rows_to_csr(owner, cols, values, n_rows):
+    # COO (row, column, value) -> CSR arrays, rows in order
+    order = np.lexsort((cols, owner))
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(owner, minlength=n_rows), out=indptr[1:])
+    return indptr, np.asarray(cols)[order], np.asarray(values)[order]
+
+
+def solve_rows(indptr, indices, data, fixed, reg, implicit=False, alpha=ALS_ALPHA):
+    # One ALS half-step: the least squares factors of every row of a CSR
+    # (indptr, indices, data) given the factors of the other side (`fixed`).
+    n_rows = len(indptr) - 1
+    f = fixed.shape[1]
+    fixed = fixed.astype(np.float64)
+    out = np.zeros((n_rows, f), dtype=np.float32)
+    counts = np.diff(indptr)
+    gram = fixed.T @ fixed if implicit else None
+    eye = np.eye(f)
+    block_nnz = max(1, _BLOCK_BYTES // (f * f * 8))
+
+    start = 0
+    while start < n_rows:
+        end = int(np.searchsorted(indptr, indptr[start] + block_nnz, side='right')) - 1
+        end = min(max(end, start + 1), n_rows)
+        lo, hi = indptr[start], indptr[end]
+
+        Y = fixed[indices[lo:hi]]
+        values = data[lo:hi].astype(np.float64)
+        if implicit:
+            confidence = alpha * values         # c - 1
+            rhs_weights = 1.0 + confidence      # c * p, p = 1
+        else:
+            confidence = np.ones_like(values)
+            rhs_weights = values
+
+        b = end - start
+        A = np.zeros((b, f, f))
+        rhs = np.zeros((b, f))
+        nonempty = counts[start:end] > 0
+        if hi > lo:
+            offsets = (indptr[start:end] - lo)[nonempty]
+            A[nonempty] = np.add.reduceat(Y[:, :, None] * (confidence[:, None] * Y)[:, None, :], offsets, axis=0)
+            rhs[nonempty] = np.add.reduceat(Y * rhs_weights[:, None], offsets, axis=0)
+
+        if implicit:
+            A += gram + reg * eye
+        else:
+            # Weighted-lambda regularization, scaled by the row's rating count
+            A += (reg * np.maximum(counts[start:end], 1))[:, None, None] * eye
+        out[start:end] = np.linalg.solve(A, rhs[:, :, None])[:, :, 0]
+        start = end
+
+    return out
+
+
+class FactorModel:
+    def __init__(self, user_ids: List[str], movie_ids: List[str], user_factors, item_factors,
+                 reg: float = ALS_REG, implicit: bool = False, alpha: float = ALS_ALPHA):
+        self.user_ids = list(user_ids)
+        self.movie_ids = list(movie_ids)
+        self.user_index = {uid: i for i, uid in enumerate(self.user_ids)}
+        self.movie_index = {mid: j for j, mid in enumerate(self.movie_ids)}
+        self.user_factors = np.asarray(user_factors, dtype=np.float32)
+        self.item_factors = np.asarray(item_factors, dtype=np.float32)
+        self.reg = reg
+        self.implicit = implicit
+        self.alpha = alpha
+
+    @classmethod
+    def train(cls, rating_matrix, factors=ALS_FACTORS, reg=ALS_REG, iterations=ALS_ITERATIONS,
+              implicit=False, alpha=ALS_ALPHA, seed=0, verbose=False):
+        by_user, by_movie = rating_matrix.by_user, rating_matrix.by_movie
+        rng = np.random.default_rng(seed)
+        items = (rng.standard_normal((by_movie.shape[0], factors)) * 0.01).astype(np.float32)
+        users = np.zeros((by_user.shape[0], factors), dtype=np.float32)
+
+        for iteration in range(iterations):
+            users = solve_rows(by_user.indptr, by_user.indices, by_user.data, items, reg, implicit, alpha)
+            items = solve_rows(by_movie.indptr, by_movie.indices, by_movie.data, users, reg, implicit, alpha)
+            if verbose and implicit:
+                print(f"ALS iteration {iteration + 1}/{iterations}")
+            elif verbose:
+                predicted = np.einsum('ij,ij->i', users[by_user.row_ids()], items[by_user.indices])
+                rmse = np.sqrt(np.mean((predicted - by_user.data) ** 2))
+                print(f"ALS iteration {iteration + 1}/{iterations}: train RMSE {rmse:.4f}")
+
+        return cls(
+            rating_matrix.user_ids[:by_user.shape[0]], rating_matrix.movie_ids[:by_movie.shape[0]],
+            users, items, reg=reg, implicit=implicit, alpha=alpha,
+        )
+
+    @property
+    def nbytes(self):
+        return self.user_factors.nbytes + self.item_factors.nbytes
+
+    def save(self, path=ALS_FACTORS_PATH):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            user_factors=self.user_factors, item_factors=self.item_factors,
+            user_ids=np.asarray(self.user_ids, dtype=str), movie_ids=np.asarray(self.movie_ids, dtype=str),
+            params=np.array([self.reg, float(self.implicit), self.alpha]),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=ALS_FACTORS_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            reg, implicit, alpha = data['params'].tolist()
+            return cls(
+                data['user_ids'].tolist(), data['movie_ids'].tolist(),
+                data['user_factors'], data['item_factors'],
+                reg=reg, implicit=bool(implicit), alpha=alpha,
+            )
+
+    def fold_in(self, owner, cols, ratings, n_rows: int) -> np.ndarray:
+        # Factors for users outside the trained set (or whose ratings changed):
+        # one user-side ALS step against the fixed item factors.
+        # (owner, cols, ratings) is COO in model movie indices, -1 = unknown movie.
+        known = np.asarray(cols) >= 0
+        indptr, cols, ratings = rows_to_csr(
+            np.asarray(owner)[known], np.asarray(cols)[known], np.asarray(ratings)[known], n_rows,
+        )
+        return solve_rows(indptr, cols, ratings, self.item_factors, self.reg, self.implicit, self.alpha)
+
+    def score_users(self, user_rows, owner, cols, ratings, k, batch_size=SCORE_BATCH_SIZE):
+        # user_rows: model user index per user (-1 = fold in from their ratings).
+        # (owner, cols, ratings): the users' current ratings, cols in model
+        # movie indices, -1 = movie unknown to the model. Per block of users:
+        #   scores = U @ item_factors.T, rated movies masked, top-k by argpartition.
+        # Same output as services/scoring.py, movie indices are the model's.
+        user_rows = np.asarray(user_rows, dtype=np.int64)
+        owner, cols = np.asarray(owner, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+        n = len(user_rows)
+        top = np.full((n, k), -1, dtype=np.int32)
+        top_scores = np.zeros((n, k), dtype=np.float32)
+
+        vectors = np.zeros((n, self.item_factors.shape[1]), dtype=np.float32)
+        stored = user_rows >= 0
+        vectors[stored] = self.user_factors[user_rows[stored]]
+        if not stored.all():
+            in_fold = ~stored[owner]
+            vectors[~stored] = self.fold_in(owner[in_fold], cols[in_fold], ratings[in_fold], n)[~stored]
+
+        for start in range(0, n, batch_size):
+            end = min(start + batch_size, n)
+            scores = (vectors[start:end] @ self.item_factors.T).astype(np.float64)
+            in_block = (owner >= start) & (owner < end) & (cols >= 0)
+            scores[owner[in_block] - start, cols[in_block]] = -np.inf
+
+            block_top, block_scores = top_k_rows(scores, k)
+            top[start:end, :block_top.shape[1]] = block_top
+            top_scores[start:end, :block_top.shape[1]] = block_scores
+
+        return top, top_scores
@@ -0,0 +1,307 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# In-process instrumentation, cheap enough to stay on in production (a span is
+# two perf_counter calls and a locked dict update, about 1-2 us):
+# - span("scoring") times a block into a histogram per span name, and into
+#   the current request's totals;
+# - DynamoDB calls are counted and timed, and their consumed capacity summed,
+#   through botocore events on the shared client (instrument_dynamodb);
+# - MetricsMiddleware times every request and adds a Server-Timing header
+#   with the request's spans and DynamoDB usage (browser devtools show it);
+# - modules register collectors for point-in-time values (cache hit ratios,
+#   model age), evaluated only when /metrics is scraped.
+# GET /metrics renders all of it in the Prometheus text format. Values are per
+# container (each Lambda instance is scraped, or reports, on its own).
+#
+# Standard library only: main imports this on every cold start.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") == "1"
+# Ask DynamoDB for ConsumedCapacity on every call (free, a few bytes per response)
+DYNAMODB_CONSUMED_CAPACITY = os.environ.get("DYNAMODB_CONSUMED_CAPACITY", "1") == "1"
+
+PREFIX = "movie_recs_"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (name, type, help, labels, value), as returned by collectors
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+HELP = {
+    "request_duration_seconds": ("histogram", "HTTP request latency by route"),
+    "requests_total": ("counter", "HTTP requests by route and status"),
+    "span_duration_seconds": ("histogram", "Time spent in instrumented sections"),
+    "dynamodb_request_duration_seconds": ("histogram", "DynamoDB call latency by operation"),
+    "dynamodb_errors_total": ("counter", "Failed DynamoDB calls by operation"),
+    "dynamodb_consumed_capacity_units_total": ("counter", "DynamoDB capacity units consumed by table"),
+}
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def observe(self, name: str, labels: Tuple[Tuple[str, str], ...], value: float):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, labels: Tuple[Tuple[str, str], ...], amount: float = 1):
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    def register(self, collector: Callable[[], Iterable[Sample]]):
+        self.collectors.append(collector)
+
+    def samples(self) -> List[Sample]:
+        with self.lock:
+            histograms = [(name, labels, list(h.counts), h.sum, h.count) for (name, labels), h in self.histograms.items()]
+            counters = list(self.counters.items())
+
+        samples = []
+        for name, labels, counts, total, count in histograms:
+            kind, help_text = HELP[name]
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((name + "_bucket", kind, help_text, {**dict(labels), "le": le}, cumulative))
+            samples.append((name + "_sum", kind, help_text, dict(labels), total))
+            samples.append((name + "_count", kind, help_text, dict(labels), count))
+        for (name, labels), value in counters:
+            kind, help_text = HELP[name]
+            samples.append((name, kind, help_text, dict(labels), value))
+        for collector in self.collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+        return samples
+
+    def render(self) -> str:
+        # Prometheus text exposition format 0.0.4
+        # A family's samples must be contiguous (stable sort keeps bucket order)
+        samples = sorted(self.samples(), key=lambda sample: _family(sample[0], sample[1]))
+        lines, described = [], set()
+        for name, kind, help_text, labels, value in samples:
+            family = _family(name, kind)
+            if family not in described:
+                described.add(family)
+                lines.append(f"# HELP {PREFIX}{family} {help_text}")
+                lines.append(f"# TYPE {PREFIX}{family} {kind}")
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{PREFIX}{name}{{{label_text}}} {_number(value)}" if label_text else f"{PREFIX}{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _family(name: str, kind: str) -> str:
+    # histogram samples are <family>_bucket/_sum/_count
+    return name.rsplit("_", 1)[0] if kind == "histogram" else name
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+registry = Registry()
+
+
+class RequestMetrics:
+    # One request's spans and DynamoDB usage, for its Server-Timing header
+    def __init__(self):
+        self.spans = {}
+        self.dynamodb_calls = 0
+        self.dynamodb_seconds = 0.0
+        self.capacity_units = 0.0
+        self.lock = threading.Lock()
+
+    def add_span(self, name: str, seconds: float):
+        with self.lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def add_dynamodb_call(self, seconds: float, capacity_units: float):
+        with self.lock:
+            self.dynamodb_calls += 1
+            self.dynamodb_seconds += seconds
+            self.capacity_units += capacity_units
+
+    def server_timing(self, total_seconds: float) -> str:
+        with self.lock:
+            parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.spans.items()]
+            if self.dynamodb_calls:
+                parts.append(
+                    f'dynamodb;dur={self.dynamodb_seconds * 1000:.2f};'
+                    f'desc="{self.dynamodb_calls} calls {self.capacity_units:g} CU"'
+                )
+        parts.append(f"total;dur={total_seconds * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+
+def current_request() -> Optional[RequestMetrics]:
+    return _current.get()
+
+
+def record_span(name: str, seconds: float):
+    registry.observe("span_duration_seconds", (("span", name),), seconds)
+    request = _current.get()
+    if request is not None:
+        request.add_span(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+class MetricsMiddleware:
+    # Plain ASGI (no BaseHTTPMiddleware overhead, streaming responses untouched).
+    # Server-Timing holds what happened before the response started; spans
+    # inside a streamed body only reach the histograms.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestMetrics()
+        token = _current.set(request)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if SERVER_TIMING:
+                    timing = request.server_timing(time.perf_counter() - start)
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            # Route template (not the raw path), so ids don't become label values
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            labels = (("method", scope["method"]), ("route", route))
+            registry.observe("request_duration_seconds", labels, time.perf_counter() - start)
+            registry.inc("requests_total", labels + (("status", str(status[0])),))
+
+
+_capacity_operations = {}
+
+
+def _ask_for_capacity(params, model, **kwargs):
+    # provide-client-params: before validation, so the parameter is checked as usual
+    supported = _capacity_operations.get(model.name)
+    if supported is None:
+        supported = _capacity_operations[model.name] = "ReturnConsumedCapacity" in model.input_shape.members
+    if supported:
+        params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+
+def _before_call(context, **kwargs):
+    context["metrics_started"] = time.perf_counter()
+
+
+def _operation(event_name: str) -> str:
+    # "after-call.dynamodb.Query" -> "Query"
+    return event_name.rsplit(".", 1)[-1]
+
+
+def _after_call(parsed, context, event_name, **kwargs):
+    # botocore handlers must not raise: metrics never fail a call
+    try:
+        seconds = time.perf_counter() - context.get("metrics_started", time.perf_counter())
+        registry.observe("dynamodb_request_duration_seconds", (("operation", _operation(event_name)),), seconds)
+
+        consumed = parsed.get("ConsumedCapacity") if isinstance(parsed, dict) else None
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+        units = 0.0
+        for entry in consumed or []:
+            table_units = float(entry.get("CapacityUnits", 0))
+            units += table_units
+            registry.inc("dynamodb_consumed_capacity_units_total", (("table", entry.get("TableName", "")),), table_units)
+
+        request = _current.get()
+        if request is not None:
+            request.add_dynamodb_call(seconds, units)
+    except Exception as e:
+        print(f"Metrics error: {e}")
+
+
+def _after_call_error(event_name, **kwargs):
+    registry.inc("dynamodb_errors_total", (("operation", _operation(event_name)),))
+
+
+def instrument_dynamodb(client):
+    # Hooks on a botocore DynamoDB client (db.get_dynamodb)
+    if not METRICS_ENABLED:
+        return
+    events = client.meta.events
+    if DYNAMODB_CONSUMED_CAPACITY:
+        events.register("provide-client-params.dynamodb", _ask_for_capacity)
+    events.register("before-call.dynamodb", _before_call)
+    events.register("after-call.dynamodb", _after_call)
+    events.register("after-call-error.dynamodb", _after_call_error)
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]):
+    registry.register(collector)
+
+
+def gauge(name: str, help_text: str, value: float, **labels) -> Sample:
+    return (name, "gauge", help_text, labels, value)
+
+
+def cache_samples(cache: str, stats: dict) -> List[Sample]:
+    # Samples for a TTLCache-style stats() dict
+    return [
+        ("cache_hits_total", "counter", "Cache hits", {"cache": cache}, stats["hits"]),
+        ("cache_misses_total", "counter", "Cache misses", {"cache": cache}, stats["misses"]),
+        gauge("cache_hit_ratio", "Cache hit ratio since the container started", stats["hit_ratio"], cache=cache),
+        gauge("cache_entries", "Entries held by the cache", stats["size"], cache=cache),
+    ]
+
+
+def render() -> str:
+    return registry.render()
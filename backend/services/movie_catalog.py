@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+from typing import List
+from db import get_movies_table
+from services.search_index import TitleSearchIndex, SEARCH_LIMIT
+from services.table_scan import parallel_scan
+from services.movie_store import MOVIE_PROJECTION, MOVIE_PROJECTION_NAMES
+from services.metrics import gauge, register_collector
+
+# All movies (projected to what the API returns) held in memory, with the
+# title search index on top. Reloaded from DynamoDB every MOVIE_CATALOG_TTL
+# seconds; a JSON copy on /tmp lets warm containers skip the scan.
+MOVIE_CATALOG_TTL = int(os.environ.get("MOVIE_CATALOG_TTL", 900))
+MOVIE_CATALOG_PATH = os.environ.get("MOVIE_CATALOG_PATH", "/tmp/movie_catalog.json")
+
+COLUMNS = ['movie_id', 'title', 'genres', 'year', 'vote_count', 'vote_total']
+
+
+class MovieCatalog:
+    def __init__(self, movies: List[dict], loaded_at=None):
+        self.movies = movies
+        self.by_id = {m['movie_id']: m for m in movies}
+        self.index = TitleSearchIndex([m['title'] for m in movies])
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+
+    def __len__(self):
+        return len(self.movies)
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> List[dict]:
+        return [self.movies[d] for d in self.index.search(query, limit)]
+
+    @classmethod
+    def from_table(cls, table):
+        columns = parallel_scan(
+            table, COLUMNS,
+            ProjectionExpression=MOVIE_PROJECTION,
+            ExpressionAttributeNames=MOVIE_PROJECTION_NAMES,
+        )
+        movies = []
+        for i, movie_id in enumerate(columns['movie_id']):
+            movies.append({
+                'movie_id': movie_id,
+                'title': columns['title'][i] or '',
+                'genres': list(columns['genres'][i] or []),
+                'year': int(columns['year'][i] or 0),
+                'vote_count': int(columns['vote_count'][i] or 0),
+                'vote_total': float(columns['vote_total'][i] or 0),
+            })
+        return cls(movies)
+
+    def save(self, path=MOVIE_CATALOG_PATH):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({'loaded_at': self.loaded_at, 'movies': self.movies}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=MOVIE_CATALOG_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['movies'], loaded_at=data['loaded_at'])
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def _is_fresh(catalog):
+    return catalog is not None and time.time() - catalog.loaded_at < MOVIE_CATALOG_TTL
+
+
+def get_catalog() -> MovieCatalog:
+    global _catalog
+    if _is_fresh(_catalog):
+        return _catalog
+
+    with _catalog_lock:
+        if _is_fresh(_catalog):
+            return _catalog
+
+        catalog = None
+        try:
+            catalog = MovieCatalog.load()
+            if not _is_fresh(catalog):
+                catalog = None
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Local movie catalog error: {e}")
+
+        if catalog is None:
+            start = time.time()
+            catalog = MovieCatalog.from_table(get_movies_table())
+            print(f"Loaded {len(catalog)} movies into the catalog in {time.time() - start:.2f}s")
+            try:
+                catalog.save()
+            except Exception as e:
+                print(f"Failed to save movie catalog: {e}")
+
+        _catalog = catalog
+        return _catalog
+
+
+def _metrics():
+    catalog = _catalog
+    if catalog is None:
+        return []
+    return [
+        gauge("catalog_age_seconds", "Seconds since the movie catalog was loaded", time.time() - catalog.loaded_at),
+        gauge("catalog_movies", "Movies in the in-memory catalog", len(catalog)),
+    ]
+
+
+register_collector(_metrics)
@@ -0,0 +1,138 @@
+import os
+import random
+import time
+from typing import Dict, List
+from models import Movie
+from db import get_dynamodb, get_movies_table
+from services.cache import TTLCache
+from services.aio import gather_io, run_io
+from services.metrics import span, cache_samples, register_collector
+from services.vote_buffer import get_vote_buffer
+
+# Movie hydration shared by the recommendation engine and GET /ratings.
+# Cached movies carry vote_count/vote_total, so entries expire to pick up
+# aggregates written by other containers.
+MOVIE_CACHE_SIZE = int(os.environ.get("MOVIE_CACHE_SIZE", 5000))
+MOVIE_CACHE_TTL = int(os.environ.get("MOVIE_CACHE_TTL", 300))
+
+# Only the attributes the API returns (Movie)
+MOVIE_PROJECTION = "movie_id, title, genres, #y, vote_count, vote_total"
+MOVIE_PROJECTION_NAMES = {"#y": "year"}
+
+# BatchGetItem has a limit of 100 keys
+BATCH_GET_LIMIT = 100
+BATCH_GET_RETRIES = 5
+
+movie_cache = TTLCache(MOVIE_CACHE_SIZE, MOVIE_CACHE_TTL)
+register_collector(lambda: cache_samples("movies", movie_cache.stats()))
+# Vote buffer flush generation the cached aggregates were read under
+_generation = None
+
+
+def batch_get_keys(table_name: str, keys: List[dict], projection: str = None, names: dict = None) -> List[dict]:
+    # One BatchGetItem (<= BATCH_GET_LIMIT keys), retrying unprocessed keys
+    request = {table_name: {'Keys': keys}}
+    if projection:
+        request[table_name]['ProjectionExpression'] = projection
+    if names:
+        request[table_name]['ExpressionAttributeNames'] = names
+    items = []
+    for attempt in range(BATCH_GET_RETRIES + 1):
+        response = get_dynamodb().batch_get_item(RequestItems=request)
+        items.extend(response.get('Responses', {}).get(table_name, []))
+
+        request = response.get('UnprocessedKeys')
+        if not request:
+            return items
+        # Throttled keys: exponential backoff with jitter before retrying them
+        time.sleep(min(1.0, 0.05 * (2 ** attempt)) * random.uniform(0.5, 1.0))
+
+    print(f"Giving up on {len(request[table_name]['Keys'])} unprocessed keys from {table_name}")
+    return items
+
+
+def _batch_get(table_name: str, movie_ids: List[str]) -> List[dict]:
+    return batch_get_keys(
+        table_name, [{'movie_id': mid} for mid in movie_ids], MOVIE_PROJECTION, MOVIE_PROJECTION_NAMES,
+    )
+
+
+def _from_cache(movie_ids: List[str]):
+    results = {}
+    missing = []
+    for mid in dict.fromkeys(str(m) for m in movie_ids):
+        movie = movie_cache.get(mid)
+        if movie is not None:
+            results[mid] = movie
+        else:
+            missing.append(mid)
+    return results, missing
+
+
+def _store(items: List[dict], results: Dict[str, Movie]):
+    for item in items:
+        movie = Movie(**item)
+        movie_cache.set(movie.movie_id, movie)
+        results[movie.movie_id] = movie
+
+
+def _check_generation(generation):
+    # A vote buffer flush since the last read moved deltas into DynamoDB, so
+    # the cached aggregates are stale
+    global _generation
+    if generation is None or generation == _generation:
+        return
+    if _generation is not None:
+        movie_cache.clear()
+    _generation = generation
+
+
+def _with_pending(pending, results: Dict[str, Movie]) -> Dict[str, Movie]:
+    # Stored aggregates + the deltas still in the vote buffer
+    for movie_id, (count, total) in pending.items():
+        movie = results.get(movie_id)
+        if movie is not None:
+            results[movie_id] = movie.model_copy(update={
+                'vote_count': movie.vote_count + count,
+                'vote_total': movie.vote_total + total,
+            })
+    return results
+
+
+def _pending_ids(movie_ids: List[str]) -> List[str]:
+    return list(dict.fromkeys(str(m) for m in movie_ids))
+
+
+def get_movies_by_ids(movie_ids: List[str]) -> Dict[str, Movie]:
+    with span("hydration"):
+        generation, pending = get_vote_buffer().pending(_pending_ids(movie_ids))
+        _check_generation(generation)
+        results, missing = _from_cache(movie_ids)
+        if missing:
+            table_name = get_movies_table().name
+            for i in range(0, len(missing), BATCH_GET_LIMIT):
+                _store(_batch_get(table_name, missing[i:i + BATCH_GET_LIMIT]), results)
+        return _with_pending(pending, results)
+
+
+async def get_movies_by_ids_async(movie_ids: List[str]) -> Dict[str, Movie]:
+    # Same as get_movies_by_ids, with the BatchGetItem chunks in flight concurrently
+    with span("hydration"):
+        buffer = await run_io(get_vote_buffer)  # first call connects
+        generation, pending = await buffer.pending_async(_pending_ids(movie_ids))
+        _check_generation(generation)
+        results, missing = _from_cache(movie_ids)
+        if missing:
+            table_name = get_movies_table().name
+            chunks = await gather_io([
+                (_batch_get, table_name, missing[i:i + BATCH_GET_LIMIT])
+                for i in range(0, len(missing), BATCH_GET_LIMIT)
+            ])
+            for items in chunks:
+                _store(items, results)
+        return _with_pending(pending, results)
+
+
+def invalidate_movie(movie_id: str):
+    # Called after this container changes a movie's aggregates
+    movie_cache.pop(str(movie_id))
@@ -0,0 +1,298 @@
+import numpy as np
+import os
+from services.sparse import rows_dot_transpose
+
+# Number of similar users kept per user
+NEIGHBOR_K = int(os.environ.get("NEIGHBOR_K", 20))
+# Users scored per block while building the index. 0 = score everyone at once
+# (holds the full N x N similarity matrix, only sensible for small data sets).
+NEIGHBOR_BLOCK_SIZE = int(os.environ.get("NEIGHBOR_BLOCK_SIZE", 256))
+
+# Item-based CF: similar movies kept per movie, and the minimum number of users
+# who rated both movies for the similarity to count
+ITEM_NEIGHBOR_K = int(os.environ.get("ITEM_NEIGHBOR_K", 30))
+ITEM_MIN_SUPPORT = int(os.environ.get("ITEM_MIN_SUPPORT", 3))
+ITEM_NEIGHBORS_PATH = os.environ.get("ITEM_NEIGHBORS_PATH", "/tmp/item_neighbors.npz")
+
+# From this many rows on, neighbor lists come from approximate candidates
+# (services/ann.py) re-ranked exactly, instead of all-pairs similarities.
+# 0 = always exact.
+NEIGHBOR_ANN_MIN_ROWS = int(os.environ.get("NEIGHBOR_ANN_MIN_ROWS", 50000))
+
+
+def top_k_rows(scores, k):
+    # Per-row top-k (indices, scores), best first, ties broken by lower index.
+    # Entries with score <= 0 are padded with index -1.
+    n_rows, n_cols = scores.shape
+    k = min(k, n_cols)
+    if k == 0:
+        return np.full((n_rows, 0), -1, dtype=np.int32), np.zeros((n_rows, 0), dtype=np.float32)
+
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.lexsort((part, -part_scores), axis=1)
+    idx = np.take_along_axis(part, order, axis=1).astype(np.int32)
+    top = np.take_along_axis(part_scores, order, axis=1).astype(np.float32)
+
+    idx[top <= 0] = -1
+    top[top <= 0] = 0
+    return idx, top
+
+
+class NeighborIndex:
+    # Top-K most similar rows for every row of a sparse matrix (cosine).
+    # neighbors[i] holds row indices (int32, -1 padded), scores[i] the similarities (float32).
+    #
+    # Those arrays are never changed once built: update() keeps the lists it
+    # changes in row_overrides, and copy() shares everything else, so a writer
+    # can work on a copy while requests read the original (rows()).
+
+    def __init__(self, neighbors, scores):
+        self.neighbors = neighbors
+        self.scores = scores
+        self.n_rows = neighbors.shape[0]
+        self.row_overrides = {}
+        # Shared by every copy, only used by update(): the rows that list each
+        # row in the built arrays, and (superset) the lists updates put it in
+        self._listers = {"built": None, "added": {}}
+
+    @classmethod
+    def build(cls, matrix, transposed, norms, k=NEIGHBOR_K, block_size=NEIGHBOR_BLOCK_SIZE, min_support=1):
+        n = matrix.shape[0]
+        k = min(k, max(n - 1, 0))
+        if block_size <= 0:
+            block_size = max(n, 1)
+
+        safe_norms = norms.astype(np.float32)
+        safe_norms[safe_norms == 0] = 1e-10
+
+        neighbors = np.full((n, k), -1, dtype=np.int32)
+        scores = np.zeros((n, k), dtype=np.float32)
+
+        for start in range(0, n, block_size):
+            rows = np.arange(start, min(start + block_size, n))
+            if min_support > 1:
+                sims, support = rows_dot_transpose(matrix, transposed, rows, return_counts=True)
+                sims[support < min_support] = 0
+            else:
+                sims = rows_dot_transpose(matrix, transposed, rows)
+            sims /= safe_norms[rows][:, None] * safe_norms[None, :]
+            # A user is not their own neighbor
+            sims[np.arange(len(rows)), rows] = -np.inf
+            neighbors[rows], scores[rows] = top_k_rows(sims, k)
+
+        return cls(neighbors, scores)
+
+    @classmethod
+    def build_approximate(cls, matrix, norms, k=NEIGHBOR_K, block_size=NEIGHBOR_BLOCK_SIZE, min_support=1, ann=None, **query_kwargs):
+        # Same lists as build(), but each row only scores the candidates its
+        # ANN query returns (query_kwargs: nprobe, candidates), so the cost is
+        # O(rows x candidates) instead of O(rows^2).
+        from services.ann import CosineANN
+
+        n = matrix.shape[0]
+        k = min(k, max(n - 1, 0))
+        if block_size <= 0:
+            block_size = max(n, 1)
+        ann = ann or CosineANN(matrix, norms)
+
+        neighbors = np.full((n, k), -1, dtype=np.int32)
+        scores = np.zeros((n, k), dtype=np.float32)
+        for start in range(0, n, block_size):
+            rows = np.arange(start, min(start + block_size, n))
+            neighbors[rows], scores[rows] = ann.query(rows, k, min_support=min_support, **query_kwargs)
+
+        return cls(neighbors, scores)
+
+    @staticmethod
+    def _use_ann(n_rows):
+        return NEIGHBOR_ANN_MIN_ROWS > 0 and n_rows >= NEIGHBOR_ANN_MIN_ROWS
+
+    @classmethod
+    def for_ratings(cls, rating_matrix, k=NEIGHBOR_K, block_size=NEIGHBOR_BLOCK_SIZE):
+        if cls._use_ann(rating_matrix.by_user.shape[0]):
+            return cls.build_approximate(rating_matrix.by_user, rating_matrix.norms, k=k, block_size=block_size)
+        return cls.build(rating_matrix.by_user, rating_matrix.by_movie, rating_matrix.norms, k=k, block_size=block_size)
+
+    @classmethod
+    def for_items(cls, rating_matrix, k=ITEM_NEIGHBOR_K, block_size=NEIGHBOR_BLOCK_SIZE, min_support=ITEM_MIN_SUPPORT):
+        # Movie x movie cosine over the users who rated them (rows of the CSC)
+        by_movie = rating_matrix.by_movie
+        if cls._use_ann(by_movie.shape[0]):
+            return cls.build_approximate(by_movie, by_movie.row_norms(), k=k, block_size=block_size, min_support=min_support)
+        return cls.build(by_movie, rating_matrix.by_user, by_movie.row_norms(), k=k, block_size=block_size, min_support=min_support)
+
+    def save(self, path, ids):
+        # ids: the row labels (e.g. movie ids) so the table can be remapped on load
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, neighbors=self.neighbors, scores=self.scores, ids=np.asarray(ids, dtype=str))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, index):
+        # Re-label rows/neighbors to the current `index` (id -> row), dropping unknown ids
+        with np.load(path, allow_pickle=False) as data:
+            neighbors, scores, ids = data['neighbors'], data['scores'], data['ids'].tolist()
+
+        translate = np.array([index.get(i, -1) for i in ids] + [-1], dtype=np.int32)
+        mapped = translate[neighbors]  # -1 padding maps through the trailing -1
+        scores = np.where(mapped >= 0, scores, 0).astype(np.float32)
+
+        n = max(index.values(), default=-1) + 1
+        out_neighbors = np.full((n, neighbors.shape[1]), -1, dtype=np.int32)
+        out_scores = np.zeros((n, neighbors.shape[1]), dtype=np.float32)
+        rows = translate[:-1]
+        known = rows >= 0
+        out_neighbors[rows[known]] = mapped[known]
+        out_scores[rows[known]] = scores[known]
+
+        loaded = cls(out_neighbors, out_scores)
+        loaded._sort_rows(np.arange(n))
+        return loaded
+
+    def copy(self):
+        # Copy for a writer, in O(changed rows)
+        clone = NeighborIndex.__new__(NeighborIndex)
+        clone.__dict__.update(self.__dict__)
+        clone.row_overrides = dict(self.row_overrides)
+        return clone
+
+    def fold(self):
+        # Fresh arrays with the overrides written in (O(rows x K), off the request path)
+        neighbors = np.full((self.n_rows, self.k), -1, dtype=np.int32)
+        scores = np.zeros((self.n_rows, self.k), dtype=np.float32)
+        built = self.neighbors.shape[0]
+        neighbors[:built], scores[:built] = self.neighbors, self.scores
+        if self.row_overrides:
+            rows = np.fromiter(self.row_overrides, dtype=np.int64, count=len(self.row_overrides))
+            neighbors[rows] = [nb for nb, _ in self.row_overrides.values()]
+            scores[rows] = [sc for _, sc in self.row_overrides.values()]
+        return NeighborIndex(neighbors, scores)
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    @property
+    def nbytes(self):
+        built = self._listers["built"]
+        return (
+            self.neighbors.nbytes + self.scores.nbytes
+            + len(self.row_overrides) * self.k * 8
+            + (built[0].nbytes + built[1].nbytes if built is not None else 0)
+        )
+
+    def rows(self, rows):
+        # (neighbors, scores) of these rows, shape (len(rows), K)
+        rows = np.asarray(rows, dtype=np.int64)
+        neighbors = np.full((len(rows), self.k), -1, dtype=np.int32)
+        scores = np.zeros((len(rows), self.k), dtype=np.float32)
+        built = rows < self.neighbors.shape[0]
+        neighbors[built] = self.neighbors[rows[built]]
+        scores[built] = self.scores[rows[built]]
+        if self.row_overrides:
+            for pos, row in enumerate(rows.tolist()):
+                override = self.row_overrides.get(row)
+                if override is not None:
+                    neighbors[pos], scores[pos] = override
+        return neighbors, scores
+
+    def lookup(self, idx: int):
+        neighbors, scores = self.rows([idx])
+        valid = neighbors[0] >= 0
+        return neighbors[0][valid], scores[0][valid]
+
+    @staticmethod
+    def _sorted(neighbors, scores):
+        # Best score first, padding (-1) last, ties by lower index
+        keys = np.where(neighbors < 0, np.iinfo(np.int32).max, neighbors)
+        order = np.lexsort((keys, -scores), axis=1)
+        return np.take_along_axis(neighbors, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+    def _sort_rows(self, rows):
+        self.neighbors[rows], self.scores[rows] = self._sorted(self.neighbors[rows], self.scores[rows])
+
+    def prepare_updates(self):
+        # Reverse index of the built arrays: O(rows x K) once, so that
+        # update() never scans them (called when the index is built off the
+        # request path, else on the first update)
+        if self._listers["built"] is not None or self.k == 0:
+            return
+        flat = self.neighbors.ravel()
+        order = np.argsort(flat, kind="stable")
+        starts = np.searchsorted(flat[order], np.arange(self.neighbors.shape[0] + 1))
+        self._listers["built"] = ((order // self.k).astype(np.int32), starts)
+
+    def _lister_candidates(self, idx: int):
+        # Rows that may list idx: a superset, checked against the current rows
+        self.prepare_updates()
+        listers, starts = self._listers["built"]
+        built = listers[starts[idx]:starts[idx + 1]] if idx + 1 < len(starts) else listers[:0]
+        added = self._listers["added"].get(idx, ())
+        candidates = np.union1d(built, np.fromiter(added, dtype=np.int64, count=len(added)))
+        return candidates[candidates != idx]
+
+    def update(self, idx: int, users, sims, n_rows: int):
+        # Apply one row's fresh similarities (e.g. after that user rated a movie):
+        # rebuild its own list and patch every list it enters, leaves or moves in.
+        # users/sims: the rows with a non-zero similarity (RatingMatrix.similar_users),
+        # so the work is O(those rows x K), whatever the number of rows.
+        self.n_rows = max(self.n_rows, n_rows)
+        if self.k == 0:
+            return
+        users = np.asarray(users, dtype=np.int64)
+        sims = np.asarray(sims, dtype=np.float32)
+        order = np.argsort(users, kind="stable")
+        users, sims = users[order], sims[order]
+        keep = users != idx
+        users, sims = users[keep], sims[keep]
+
+        def similarity(rows):
+            out = np.zeros(len(rows), dtype=np.float32)
+            if len(users):
+                pos = np.minimum(np.searchsorted(users, rows), len(users) - 1)
+                found = users[pos] == rows
+                out[found] = sims[pos[found]]
+            return out
+
+        # Own list
+        positive = sims > 0
+        top = np.lexsort((users[positive], -sims[positive]))[:self.k]
+        own_neighbors = np.full((1, self.k), -1, dtype=np.int32)
+        own_scores = np.zeros((1, self.k), dtype=np.float32)
+        own_neighbors[0, :len(top)] = users[positive][top]
+        own_scores[0, :len(top)] = sims[positive][top]
+
+        # Lists that already contain idx: refresh the score, drop it if no longer similar
+        candidates = self._lister_candidates(idx)
+        neighbors, scores = self.rows(candidates)
+        hit_rows, hit_cols = np.nonzero(neighbors == idx)
+        listed = candidates[hit_rows]
+        fresh = similarity(listed)
+        scores[hit_rows, hit_cols] = np.maximum(fresh, 0)
+        dropped = fresh <= 0
+        neighbors[hit_rows[dropped], hit_cols[dropped]] = -1
+        hit = np.unique(hit_rows)
+        listed_rows, listed_neighbors, listed_scores = candidates[hit], neighbors[hit], scores[hit]
+
+        # Lists idx now gets into: replace their weakest entry
+        outside = (sims > 0) & ~np.isin(users, listed_rows)
+        others, other_sims = users[outside], sims[outside]
+        neighbors, scores = self.rows(others)
+        entering = other_sims > scores[:, -1]
+        neighbors[entering, -1] = idx
+        scores[entering, -1] = other_sims[entering]
+        entering_rows, entering_neighbors, entering_scores = others[entering], neighbors[entering], scores[entering]
+
+        changed_rows = np.concatenate([[idx], listed_rows, entering_rows]).astype(np.int64)
+        changed_neighbors, changed_scores = self._sorted(
+            np.vstack([own_neighbors, listed_neighbors, entering_neighbors]),
+            np.vstack([own_scores, listed_scores, entering_scores]),
+        )
+        for row, row_neighbors, row_scores in zip(changed_rows.tolist(), changed_neighbors, changed_scores):
+            self.row_overrides[row] = (row_neighbors, row_scores)
+
+        added = self._listers["added"]
+        added.setdefault(idx, set()).update(entering_rows.tolist())
+        for neighbor in own_neighbors[0][own_neighbors[0] >= 0].tolist():
+            added.setdefault(neighbor, set()).add(idx)
@@ -0,0 +1,74 @@
+import base64
+import json
+import os
+from decimal import Decimal
+from typing import AsyncIterator, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+# Cursor pagination for the list endpoints. The body stays a plain JSON array
+# (what the frontend already reads); the next page's cursor comes back in the
+# X-Next-Cursor header and is passed as ?cursor=. A cursor is DynamoDB's
+# LastEvaluatedKey, opaque to clients (urlsafe base64 of its JSON).
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 500))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def encode_cursor(last_key: Optional[dict]) -> Optional[str]:
+    if not last_key:
+        return None
+    raw = json.dumps(last_key, default=_json_default, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[dict]:
+    # ExclusiveStartKey for the page after `cursor`; 400 for anything we didn't issue
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(key, dict) or not all(isinstance(v, str) for v in key.values()):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+
+async def _array_chunks(pages: AsyncIterator[List[dict]]):
+    # Writes the array as the pages arrive. Once the first byte is sent the
+    # status is fixed, so a failing page is re-raised with the array left
+    # open: the client gets invalid JSON (or a reset connection), never a
+    # 200 with a list that silently stops short.
+    yield "["
+    first = True
+    try:
+        async for page in pages:
+            if not page:
+                continue
+            body = ",".join(json.dumps(item, default=_json_default) for item in page)
+            yield body if first else "," + body
+            first = False
+    except Exception as e:
+        print(f"Error streaming response: {e}")
+        raise
+    yield "]"
+
+
+def stream_json(pages: AsyncIterator[List[dict]], next_cursor: Optional[str] = None) -> StreamingResponse:
+    # JSON array response streamed page by page (under Mangum the body is
+    # still buffered for Lambda, but never held as one serialized string)
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return StreamingResponse(_array_chunks(pages), media_type="application/json", headers=headers)
+
+
+async def single_page(items: List[dict]):
+    yield items
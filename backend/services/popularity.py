@@ -0,0 +1,82 @@
+import numpy as np
+import os
+from typing import Dict, List, Optional
+from services.cache import TTLCache
+
+# Cold-start ranking. Movies are ranked by a damped (Bayesian) mean:
+#   (sum of ratings + PRIOR_WEIGHT * global mean) / (count + PRIOR_WEIGHT)
+# so a single 5-star rating no longer beats hundreds of 4.5s, and movies with
+# fewer than MIN_VOTES ratings are left out entirely.
+POPULARITY_MIN_VOTES = int(os.environ.get("POPULARITY_MIN_VOTES", 3))
+POPULARITY_PRIOR_WEIGHT = float(os.environ.get("POPULARITY_PRIOR_WEIGHT", 10))
+# Genre/year rankings kept per index (LRU: the filters come from clients)
+POPULARITY_SEGMENTS = int(os.environ.get("POPULARITY_SEGMENTS", 256))
+
+
+class PopularityIndex:
+    def __init__(self, movie_ids: List[str], counts, sums,
+                 min_votes: int = POPULARITY_MIN_VOTES, prior_weight: float = POPULARITY_PRIOR_WEIGHT):
+        self.movie_ids = movie_ids
+        counts = np.asarray(counts, dtype=np.float64)
+        sums = np.asarray(sums, dtype=np.float64)
+
+        global_mean = sums.sum() / counts.sum() if counts.sum() else 0.0
+        self.scores = ((sums + prior_weight * global_mean) / (counts + prior_weight)).astype(np.float32)
+
+        eligible = np.nonzero(counts >= min_votes)[0]
+        order = np.lexsort((eligible, -self.scores[eligible]))
+        self.ranked = eligible[order].astype(np.int32)
+
+        # Per genre / per year rankings, built on first use. The index is
+        # rebuilt with the model, so entries never need to expire.
+        self._segments = TTLCache(POPULARITY_SEGMENTS, ttl=float("inf"))
+
+    @classmethod
+    def from_matrix(cls, rating_matrix, **kwargs):
+        by_movie = rating_matrix.by_movie
+        counts = np.diff(by_movie.indptr)
+        sums = np.bincount(by_movie.row_ids(), weights=by_movie.data, minlength=by_movie.shape[0])
+        return cls(rating_matrix.movie_ids[:by_movie.shape[0]], counts, sums, **kwargs)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, **kwargs):
+        # Straight from the rating columns, without a rating matrix
+        n_movies = len(snapshot.movie_ids)
+        counts = np.bincount(snapshot.movie_codes, minlength=n_movies)
+        sums = np.bincount(snapshot.movie_codes, weights=snapshot.ratings, minlength=n_movies)
+        return cls(list(snapshot.movie_ids), counts, sums, **kwargs)
+
+    @property
+    def nbytes(self):
+        return self.scores.nbytes + self.ranked.nbytes + sum(s.nbytes for s in self._segments.values())
+
+    def _segment(self, genre: Optional[str], year: Optional[int], metadata: Dict[str, dict]):
+        if not metadata:
+            # No catalog (e.g. it failed to load): nothing matches, and this is
+            # not kept, so the filter works again once the catalog is back
+            return np.zeros(0, dtype=np.int32)
+        key = (genre.casefold() if genre else None, year)
+        segment = self._segments.get(key)
+        if segment is None:
+            keep = []
+            for j in self.ranked.tolist():
+                movie = metadata.get(self.movie_ids[j])
+                if movie is None:
+                    continue
+                if genre and key[0] not in {g.casefold() for g in movie.get('genres', [])}:
+                    continue
+                if year and int(movie.get('year', 0)) != year:
+                    continue
+                keep.append(j)
+            segment = np.array(keep, dtype=np.int32)
+            self._segments.set(key, segment)
+        return segment
+
+    def top(self, k: int, genre: Optional[str] = None, year: Optional[int] = None,
+            metadata: Optional[Dict[str, dict]] = None) -> List[str]:
+        # O(k) slice of a precomputed ranking. Genre/year filters need the
+        # movie metadata (movie_id -> {'genres', 'year'}).
+        ranked = self.ranked
+        if genre or year:
+            ranked = self._segment(genre, year, metadata or {})
+        return [self.movie_ids[j] for j in ranked[:k].tolist()]
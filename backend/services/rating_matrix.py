@@ -0,0 +1,265 @@
+import numpy as np
+import os
+import time
+from typing import List
+from services.sparse import CSRMatrix, expand_ranges
+
+# Upper bound for the in-memory model (user x movie matrix + its transpose).
+# The Lambda has 256 MB in total, so keep a healthy margin for the runtime.
+MAX_MATRIX_MB = float(os.environ.get("MAX_MATRIX_MB", 96))
+
+
+class RatingMatrix:
+    # Sparse user x movie rating matrix plus the id <-> index maps.
+    # Built once per data refresh and shared (read-only) by every request.
+
+    def __init__(self, user_ids: List[str], movie_ids: List[str], matrix: CSRMatrix):
+        self.user_ids = list(user_ids)
+        self.movie_ids = list(movie_ids)
+        self.user_index = {uid: i for i, uid in enumerate(self.user_ids)}
+        self.movie_index = {mid: j for j, mid in enumerate(self.movie_ids)}
+        # This version's users/movies. The id lists and maps are append-only and
+        # shared with the copies made for rating deltas, which may have more.
+        self.n_users, self.n_movies = len(self.user_ids), len(self.movie_ids)
+
+        self.by_user = matrix               # CSR: rows are users
+        self.by_movie = matrix.transpose()  # CSC: rows are movies
+        self.base_norms = matrix.row_norms()
+        self.built_at = time.time()
+
+        # Incremental updates: user rows changed since the build (including new
+        # users) live here as (movie indices, ratings) until the next compaction.
+        # by_user/by_movie are never mutated.
+        self.row_overrides = {}
+
+    @classmethod
+    def from_codes(cls, user_ids, movie_ids, user_codes, movie_codes, ratings, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = MAX_MATRIX_MB * 1024 * 1024
+
+        n_users, n_movies = len(user_ids), len(movie_ids)
+        estimated = (
+            CSRMatrix.estimate_nbytes(n_users, len(ratings))
+            + CSRMatrix.estimate_nbytes(n_movies, len(ratings))
+            + n_users * 4
+        )
+        if estimated > max_bytes:
+            raise MemoryError(
+                f"Rating matrix needs ~{estimated / 1e6:.1f} MB, over the {max_bytes / 1e6:.1f} MB budget"
+            )
+
+        matrix = CSRMatrix.from_coo(user_codes, movie_codes, ratings, (n_users, n_movies))
+        return cls(user_ids, movie_ids, matrix)
+
+    @classmethod
+    def from_ratings(cls, user_ids, movie_ids, ratings, max_bytes=None):
+        # Raw (user_id, movie_id, rating) columns -> integer codes
+        user_uniques, user_codes = np.unique(np.asarray(user_ids, dtype=str), return_inverse=True)
+        movie_uniques, movie_codes = np.unique(np.asarray(movie_ids, dtype=str), return_inverse=True)
+        return cls.from_codes(
+            user_uniques.tolist(), movie_uniques.tolist(),
+            user_codes, movie_codes, np.asarray(ratings, dtype=np.float32),
+            max_bytes=max_bytes,
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot, max_bytes=None):
+        return cls.from_codes(
+            snapshot.user_ids, snapshot.movie_ids,
+            snapshot.user_codes, snapshot.movie_codes, snapshot.ratings.astype(np.float32),
+            max_bytes=max_bytes,
+        )
+
+    def copy(self):
+        # Copy for a writer, in O(changed rows): the built arrays and the
+        # append-only id maps are shared, the overrides are the copy's own
+        clone = RatingMatrix.__new__(RatingMatrix)
+        clone.__dict__.update(self.__dict__)
+        clone.row_overrides = dict(self.row_overrides)
+        return clone
+
+    @property
+    def shape(self):
+        return (self.n_users, self.n_movies)
+
+    @property
+    def norms(self):
+        # Row norms of this version (for builds: O(users))
+        norms = np.zeros(self.n_users, dtype=np.float32)
+        norms[:len(self.base_norms)] = self.base_norms
+        for user_idx in self.row_overrides:
+            norms[user_idx] = self.row_norm(user_idx)
+        return norms
+
+    def row_norm(self, user_idx: int) -> float:
+        if user_idx in self.row_overrides:
+            ratings = self.row_overrides[user_idx][1]
+            return float(np.sqrt(np.sum(ratings.astype(np.float64) ** 2)))
+        return float(self.base_norms[user_idx]) if user_idx < len(self.base_norms) else 0.0
+
+    def find_user(self, user_id: str):
+        # Index of a user in this version, None if unknown (or only added by a later one)
+        user_idx = self.user_index.get(user_id)
+        return user_idx if user_idx is not None and user_idx < self.n_users else None
+
+    def find_movie(self, movie_id: str):
+        movie_idx = self.movie_index.get(movie_id)
+        return movie_idx if movie_idx is not None and movie_idx < self.n_movies else None
+
+    @property
+    def nnz(self):
+        return self.by_user.nnz
+
+    def user_row(self, user_idx: int):
+        # (movie indices, ratings) of one user, sorted by movie index
+        if user_idx in self.row_overrides:
+            return self.row_overrides[user_idx]
+        if user_idx >= self.by_user.shape[0]:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        return self.by_user.row(user_idx)
+
+    def _row_dot(self, a: int, b: int):
+        movies_a, ratings_a = self.user_row(a)
+        movies_b, ratings_b = self.user_row(b)
+        _, ia, ib = np.intersect1d(movies_a, movies_b, assume_unique=True, return_indices=True)
+        return float(np.dot(ratings_a[ia].astype(np.float64), ratings_b[ib]))
+
+    def similar_users(self, user_idx: int):
+        # Cosine similarity of one user against the users who share a movie with
+        # them: (user indices, similarities), sorted by index, the user left out.
+        # Only those users are touched (through the CSC); rows changed since the
+        # build are scored exactly from their overrides.
+        movies, ratings = self.user_row(user_idx)
+        by_movie = self.by_movie
+
+        in_base = movies < by_movie.shape[0]
+        cols, values = movies[in_base], ratings[in_base]
+        starts = by_movie.indptr[cols]
+        counts = by_movie.indptr[cols + 1] - starts
+        pos = expand_ranges(starts, counts)
+        users, inverse = np.unique(by_movie.indices[pos], return_inverse=True)
+        dots = np.bincount(inverse, weights=np.repeat(values, counts) * by_movie.data[pos], minlength=len(users))
+
+        if self.row_overrides:
+            # The CSC holds their old rows
+            others = np.fromiter(self.row_overrides, dtype=np.int64, count=len(self.row_overrides))
+            keep = ~np.isin(users, others)
+            users, dots = users[keep], dots[keep]
+            exact = np.array([self._row_dot(user_idx, other) for other in others.tolist()], dtype=np.float64)
+            users = np.concatenate([users, others])
+            dots = np.concatenate([dots, exact])
+            order = np.argsort(users, kind="stable")
+            users, dots = users[order], dots[order]
+
+        keep = (users != user_idx) & (dots != 0)
+        users, dots = users[keep], dots[keep]
+        norms = np.zeros(len(users), dtype=np.float64)
+        in_base = users < len(self.base_norms)
+        norms[in_base] = self.base_norms[users[in_base]]
+        if self.row_overrides:
+            changed = np.nonzero(np.isin(users, others))[0]
+            norms[changed] = [self.row_norm(u) for u in users[changed].tolist()]
+        norms[norms == 0] = 1e-10
+        own = self.row_norm(user_idx) or 1e-10
+        return users.astype(np.int64), dots / (norms * own)
+
+    def user_similarities(self, user_idx: int):
+        # Dense form of similar_users (O(users)), the user against themselves included
+        sims = np.zeros(self.n_users, dtype=np.float64)
+        users, values = self.similar_users(user_idx)
+        sims[users] = values
+        if self.row_norm(user_idx):
+            sims[user_idx] = 1.0
+        return sims
+
+    def _trim(self, ids, index, n):
+        # Ids appended by a copy that was never swapped in
+        for dropped in ids[n:]:
+            index.pop(dropped, None)
+        del ids[n:]
+
+    def _ensure_user(self, user_id: str) -> int:
+        user_idx = self.find_user(user_id)
+        if user_idx is None:
+            self._trim(self.user_ids, self.user_index, self.n_users)
+            user_idx = self.user_index[user_id] = self.n_users
+            self.user_ids.append(user_id)
+            self.n_users += 1
+        return user_idx
+
+    def _ensure_movie(self, movie_id: str) -> int:
+        movie_idx = self.find_movie(movie_id)
+        if movie_idx is None:
+            self._trim(self.movie_ids, self.movie_index, self.n_movies)
+            movie_idx = self.movie_index[movie_id] = self.n_movies
+            self.movie_ids.append(movie_id)
+            self.n_movies += 1
+        return movie_idx
+
+    def _set_row(self, user_idx: int, movies, ratings):
+        self.row_overrides[user_idx] = (movies.astype(np.int32), ratings.astype(np.float32))
+
+    def set_rating(self, user_id: str, movie_id: str, rating: float) -> int:
+        # Insert or overwrite one rating in O(nnz of the user's row)
+        user_idx = self._ensure_user(user_id)
+        movie_idx = self._ensure_movie(movie_id)
+        movies, ratings = self.user_row(user_idx)
+
+        pos = int(np.searchsorted(movies, movie_idx))
+        if pos < len(movies) and movies[pos] == movie_idx:
+            ratings = ratings.copy()
+            ratings[pos] = rating
+        else:
+            movies = np.insert(movies, pos, movie_idx)
+            ratings = np.insert(ratings, pos, rating)
+        self._set_row(user_idx, movies, ratings)
+        return user_idx
+
+    def remove_rating(self, user_id: str, movie_id: str):
+        # Returns the user index, or None when there was nothing to remove
+        user_idx = self.find_user(user_id)
+        movie_idx = self.find_movie(movie_id)
+        if user_idx is None or movie_idx is None:
+            return None
+
+        movies, ratings = self.user_row(user_idx)
+        pos = int(np.searchsorted(movies, movie_idx))
+        if pos >= len(movies) or movies[pos] != movie_idx:
+            return None
+        self._set_row(user_idx, np.delete(movies, pos), np.delete(ratings, pos))
+        return user_idx
+
+    def compact(self, max_bytes=None):
+        # Fold the overrides back into fresh CSR/CSC arrays
+        base = self.by_user
+        row_ids = base.row_ids()
+        keep = ~np.isin(row_ids, np.fromiter(self.row_overrides, dtype=np.int64, count=len(self.row_overrides)))
+
+        rows = [row_ids[keep]]
+        cols = [base.indices[keep]]
+        values = [base.data[keep]]
+        for user_idx, (movies, ratings) in self.row_overrides.items():
+            rows.append(np.full(len(movies), user_idx, dtype=np.int32))
+            cols.append(movies)
+            values.append(ratings)
+
+        return RatingMatrix.from_codes(
+            self.user_ids[:self.n_users], self.movie_ids[:self.n_movies],
+            np.concatenate(rows), np.concatenate(cols), np.concatenate(values),
+            max_bytes=max_bytes,
+        )
+
+    def memory_usage(self):
+        matrix_bytes = self.by_user.nbytes
+        by_movie_bytes = self.by_movie.nbytes
+        norms_bytes = self.base_norms.nbytes
+        return {
+            "users": self.shape[0],
+            "movies": self.shape[1],
+            "nnz": self.nnz,
+            "override_rows": len(self.row_overrides),
+            "matrix_bytes": matrix_bytes,
+            "by_movie_bytes": by_movie_bytes,
+            "norms_bytes": norms_bytes,
+            "total_bytes": matrix_bytes + by_movie_bytes + norms_bytes,
+        }
@@ -1,159 +1,693 @@
-import pandas as pd
-from typing import List
+import numpy as np
+from typing import Dict, List, Optional, Tuple
 from models import Movie
-from db import get_movies_table, get_ratings_table
+from db import get_ratings_table, get_redis
+from services.rating_matrix import RatingMatrix
+from services.neighbors import NeighborIndex, ITEM_NEIGHBORS_PATH
+from services.scoring import score_users, score_users_by_items, gather_rows
+from services.factorization import FactorModel, ALS_FACTORS_PATH
+from services.popularity import PopularityIndex
+from services.snapshot import RatingsSnapshot, SNAPSHOT_PATH
+from services.table_scan import parallel_scan
+from services.movie_store import get_movies_by_ids, get_movies_by_ids_async
+from services.movie_catalog import get_catalog
+from services.results_store import get_results_store
+from services.aio import run_io
+from services.metrics import span, gauge, register_collector
+from services.deadline import time_left
 # from sklearn.metrics.pairwise import cosine_similarity (Removed for lambda size optimization)
 import time
+import os
+import threading
+import uuid
+from collections import deque
+
+# Rating writes are applied incrementally, so the full reload from Redis/DynamoDB
+# is only a periodic reconcile with the source of truth.
+RECONCILE_INTERVAL = int(os.environ.get("MODEL_RECONCILE_INTERVAL", 3600))
+# Stale-while-revalidate: once the window is up, requests keep using the
+# current model while one background worker per container rebuilds it and
+# swaps it in. Only a cold container (no model yet) loads in the foreground.
+# (On Lambda the worker is frozen between invocations and carries on with the
+# next one.)
+MODEL_BACKGROUND_REFRESH = os.environ.get("MODEL_BACKGROUND_REFRESH", "1") == "1"
+# One container at a time scans DynamoDB (Redis lock); the others wait up to
+# MODEL_REFRESH_WAIT seconds for the snapshot it publishes, and never more
+# than MODEL_REFRESH_WAIT_SHARE of what is left of the invocation (Timeout: 10
+# in infra/template.yaml): the rest is for building the model themselves.
+# The lock is short-lived and renewed by its holder while it scans, so a
+# holder that dies only blocks the others for MODEL_REFRESH_LOCK_MS.
+MODEL_REFRESH_LOCK_MS = int(os.environ.get("MODEL_REFRESH_LOCK_MS", 5000))
+MODEL_REFRESH_WAIT = float(os.environ.get("MODEL_REFRESH_WAIT", 5))
+MODEL_REFRESH_WAIT_SHARE = float(os.environ.get("MODEL_REFRESH_WAIT_SHARE", 0.5))
+MODEL_REFRESH_POLL = float(os.environ.get("MODEL_REFRESH_POLL", 0.5))
+# Pause before retrying after a failed background refresh
+MODEL_REFRESH_RETRY = float(os.environ.get("MODEL_REFRESH_RETRY", 60))
+REFRESH_LOCK_KEY = "ratings:refresh_lock"
+# Pause before building again after the rating matrix did not fit in memory
+# (with no model to fall back on, only the popularity ranking is served meanwhile)
+MODEL_BUILD_RETRY = float(os.environ.get("MODEL_BUILD_RETRY", 600))
+# Changed user rows are folded back into the CSR arrays past this many
+# (in the background, see compact_in_background)
+MAX_OVERRIDE_ROWS = int(os.environ.get("MAX_OVERRIDE_ROWS", 500))
+# Changed neighbor lists are folded back into the neighbor arrays past this many
+MAX_NEIGHBOR_OVERRIDE_ROWS = int(os.environ.get("MAX_NEIGHBOR_OVERRIDE_ROWS", 20000))
+
+# "user": user-based CF on the neighbor index (default)
+# "item": item-based CF on a precomputed movie neighbor table
+# "als": latent factors trained offline by scripts/train_als.py
+MODES = ("user", "item", "als")
+RECOMMENDATION_MODE = os.environ.get("RECOMMENDATION_MODE", "user")
 
 class RecommendationEngine:
     def __init__(self):
         self.last_fetch = 0
-        self.cached_ratings_df = None
-        self.movies_cache = {}
+        self.snapshot = None
+        self.matrix = None
+        self.neighbors = None
+        self.popularity = None
+        self.item_neighbors = None
+        self.factors = None
+        # Rating matrix movie index -> factor model movie index, per matrix
+        self.factor_movie_map = None
+
+        # Delta log fed by the rating endpoints: (timestamp, user_id, movie_id, rating or None)
+        self.pending_deltas = deque()
+        # Deltas already applied since the last reload, replayed on top of the next one
+        # (a reload may come from a Redis copy older than these writes). Idempotent.
+        self.applied_deltas = deque()
+        self.lock = threading.Lock()
+        # Single flight for reloads: held by whoever is rebuilding the model
+        self.refresh_lock = threading.Lock()
+        self.refresh_thread = None
+        self.refresh_failed_at = 0
+        # Deltas applied while a compaction builds, replayed on its result
+        self.compact_deltas = None
+        self.compact_thread = None
+        self.build_failed_at = 0
+
+    def record_rating(self, user_id: str, movie_id: str, rating: float):
+        self.pending_deltas.append((time.time(), user_id, movie_id, float(rating)))
+
+    def record_removal(self, user_id: str, movie_id: str):
+        self.pending_deltas.append((time.time(), user_id, movie_id, None))
+
+    def _apply_deltas(self):
+        if not self.pending_deltas or self.matrix is None:
+            return
+
+        with self.lock, span("deltas"):
+            # Copy-on-write: requests score outside the lock on the matrix and
+            # neighbor lists they picked up, so those are never changed in place.
+            # The copies share the built arrays and keep the changed rows on the
+            # side, so all of this is O(rows touched), whatever the model size.
+            matrix, neighbors = self.matrix.copy(), self.neighbors.copy()
+            applied = []
+            while self.pending_deltas:
+                applied.append(self.pending_deltas.popleft())
+            touched = self._apply_to(matrix, applied)
+            for user_idx in touched:
+                neighbors.update(user_idx, *matrix.similar_users(user_idx), matrix.shape[0])
+            self.matrix, self.neighbors = matrix, neighbors
+            self.applied_deltas.extend(applied)
+            if self.compact_deltas is not None:
+                self.compact_deltas.extend(applied)
+            print(f"Applied rating deltas for {len(touched)} users.")
+
+            compact = (
+                len(matrix.row_overrides) > MAX_OVERRIDE_ROWS
+                or len(neighbors.row_overrides) > MAX_NEIGHBOR_OVERRIDE_ROWS
+            )
+        if compact:
+            self.compact_in_background()
+
+    @staticmethod
+    def _apply_to(matrix, deltas):
+        # Returns the indices of the users whose rows changed
+        touched = set()
+        for _, user_id, movie_id, rating in deltas:
+            if rating is None:
+                user_idx = matrix.remove_rating(user_id, movie_id)
+            else:
+                user_idx = matrix.set_rating(user_id, movie_id, rating)
+            if user_idx is not None:
+                touched.add(user_idx)
+        return touched
+
+    def compact_in_background(self) -> bool:
+        # Folds the changed rows back into fresh arrays on a worker thread,
+        # the requests keep the current model until the swap. Shares the
+        # single flight with reloads (one rebuild at a time); returns whether
+        # it started
+        if not self.refresh_lock.acquire(blocking=False):
+            return False
+        with self.lock:
+            matrix, neighbors = self.matrix, self.neighbors
+            if matrix is None:
+                self.refresh_lock.release()
+                return False
+            self.compact_deltas = []
+
+        def run():
+            try:
+                self._compact(matrix, neighbors)
+            except Exception as e:
+                print(f"Compaction failed, still serving the current model: {e}")
+            finally:
+                with self.lock:
+                    self.compact_deltas = None
+                self.refresh_lock.release()
+
+        self.compact_thread = threading.Thread(target=run, name="model-compact", daemon=True)
+        self.compact_thread.start()
+        return True
+
+    def _compact(self, matrix, neighbors):
+        # Outside the lock: the rating matrix and the neighbor index are built
+        # again from `matrix` (or only the neighbor lists folded in when the
+        # matrix overrides are few). Deltas applied meanwhile are replayed on
+        # the result under the lock, at the swap.
+        rebuild = len(matrix.row_overrides) > MAX_OVERRIDE_ROWS
+        start = time.time()
+        with span("compact"):
+            if rebuild:
+                try:
+                    compacted = matrix.compact()
+                except MemoryError as e:
+                    print(f"Rating matrix not compacted: {e}")
+                    return
+                folded = NeighborIndex.for_ratings(compacted)
+                popularity = PopularityIndex.from_matrix(compacted)
+            else:
+                folded = neighbors.fold()
+            folded.prepare_updates()
+
+        with self.lock:
+            if not self._is_current(matrix):
+                # A reload swapped the model meanwhile
+                return
+            # Deltas applied meanwhile: O(their rows), on objects no request sees yet
+            replay = self.compact_deltas or []
+            if rebuild:
+                current = compacted
+                touched = self._apply_to(current, replay)
+            else:
+                current = self.matrix
+                touched = {current.find_user(user_id) for _, user_id, _, _ in replay} - {None}
+            for user_idx in touched:
+                folded.update(user_idx, *current.similar_users(user_idx), current.shape[0])
+            if rebuild:
+                self.matrix, self.popularity = compacted, popularity
+                self.item_neighbors = None
+                self.factor_movie_map = None
+            self.neighbors = folded
+        print(f"Compacted model in {time.time() - start:.2f}s: {self.memory_usage()}")
 
     def _fetch_data(self):
-        # Redis Caching Implementation
-        import redis
-        import pickle
-        import os
-
-        REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
-        REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
-        
+        # The matrix is built once per refresh, requests inside the window reuse it
+        if self.snapshot is not None and time.time() - self.last_fetch < RECONCILE_INTERVAL:
+            return
+
+        if self._build_backing_off():
+            return
+
+        if self.snapshot is not None and MODEL_BACKGROUND_REFRESH:
+            # Stale: serve the current model, rebuild it on the side
+            self.refresh_in_background()
+            return
+
+        # Nothing to serve yet: load in the foreground, once for every request
+        # waiting on it
+        with self.refresh_lock:
+            stale = self.snapshot is None or time.time() - self.last_fetch >= RECONCILE_INTERVAL
+            if stale and not self._build_backing_off():
+                self._refresh(scan_on_timeout=True)
+
+    def _build_backing_off(self) -> bool:
+        # No model since the last build ran out of memory, and too soon to retry
+        return self.matrix is None and time.time() - self.build_failed_at < MODEL_BUILD_RETRY
+
+    def refresh_in_background(self) -> bool:
+        # Starts the background rebuild unless one is running (or failed
+        # recently); returns whether it did
+        if time.time() - self.refresh_failed_at < MODEL_REFRESH_RETRY:
+            return False
+        if not self.refresh_lock.acquire(blocking=False):
+            return False
+        if self.snapshot is not None and time.time() - self.last_fetch < RECONCILE_INTERVAL:
+            # Another refresh finished in between
+            self.refresh_lock.release()
+            return False
+
+        def run():
+            try:
+                if not self._refresh(scan_on_timeout=False):
+                    self.refresh_failed_at = time.time()
+            except Exception as e:
+                self.refresh_failed_at = time.time()
+                print(f"Model refresh failed, still serving the previous model: {e}")
+            finally:
+                self.refresh_lock.release()
+
+        self.refresh_thread = threading.Thread(target=run, name="model-refresh", daemon=True)
+        self.refresh_thread.start()
+        return True
+
+    def _refresh(self, scan_on_timeout: bool = True) -> bool:
+        # Local file, then Redis, then DynamoDB. Returns False if no newer
+        # data could be had (another container is still scanning)
+        with span("fetch"):
+            snapshot = self._cached_snapshot()
+        if snapshot is None:
+            with span("scan"):
+                snapshot = self._scan_snapshot(scan_on_timeout)
+        if snapshot is None:
+            return False
+        self._load_snapshot(snapshot)
+        return True
+
+    def _is_newer(self, snapshot) -> bool:
+        # Recent enough, and not the data the current model was built from
+        if time.time() - snapshot.created_at >= RECONCILE_INTERVAL:
+            return False
+        return self.snapshot is None or snapshot.created_at > self.snapshot.created_at
+
+    def _cached_snapshot(self):
+        # 1. Local snapshot file (memory-mapped), survives between warm invocations
+        try:
+            snapshot = RatingsSnapshot.load(SNAPSHOT_PATH)
+            if self._is_newer(snapshot):
+                print("Loading ratings from local snapshot...")
+                return snapshot
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Local snapshot error: {e}")
+
+        # 2. Redis Caching Implementation (shared connection pool, see db.py)
         try:
-            r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, socket_timeout=1)
-            # Try to get data from Redis
-            cached_data = r.get('ratings_dataframe')
-            if cached_data:
+            snapshot = RatingsSnapshot.from_redis(get_redis())
+            if snapshot is not None and self._is_newer(snapshot):
                 print("Cache Hit! Loading ratings from Redis...")
-                self.cached_ratings_df = pickle.loads(cached_data)
-                return
+                self._save_local(snapshot)
+                return snapshot
+        except Exception as e:
+            print(f"Redis error: {e}")
+        return None
+
+    def _scan_snapshot(self, scan_on_timeout: bool = True):
+        # 3. Cache Miss - Fetch from DynamoDB (Source of Truth), one container
+        # at a time
+        r = None
+        try:
+            r = get_redis()
         except Exception as e:
             print(f"Redis error: {e}")
+        token = uuid.uuid4().hex
+        locked = self._acquire_refresh_lock(r, token)
+        if not locked:
+            print("Another container is scanning ratings, waiting for its snapshot...")
+            snapshot = self._wait_for_snapshot(r)
+            if snapshot is not None or not scan_on_timeout:
+                return snapshot
+
+        renewal = self._renew_refresh_lock(r, token) if locked and r is not None else None
+        try:
+            print("Cache Miss. Fetching ratings from DynamoDB...")
+            ratings_table = get_ratings_table()
 
-        # Cache Miss - Fetch from DynamoDB (Source of Truth)
-        if self.cached_ratings_df is not None and time.time() - self.last_fetch < 600:
-             return
-
-        print("Cache Miss. Fetching ratings from DynamoDB...")
-        ratings_table = get_ratings_table()
-        
-        # Scan all ratings
-        response = ratings_table.scan(ProjectionExpression="user_id, movie_id, rating")
-        items = response.get('Items', [])
-        while 'LastEvaluatedKey' in response:
-            response = ratings_table.scan(
-                ProjectionExpression="user_id, movie_id, rating",
-                ExclusiveStartKey=response['LastEvaluatedKey']
+            # Scan all ratings (parallel segments, straight into columns)
+            columns = parallel_scan(
+                ratings_table, ['user_id', 'movie_id', 'rating'],
+                numeric=['rating'], ProjectionExpression="user_id, movie_id, rating",
             )
-            items.extend(response.get('Items', []))
-            
-        print(f"Fetched {len(items)} ratings from DB.")
-        
-        # Convert to DataFrame
-        self.cached_ratings_df = pd.DataFrame(items)
-        if not self.cached_ratings_df.empty:
-            self.cached_ratings_df['rating'] = pd.to_numeric(self.cached_ratings_df['rating'])
-            
-            # Save to Redis (TTL 1 hour)
+            print(f"Fetched {len(columns['rating'])} ratings from DB.")
+
+            snapshot = RatingsSnapshot.from_columns(columns['user_id'], columns['movie_id'], columns['rating'])
+            if len(snapshot):
+                # Save to Redis (TTL 1 hour)
+                try:
+                    snapshot.to_redis(r, ttl=3600)
+                    print("Saved ratings to Redis cache.")
+                except Exception as e:
+                    print(f"Failed to save to Redis: {e}")
+                self._save_local(snapshot)
+            return snapshot
+        finally:
+            if renewal is not None:
+                renewal.set()
+            if locked:
+                self._release_refresh_lock(r, token)
+
+    def _acquire_refresh_lock(self, r, token: str) -> bool:
+        # Without Redis every container scans for itself, as before
+        if r is None:
+            return True
+        try:
+            return bool(r.set(REFRESH_LOCK_KEY, token, nx=True, px=MODEL_REFRESH_LOCK_MS))
+        except Exception as e:
+            print(f"Redis error: {e}")
+            return True
+
+    def _renew_refresh_lock(self, r, token: str) -> threading.Event:
+        # Extends the lock while this container still holds it; set the
+        # returned event to stop
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(MODEL_REFRESH_LOCK_MS / 3000):
+                try:
+                    held = r.get(REFRESH_LOCK_KEY)
+                    if (held.decode() if isinstance(held, bytes) else held) != token:
+                        return
+                    r.pexpire(REFRESH_LOCK_KEY, MODEL_REFRESH_LOCK_MS)
+                except Exception as e:
+                    print(f"Redis error: {e}")
+
+        threading.Thread(target=renew, name="refresh-lock", daemon=True).start()
+        return stop
+
+    def _release_refresh_lock(self, r, token: str):
+        if r is None:
+            return
+        try:
+            held = r.get(REFRESH_LOCK_KEY)
+            if (held.decode() if isinstance(held, bytes) else held) == token:
+                r.delete(REFRESH_LOCK_KEY)
+        except Exception as e:
+            print(f"Redis error: {e}")
+
+    def _wait_for_snapshot(self, r):
+        # Until the lock holder publishes its snapshot, gives up or time runs out
+        wait, left = MODEL_REFRESH_WAIT, time_left()
+        if left is not None:
+            wait = min(wait, left * MODEL_REFRESH_WAIT_SHARE)
+        deadline = time.time() + wait
+        while time.time() < deadline:
+            time.sleep(MODEL_REFRESH_POLL)
             try:
-                r.setex('ratings_dataframe', 3600, pickle.dumps(self.cached_ratings_df))
-                print("Saved ratings to Redis cache.")
+                # Lock first: a holder that publishes then releases in between
+                # is still seen
+                held = r.exists(REFRESH_LOCK_KEY)
+                snapshot = RatingsSnapshot.from_redis(r)
+                if snapshot is not None and self._is_newer(snapshot):
+                    print("Loading ratings published by another container...")
+                    self._save_local(snapshot)
+                    return snapshot
+                if not held:
+                    break
             except Exception as e:
-                print(f"Failed to save to Redis: {e}")
-        
-        self.last_fetch = time.time()
+                print(f"Redis error: {e}")
+                break
+        return None
+
+    def _save_local(self, snapshot):
+        try:
+            snapshot.save(SNAPSHOT_PATH)
+        except Exception as e:
+            print(f"Failed to save local snapshot: {e}")
+
+    def _load_snapshot(self, snapshot):
+        # The new model is built on the side and swapped in at once; requests
+        # keep using the previous one until then
+        if snapshot is None or len(snapshot) == 0:
+            with self.lock:
+                self.snapshot = snapshot
+                self.matrix = None
+                self.neighbors = None
+                self.popularity = None
+                self.last_fetch = time.time()
+            return
+
+        try:
+            with span("matrix_build"):
+                matrix = RatingMatrix.from_snapshot(snapshot)
+        except MemoryError as e:
+            # Keep serving the previous matrix rather than risking an OOM.
+            # Without one, rank by popularity (counted from the snapshot, no
+            # matrix needed) until MODEL_BUILD_RETRY, instead of scanning and
+            # failing again on every request
+            print(f"Rating matrix not rebuilt: {e}")
+            popularity = PopularityIndex.from_snapshot(snapshot) if self.matrix is None else None
+            with self.lock:
+                if popularity is not None:
+                    self.popularity = popularity
+                self.build_failed_at = time.time()
+                self.last_fetch = time.time()
+            return
+
+        # Top-K similar users for everyone, computed once per refresh
+        start = time.time()
+        with span("similarity"):
+            neighbors = NeighborIndex.for_ratings(matrix)
+        neighbors.prepare_updates()
+        print(f"Built neighbor index (k={neighbors.k}) in {time.time() - start:.2f}s")
+
+        # Cold-start ranking, also once per refresh
+        popularity = PopularityIndex.from_matrix(matrix)
+
+        with self.lock:
+            self.snapshot = snapshot
+            self.matrix, self.neighbors, self.popularity = matrix, neighbors, popularity
+            # Loaded/built again on the next item-based request
+            self.item_neighbors = None
+            self.factor_movie_map = None
+            # Re-apply local writes the reloaded data may not contain yet
+            cutoff = time.time() - RECONCILE_INTERVAL
+            replay = [d for d in self.applied_deltas if d[0] >= cutoff]
+            self.applied_deltas.clear()
+            self.pending_deltas.extendleft(reversed(replay))
+            self.last_fetch = time.time()
+        print(f"Built rating matrix: {self.memory_usage()}")
+
+    def memory_usage(self):
+        if self.matrix is None:
+            return {}
+        usage = self.matrix.memory_usage()
+        usage["neighbors_bytes"] = self.neighbors.nbytes
+        usage["popularity_bytes"] = self.popularity.nbytes
+        usage["total_bytes"] += self.neighbors.nbytes + self.popularity.nbytes
+        if self.factors is not None:
+            usage["factors_bytes"] = self.factors.nbytes
+            usage["total_bytes"] += self.factors.nbytes
+        return usage
+
+    def _is_current(self, matrix) -> bool:
+        # Delta copies share the built arrays; only a reload or a compaction
+        # replaces them (and resets what is cached per model)
+        current = self.matrix
+        return current is not None and matrix.by_user is current.by_user
+
+    def _get_item_neighbors(self, matrix=None):
+        # Item similarities are stable, so they come from the offline table
+        # (scripts/build_item_neighbors.py) when there is one, else are built
+        # here once per refresh. Rating deltas do not touch them.
+        matrix = matrix if matrix is not None else self.matrix
+        item_neighbors = self.item_neighbors
+        if item_neighbors is not None and self._is_current(matrix):
+            return item_neighbors
+
+        try:
+            # Only the movies of this matrix (delta copies may append more)
+            movie_ids = matrix.movie_ids[:matrix.by_movie.shape[0]]
+            item_neighbors = NeighborIndex.load(ITEM_NEIGHBORS_PATH, dict(zip(movie_ids, range(len(movie_ids)))))
+            print("Loaded item neighbor table.")
+        except FileNotFoundError:
+            start = time.time()
+            with span("similarity"):
+                item_neighbors = NeighborIndex.for_items(matrix)
+            print(f"Built item neighbor table (k={item_neighbors.k}) in {time.time() - start:.2f}s")
+        except Exception as e:
+            print(f"Item neighbor table error: {e}")
+            item_neighbors = NeighborIndex.for_items(matrix)
+        with self.lock:
+            # Not kept if a refresh swapped the matrix meanwhile
+            if self._is_current(matrix):
+                self.item_neighbors = item_neighbors
+        return item_neighbors
+
+    def _get_factor_model(self, matrix):
+        # Factors only come from the offline training job; without them the
+        # "als" mode falls back to user-based CF.
+        if self.factors is None:
+            try:
+                self.factors = FactorModel.load(ALS_FACTORS_PATH)
+                print(f"Loaded factor model ({self.factors.nbytes / 1e6:.1f} MB).")
+            except FileNotFoundError:
+                return None, None
+            except Exception as e:
+                print(f"Factor model error: {e}")
+                return None, None
+
+        movie_map = self.factor_movie_map
+        if movie_map is None or not self._is_current(matrix):
+            movie_map = np.array(
+                [self.factors.movie_index.get(mid, -1) for mid in matrix.movie_ids[:matrix.shape[1]]], dtype=np.int64,
+            )
+            with self.lock:
+                if self._is_current(matrix):
+                    self.factor_movie_map = movie_map
+        return self.factors, movie_map
+
+    def _score_by_factors(self, model, movie_map, matrix, known, k):
+        user_indices = [idx for _, idx in known]
+        # Users rated since training are folded in from their current ratings
+        user_rows = [
+            -1 if idx in matrix.row_overrides else model.user_index.get(user_id, -1)
+            for user_id, idx in known
+        ]
+        owner, cols, ratings = gather_rows(matrix.by_user, user_indices, matrix.row_overrides)
+        # Movies added after the map was built are unknown to the model
+        model_cols = np.full(len(cols), -1, dtype=np.int64)
+        mapped = cols < len(movie_map)
+        model_cols[mapped] = movie_map[cols[mapped]]
+        return model.score_users(user_rows, owner, model_cols, ratings, k)
 
     def _get_movie_details(self, movie_ids: List[str]) -> List[Movie]:
-        movies_table = get_movies_table()
-        results = []
-        for mid in movie_ids:
-            # Check memory cache first
-            if mid in self.movies_cache:
-                results.append(self.movies_cache[mid])
-                continue
-            
-            # Fetch from DB
-            resp = movies_table.get_item(Key={'movie_id': str(mid)})
-            if 'Item' in resp:
-                item = resp['Item']
-                movie = Movie(**item)
-                self.movies_cache[mid] = movie
-                results.append(movie)
-        return results
+        # Batched lookups through the shared movie cache, keeping the ranking order
+        movies = get_movies_by_ids(movie_ids)
+        return [movies[str(mid)] for mid in movie_ids if str(mid) in movies]
+
+    async def _get_movie_details_async(self, movie_ids: List[str]) -> List[Movie]:
+        movies = await get_movies_by_ids_async(movie_ids)
+        return [movies[str(mid)] for mid in movie_ids if str(mid) in movies]
 
-    def get_recommendations(self, user_id: str, k: int = 5) -> List[Movie]:
+    def get_popular(self, k: int = 5, genre: Optional[str] = None, year: Optional[int] = None) -> List[Movie]:
         self._fetch_data()
-        
-        if self.cached_ratings_df is None or self.cached_ratings_df.empty:
+        if self.popularity is None:
             return []
 
-        # Pivot to User-Item Matrix
-        # Rows: Users, Cols: Movies
-        user_movie_matrix = self.cached_ratings_df.pivot_table(
-            index='user_id', 
-            columns='movie_id', 
-            values='rating'
-        ).fillna(0)
-        
-        # Check if user exists in matrix
-        # Note: If user is new (no ratings), we can't do CF efficiently this way.
-        # Fallback to popular items or empty.
-        if user_id not in user_movie_matrix.index:
-            print(f"User {user_id} not found in ratings matrix. Returning popular movies (Mock).")
-            # Fallback logic: return top rated movies generally
-            top_movies = self.cached_ratings_df.groupby('movie_id')['rating'].mean().sort_values(ascending=False).head(k)
-            print(f"Top movies found: {top_movies.index.tolist()}")
-            details = self._get_movie_details(top_movies.index.tolist())
-            print(f"Details found: {len(details)}")
-            return details
-
-        # Item-Based CF: Compute item similarity
-        # Transpose so rows are movies
-        item_user_matrix = user_movie_matrix.T
-        
-        # This is computationally intensive (9000x9000 matrix).
-        # For PROTOTYPE verify if this times out. 
-        # Alternatively, use User-Based CF (600 users is smaller).
-        
-        # Let's try User-Based CF for speed (600x600 matrix is tiny)
-        
-        # Manual Cosine Similarity using Numpy avoiding scikit-learn (huge dependency)
-        # Cosine Sim(A, B) = Dot(A, B) / (Norm(A) * Norm(B))
-        import numpy as np
-        
-        # 1. Normalize the matrix (L2 norm)
-        # Using pure numpy for performance
-        matrix_values = user_movie_matrix.values
-        norm = np.linalg.norm(matrix_values, axis=1, keepdims=True)
-        # Avoid division by zero
-        norm[norm == 0] = 1e-10
-        normalized_matrix = matrix_values / norm
-        
-        # 2. Compute similarity (Dot product of normalized vectors)
-        user_similarity = np.dot(normalized_matrix, normalized_matrix.T)
-        
-        user_sim_df = pd.DataFrame(user_similarity, index=user_movie_matrix.index, columns=user_movie_matrix.index)
-        
-        # Find similar users
-        similar_users = user_sim_df[user_id].sort_values(ascending=False).iloc[1:6] # Top 5 similar users
-        
-        recommended_movies = set()
-        watched_movies = set(user_movie_matrix.loc[user_id][user_movie_matrix.loc[user_id] > 0].index)
-        
-        for similar_user in similar_users.index:
-            # Get movies rated highly by similar user
-            user_ratings = user_movie_matrix.loc[similar_user]
-            top_rated = user_ratings[user_ratings > 4].index.tolist()
-            
-            for movie in top_rated:
-                if movie not in watched_movies:
-                    recommended_movies.add(movie)
-                    if len(recommended_movies) >= k:
-                        break
-            if len(recommended_movies) >= k:
-                break
-                
-        return self._get_movie_details(list(recommended_movies)[:k])
- 
+        metadata = None
+        if genre or year:
+            # Genre/year come from the movie catalog
+            metadata = get_catalog().by_id
+        top_movies = self.popularity.top(k, genre=genre, year=year, metadata=metadata)
+        return self._get_movie_details(top_movies)
+
+    async def get_popular_async(self, k: int = 5, genre: Optional[str] = None, year: Optional[int] = None) -> List[Movie]:
+        # Loading/ranking stays on the I/O pool, hydration is fanned out
+        await run_io(self._fetch_data)
+        if self.popularity is None:
+            return []
+        metadata = (await run_io(get_catalog)).by_id if genre or year else None
+        top_movies = self.popularity.top(k, genre=genre, year=year, metadata=metadata)
+        return await self._get_movie_details_async(top_movies)
+
+    def get_recommendations(self, user_id: str, k: int = 5, mode: Optional[str] = None) -> List[Movie]:
+        mode = mode or RECOMMENDATION_MODE
+        # Precomputed results (offline job) scored with this mode first
+        precomputed = get_results_store().get(user_id, mode)
+        if precomputed is not None and len(precomputed) >= k:
+            return self._get_movie_details([movie_id for movie_id, _ in precomputed[:k]])
+
+        ranked = self.recommend_many([user_id], k, mode=mode)[user_id]
+        return self._get_movie_details([movie_id for movie_id, _ in ranked])
+
+    async def get_recommendations_async(self, user_id: str, k: int = 5, mode: Optional[str] = None) -> List[Movie]:
+        # get_recommendations for async routes: Redis via redis.asyncio, the
+        # model work on the I/O pool, movie hydration chunks concurrently
+        mode = mode or RECOMMENDATION_MODE
+        store = await run_io(get_results_store)
+        precomputed = await store.get_async(user_id, mode)
+        if precomputed is not None and len(precomputed) >= k:
+            return await self._get_movie_details_async([movie_id for movie_id, _ in precomputed[:k]])
+
+        ranked = (await run_io(self.recommend_many, [user_id], k, mode=mode))[user_id]
+        return await self._get_movie_details_async([movie_id for movie_id, _ in ranked])
+
+    def recommend_many(self, user_ids: List[str], k: int = 5, mode: Optional[str] = None) -> Dict[str, List[Tuple[str, float]]]:
+        # Ranked (movie_id, score) lists for many users in one pass.
+        # Scoring is fully vectorized (see services/scoring.py), per block of users:
+        #   user mode: score(movie) = sum over neighbors of similarity * neighbor's rating
+        #   item mode: score(movie) = sum over rated movies of rating * item similarity
+        #   als mode: score(movie) = user factors . movie factors
+        # watched movies masked out, top-k by argpartition.
+        # Ranked best first, ties broken by movie index.
+        mode = mode or RECOMMENDATION_MODE
+        if mode not in MODES:
+            raise ValueError(f"Unknown recommendation mode: {mode}")
+
+        self._fetch_data()
+        self._apply_deltas()
+
+        results = {}
+        # One consistent model for the whole request, whatever a refresh swaps in
+        with self.lock:
+            matrix, user_neighbors = self.matrix, self.neighbors
+        if matrix is None:
+            return {user_id: self._popular_scores(k) for user_id in user_ids}
+
+        known = []
+        for user_id in user_ids:
+            # Check if user exists in matrix
+            # Note: If user is new (no ratings), we can't do CF efficiently this way.
+            # Fallback to popular items.
+            user_idx = matrix.find_user(user_id)
+            if user_idx is None or len(matrix.user_row(user_idx)[0]) == 0:
+                results[user_id] = self._popular_scores(k)
+            else:
+                known.append((user_id, user_idx))
+
+        if known:
+            model, movie_map = self._get_factor_model(matrix) if mode == "als" else (None, None)
+            if mode == "als" and model is None:
+                print("No factor model, falling back to user-based CF.")
+                mode = "user"
+
+            movie_ids = matrix.movie_ids
+            if mode == "als":
+                with span("scoring"):
+                    top, top_scores = self._score_by_factors(model, movie_map, matrix, known, k)
+                movie_ids = model.movie_ids
+            else:
+                if mode == "item":
+                    scorer, neighbors = score_users_by_items, self._get_item_neighbors(matrix)
+                else:
+                    scorer, neighbors = score_users, user_neighbors
+                with span("scoring"):
+                    top, top_scores = scorer(
+                        matrix.by_user, neighbors, [idx for _, idx in known], k,
+                        overrides=matrix.row_overrides, n_movies=matrix.shape[1],
+                    )
+            for row, (user_id, _) in enumerate(known):
+                found = top[row] >= 0
+                results[user_id] = [
+                    (movie_ids[j], float(score))
+                    for j, score in zip(top[row][found].tolist(), top_scores[row][found].tolist())
+                ]
+        return results
+
+    def _popular_scores(self, k: int) -> List[Tuple[str, float]]:
+        if self.popularity is None:
+            return []
+        popularity = self.popularity
+        return [(popularity.movie_ids[j], float(popularity.scores[j])) for j in popularity.ranked[:k].tolist()]
+
+    def recommend(self, user_idx: int, k: int = 5, mode: Optional[str] = None) -> List[Tuple[str, float]]:
+        user_id = self.matrix.user_ids[user_idx]
+        return self.recommend_many([user_id], k, mode=mode)[user_id]
+
+    def metrics(self):
+        # Model freshness and size, for /metrics
+        if self.snapshot is None:
+            return []
+        now = time.time()
+        samples = [
+            gauge("model_age_seconds", "Seconds since the model was last (re)loaded", now - self.last_fetch),
+            gauge("model_data_age_seconds", "Age of the ratings snapshot the model was built from",
+                  now - self.snapshot.created_at),
+            gauge("model_refreshing", "1 while a background refresh runs", int(self.refresh_lock.locked())),
+            gauge("model_pending_deltas", "Rating writes not applied to the model yet", len(self.pending_deltas)),
+        ]
+        matrix = self.matrix
+        if matrix is not None:
+            samples += [
+                gauge("model_users", "Users in the rating matrix", matrix.shape[0]),
+                gauge("model_movies", "Movies in the rating matrix", matrix.shape[1]),
+                gauge("model_ratings", "Ratings in the rating matrix", matrix.nnz),
+                gauge("model_memory_bytes", "Memory held by the model", self.memory_usage().get("total_bytes", 0)),
+            ]
+        return samples
+
 engine = RecommendationEngine()
+register_collector(engine.metrics)
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from db import get_redis, get_async_redis
+from services.cache import TTLCache
+from services.metrics import cache_samples, register_collector
+
+# Whole-response cache for the read endpoints (recommendations, popular,
+# movie listing and search), keyed by user/query:
+# - an in-process LRU, backed by an optional shared Redis tier so a response
+#   computed by one container serves the others;
+# - each entry carries tags ("user:<id>", "movie:<id>" for every movie in it)
+#   and the tag versions it was computed under. Rating writes bump the
+#   versions of the user and the movie (services/response_cache.invalidate),
+#   so exactly the responses that showed them stop being served. Versions
+#   live in Redis when it's there (shared), else in process.
+# - responses carry an ETag; a matching If-None-Match gets a 304.
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 2000))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 300))
+RESPONSE_CACHE_REDIS = os.environ.get("RESPONSE_CACHE_REDIS", "1") == "1"
+# Browser/CDN max-age. 0 = revalidate every time (cheap with the ETag), so
+# clients never keep showing a response the server has invalidated
+RESPONSE_CACHE_MAX_AGE = int(os.environ.get("RESPONSE_CACHE_MAX_AGE", 0))
+
+KEY_PREFIX = "resp:"
+TAG_VERSIONS = KEY_PREFIX + "tags"
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    tags: List[str]
+    versions: List[int]
+    headers: Dict[str, str]
+
+
+def user_tag(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def movie_tag(movie_id: str) -> str:
+    return f"movie:{movie_id}"
+
+
+class ResponseCache:
+    def __init__(self, redis_client=None, maxsize: int = RESPONSE_CACHE_SIZE, ttl: int = RESPONSE_CACHE_TTL,
+                 async_redis=get_async_redis):
+        self.local = TTLCache(maxsize, ttl)
+        self.ttl = ttl
+        self.redis = redis_client
+        self.async_redis = async_redis
+        self.tag_versions = {}
+        self.lock = threading.Lock()
+        self.connected = redis_client is not None
+
+    def attach(self, redis_client):
+        # Switch the version source to Redis; local entries were validated
+        # against local versions, so they go
+        self.redis = redis_client
+        self.connected = True
+        if redis_client is not None:
+            self.local.clear()
+
+    async def versions(self, tags: List[str]) -> List[int]:
+        if not tags:
+            return []
+        if self.redis is None:
+            with self.lock:
+                return [self.tag_versions.get(tag, 0) for tag in tags]
+        values = await self.async_redis().hmget(TAG_VERSIONS, tags)
+        return [int(v or 0) for v in values]
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        try:
+            entry = self.local.get(key)
+            if entry is None and self.redis is not None:
+                data = await self.async_redis().get(KEY_PREFIX + key)
+                if data:
+                    entry = CachedResponse(**json.loads(data))
+                    entry = entry._replace(body=entry.body.encode())
+                    self.local.set(key, entry)
+            if entry is None:
+                return None
+            if await self.versions(entry.tags) != entry.versions:
+                # Something it shows changed since
+                self.local.pop(key)
+                return None
+            return entry
+        except Exception as e:
+            print(f"Response cache error: {e}")
+            return None
+
+    async def put(self, key: str, body: bytes, tags: List[str], headers: Dict[str, str] = None,
+                  seen: Dict[str, int] = None) -> CachedResponse:
+        # `seen`: versions read before computing the response; if one moved
+        # while it was computed, the response is returned but not cached
+        entry = CachedResponse(
+            body=body, etag=f'"{hashlib.sha1(body).hexdigest()}"',
+            tags=sorted(set(tags)), versions=[], headers=headers or {},
+        )
+        try:
+            versions = await self.versions(entry.tags)
+            current = dict(zip(entry.tags, versions))
+            if seen and any(current.get(tag, 0) != version for tag, version in seen.items()):
+                return entry
+            entry = entry._replace(versions=versions)
+            self.local.set(key, entry)
+            if self.redis is not None:
+                data = json.dumps({**entry._asdict(), "body": body.decode()})
+                await self.async_redis().set(KEY_PREFIX + key, data, ex=self.ttl)
+        except Exception as e:
+            print(f"Response cache error: {e}")
+        return entry
+
+    def invalidate(self, tags: Iterable[str]):
+        tags = list(tags)
+        if not tags:
+            return
+        with self.lock:
+            for tag in tags:
+                self.tag_versions[tag] = self.tag_versions.get(tag, 0) + 1
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for tag in tags:
+                    pipe.hincrby(TAG_VERSIONS, tag, 1)
+                pipe.execute()
+            except Exception as e:
+                print(f"Response cache error: {e}")
+
+    def stats(self) -> dict:
+        return {**self.local.stats(), "shared": self.redis is not None}
+
+
+def _connect():
+    if not RESPONSE_CACHE_REDIS:
+        return None
+    try:
+        client = get_redis()
+        client.ping()
+        return client
+    except Exception as e:
+        print(f"Response cache is local only: {e}")
+        return None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+register_collector(lambda: cache_samples("responses", _cache.stats()) if _cache is not None else [])
+
+
+def get_response_cache(connect: bool = True) -> ResponseCache:
+    # connect=False (cold-start sensitive routes): use the shared tier only
+    # if something in this container already connected it
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+    if connect and not _cache.connected:
+        with _cache_lock:
+            if not _cache.connected:
+                _cache.attach(_connect())
+    return _cache
+
+
+def invalidate(user_id: Optional[str] = None, movie_ids: Iterable[str] = ()):
+    # After a rating write: that user's responses, and every response showing
+    # one of these movies (their aggregates changed). Connects, so the shared
+    # versions other containers check are bumped too.
+    tags = [movie_tag(m) for m in movie_ids]
+    if user_id:
+        tags.append(user_tag(user_id))
+    get_response_cache().invalidate(tags)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in ("*", etag):
+            return True
+    return False
+
+
+def _respond(request: Request, entry: CachedResponse, private: bool) -> Response:
+    scope = "private" if private else "public"
+    cache_control = f"{scope}, max-age={RESPONSE_CACHE_MAX_AGE}" if RESPONSE_CACHE_MAX_AGE else f"{scope}, no-cache"
+    headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": cache_control}
+    if _etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+async def cached_json(request: Request, key: str, compute: Callable[[], Awaitable[object]],
+                      tags: List[str] = (), private: bool = False, connect: bool = True) -> Response:
+    # Serve `key` from the cache, or compute it (a list of movies or movie
+    # dicts, or (payload, headers)), tag it with the movies it contains and cache it
+    from services.aio import run_io
+
+    cache = await run_io(get_response_cache, connect) if connect else get_response_cache(connect=False)
+    entry = await cache.get(key)
+    if entry is None:
+        seen = dict(zip(tags, await _safe_versions(cache, list(tags))))
+        result = await compute()
+        payload, headers = result if isinstance(result, tuple) else (result, {})
+        payload = jsonable_encoder(payload)
+        movie_tags = [movie_tag(item["movie_id"]) for item in payload if isinstance(item, dict) and "movie_id" in item]
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        entry = await cache.put(key, body, list(tags) + movie_tags, headers, seen)
+    return _respond(request, entry, private)
+
+
+async def _safe_versions(cache: ResponseCache, tags: List[str]) -> List[int]:
+    try:
+        return await cache.versions(tags)
+    except Exception as e:
+        print(f"Response cache error: {e}")
+        return [0] * len(tags)
@@ -0,0 +1,93 @@
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+from db import get_redis, get_async_redis
+
+# Precomputed recommendations ({user_id: [(movie_id, score), ...]}), written by
+# scripts/precompute_recommendations.py or the batch endpoint and checked first
+# by POST /recommendations/. Lives in Redis so every container sees it; an
+# in-process dict stands in when Redis is unavailable.
+# Each list is stored with the recommendation mode it was scored with, and
+# only served for that mode.
+PRECOMPUTED_TTL = int(os.environ.get("PRECOMPUTED_TTL", 6 * 3600))
+KEY_PREFIX = "recs:"
+
+
+class ResultsStore:
+    def __init__(self, redis_client=None, ttl: int = PRECOMPUTED_TTL):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.local = {}
+
+    def _key(self, user_id: str) -> str:
+        return f"{KEY_PREFIX}{user_id}"
+
+    def put_many(self, results: Dict[str, List[Tuple[str, float]]], mode: str):
+        if self.redis is None:
+            self.local.update({user_id: {"mode": mode, "ranked": ranked} for user_id, ranked in results.items()})
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id, ranked in results.items():
+            pipe.setex(self._key(user_id), self.ttl, json.dumps({"mode": mode, "ranked": ranked}))
+        pipe.execute()
+
+    @staticmethod
+    def _ranked(entry, mode: str) -> Optional[List[Tuple[str, float]]]:
+        # Entries scored with another mode (or from before modes were recorded) are misses
+        if not isinstance(entry, dict) or entry.get("mode") != mode:
+            return None
+        return [tuple(pair) for pair in entry["ranked"]]
+
+    def get(self, user_id: str, mode: str) -> Optional[List[Tuple[str, float]]]:
+        if self.redis is None:
+            return self._ranked(self.local.get(user_id), mode)
+        try:
+            data = self.redis.get(self._key(user_id))
+        except Exception as e:
+            print(f"Results store error: {e}")
+            return None
+        if not data:
+            return None
+        return self._ranked(json.loads(data), mode)
+
+    async def get_async(self, user_id: str, mode: str) -> Optional[List[Tuple[str, float]]]:
+        # Request path: redis.asyncio, the event loop is never blocked on Redis
+        if self.redis is None:
+            return self._ranked(self.local.get(user_id), mode)
+        try:
+            data = await get_async_redis().get(self._key(user_id))
+        except Exception as e:
+            print(f"Results store error: {e}")
+            return None
+        if not data:
+            return None
+        return self._ranked(json.loads(data), mode)
+
+    def invalidate(self, user_id: str):
+        # The user's ratings changed, the precomputed list is stale
+        self.local.pop(user_id, None)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self._key(user_id))
+            except Exception as e:
+                print(f"Results store error: {e}")
+
+
+def _connect():
+    try:
+        client = get_redis()
+        client.ping()
+        return client
+    except Exception as e:
+        print(f"Results store falling back to memory: {e}")
+        return None
+
+
+_store = None
+
+
+def get_results_store() -> ResultsStore:
+    global _store
+    if _store is None:
+        _store = ResultsStore(_connect())
+    return _store
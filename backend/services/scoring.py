@@ -0,0 +1,108 @@
+import numpy as np
+import os
+from services.sparse import expand_ranges
+from services.neighbors import top_k_rows
+
+# Users scored per dense block (block x movies float64 scores)
+SCORE_BATCH_SIZE = int(os.environ.get("SCORE_BATCH_SIZE", 128))
+
+
+def gather_rows(csr, rows, overrides=None):
+    # COO pieces of csr[rows]: (position in `rows`, column, value).
+    # `overrides` maps row -> (columns, values) for rows changed since the build.
+    rows = np.asarray(rows, dtype=np.int64)
+    overrides = overrides or {}
+    if overrides or (len(rows) and rows.max() >= csr.shape[0]):
+        special = np.array([r in overrides or r >= csr.shape[0] for r in rows.tolist()], dtype=bool)
+    else:
+        special = np.zeros(len(rows), dtype=bool)
+
+    base_pos = np.nonzero(~special)[0]
+    starts = csr.indptr[rows[base_pos]]
+    counts = csr.indptr[rows[base_pos] + 1] - starts
+    pos = expand_ranges(starts, counts)
+    owners = [np.repeat(base_pos, counts)]
+    cols = [csr.indices[pos].astype(np.int64)]
+    values = [csr.data[pos]]
+
+    for p in np.nonzero(special)[0].tolist():
+        row_cols, row_values = overrides.get(int(rows[p]), ((), ()))
+        owners.append(np.full(len(row_cols), p, dtype=np.int64))
+        cols.append(np.asarray(row_cols, dtype=np.int64))
+        values.append(np.asarray(row_values, dtype=np.float32))
+
+    return np.concatenate(owners), np.concatenate(cols), np.concatenate(values)
+
+
+def score_users(csr, neighbors, user_indices, k, overrides=None, n_movies=None, batch_size=SCORE_BATCH_SIZE):
+    # User-based CF for many users at once. Per block of users:
+    #   scores = W @ R   (W: block x users similarity weights from the neighbor
+    #                     index, R: the rating matrix), both sparse
+    # then the users' own movies are masked out and top-k taken with argpartition.
+    # Returns (movie indices, scores), shape (len(user_indices), k), -1 padded.
+    # n_movies covers movies added by overrides since the build.
+    user_indices = np.asarray(user_indices, dtype=np.int64)
+    n_movies = n_movies or csr.shape[1]
+    top = np.full((len(user_indices), k), -1, dtype=np.int32)
+    top_scores = np.zeros((len(user_indices), k), dtype=np.float32)
+
+    for start in range(0, len(user_indices), batch_size):
+        block = user_indices[start:start + batch_size]
+        b = len(block)
+
+        # Sparse W: one entry per (user, neighbor)
+        nb, nb_scores = neighbors.rows(block)
+        nb, nb_scores = nb.astype(np.int64), nb_scores.astype(np.float64)
+        owner, slot = np.nonzero(nb >= 0)
+
+        # W @ R: expand each neighbor's rating row, weight it, accumulate per user
+        pos, cols, values = gather_rows(csr, nb[owner, slot], overrides)
+        weights = nb_scores[owner, slot][pos] * values
+        flat = owner[pos] * n_movies + cols
+        # (float64 also when there is nothing to add: bincount gives int64 then)
+        scores = np.bincount(flat, weights=weights, minlength=b * n_movies).astype(np.float64, copy=False).reshape(b, n_movies)
+
+        # Mask what each user has already rated
+        watched_owner, watched_cols, _ = gather_rows(csr, block, overrides)
+        scores[watched_owner, watched_cols] = -np.inf
+
+        block_top, block_scores = top_k_rows(scores, k)
+        top[start:start + b, :block_top.shape[1]] = block_top
+        top_scores[start:start + b, :block_top.shape[1]] = block_scores
+
+    return top, top_scores
+
+
+def score_users_by_items(csr, item_neighbors, user_indices, k, overrides=None, n_movies=None, batch_size=SCORE_BATCH_SIZE):
+    # Item-based CF from the precomputed movie neighbor table:
+    #   score(movie) = sum over the user's rated movies i of rating(i) * sim(i, movie)
+    # O(user ratings x K) per user, no movie x movie product at request time.
+    # Same output as score_users.
+    user_indices = np.asarray(user_indices, dtype=np.int64)
+    n_movies = n_movies or csr.shape[1]
+    top = np.full((len(user_indices), k), -1, dtype=np.int32)
+    top_scores = np.zeros((len(user_indices), k), dtype=np.float32)
+    n_items = item_neighbors.neighbors.shape[0]
+
+    for start in range(0, len(user_indices), batch_size):
+        block = user_indices[start:start + batch_size]
+        b = len(block)
+
+        owner, movies, ratings = gather_rows(csr, block, overrides)
+        # Movies added after the table was built have no neighbors yet
+        has_table = movies < n_items
+        nb = item_neighbors.neighbors[movies[has_table]]
+        nb_scores = item_neighbors.scores[movies[has_table]]
+        entry, slot = np.nonzero(nb >= 0)
+
+        weights = ratings[has_table][entry].astype(np.float64) * nb_scores[entry, slot]
+        flat = owner[has_table][entry] * n_movies + nb[entry, slot]
+        scores = np.bincount(flat, weights=weights, minlength=b * n_movies).astype(np.float64, copy=False).reshape(b, n_movies)
+
+        scores[owner, movies] = -np.inf
+
+        block_top, block_scores = top_k_rows(scores, k)
+        top[start:start + b, :block_top.shape[1]] = block_top
+        top_scores[start:start + b, :block_top.shape[1]] = block_scores
+
+    return top, top_scores
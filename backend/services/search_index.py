@@ -0,0 +1,111 @@
+import numpy as np
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from typing import List
+
+SEARCH_LIMIT = 20
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    # Case and accent insensitive: "Amélie!" -> "amelie"
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _NON_WORD.sub(" ", text.casefold()).strip()
+
+
+def trigrams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TitleSearchIndex:
+    # In-memory title index. Results are ranked: title prefix matches first,
+    # then word prefix matches, then any other substring match (queries of
+    # 3+ characters, through trigram posting lists). Ties: shorter title first.
+
+    def __init__(self, titles: List[str]):
+        self.titles = [normalize(t) for t in titles]
+        n = len(self.titles)
+
+        # Static tie-break order
+        order = sorted(range(n), key=lambda d: (len(self.titles[d]), self.titles[d]))
+        self.doc_order = np.empty(n, dtype=np.int32)
+        self.doc_order[order] = np.arange(n, dtype=np.int32)
+
+        # Sorted titles and words for prefix lookups with bisect
+        title_pairs = sorted((t, d) for d, t in enumerate(self.titles))
+        self.sorted_titles = [t for t, _ in title_pairs]
+        self.sorted_title_docs = np.array([d for _, d in title_pairs], dtype=np.int32)
+
+        word_pairs = sorted({(w, d) for d, t in enumerate(self.titles) for w in t.split()})
+        self.sorted_words = [w for w, _ in word_pairs]
+        self.sorted_word_docs = np.array([d for _, d in word_pairs], dtype=np.int32)
+
+        postings = defaultdict(list)
+        for d, t in enumerate(self.titles):
+            for gram in trigrams(t):
+                postings[gram].append(d)
+        self.postings = {gram: np.array(docs, dtype=np.int32) for gram, docs in postings.items()}
+
+    def __len__(self):
+        return len(self.titles)
+
+    @staticmethod
+    def _prefix_docs(keys, docs, prefix):
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + "\U0010ffff")
+        return docs[start:end]
+
+    def _substring_docs(self, query):
+        lists = []
+        for gram in trigrams(query):
+            docs = self.postings.get(gram)
+            if docs is None:
+                return np.zeros(0, dtype=np.int32)
+            lists.append(docs)
+
+        # Intersect the shortest posting lists first
+        lists.sort(key=len)
+        candidates = lists[0]
+        for docs in lists[1:]:
+            candidates = np.intersect1d(candidates, docs, assume_unique=True)
+        if len(query) == 3:
+            return candidates
+        # Trigrams can match out of order, confirm the substring
+        return np.array([d for d in candidates.tolist() if query in self.titles[d]], dtype=np.int32)
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> List[int]:
+        query = normalize(query)
+        if not query:
+            return []
+
+        groups = [
+            self._prefix_docs(self.sorted_titles, self.sorted_title_docs, query),
+            self._prefix_docs(self.sorted_words, self.sorted_word_docs, query),
+        ]
+        # Sort-based dedupe (word prefixes can hit a title more than once)
+        groups = [np.sort(docs) for docs in groups]
+        groups = [docs[np.concatenate(([True], docs[1:] != docs[:-1]))] if len(docs) else docs for docs in groups]
+
+        # Title prefix matches are also first-word prefix matches (or there are
+        # no word matches at all when the query has a space), so this is the union
+        prefix_matches = max(len(groups[0]), len(groups[1]))
+        if len(query) >= 3 and prefix_matches < limit:
+            groups.append(self._substring_docs(query))
+
+        results = []
+        seen = set()
+        for docs in groups:
+            # Only the best `limit` of a large group can make it into the results
+            if len(docs) > limit:
+                docs = docs[np.argpartition(self.doc_order[docs], limit - 1)[:limit]]
+            for d in docs[np.argsort(self.doc_order[docs], kind="stable")].tolist():
+                if d not in seen:
+                    seen.add(d)
+                    results.append(d)
+                    if len(results) >= limit:
+                        return results
+        return results
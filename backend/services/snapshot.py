@@ -0,0 +1,143 @@
+import numpy as np
+import os
+import struct
+import time
+
+# Versioned binary snapshot of the ratings table, replacing the pickled DataFrame.
+#
+# Layout (little endian, every section 8-byte aligned):
+#   header        MAGIC, version, n_ratings, n_users, n_movies, created_at, section sizes
+#   user_codes    int32[n_ratings]
+#   movie_codes   int32[n_ratings]
+#   ratings       float16[n_ratings]
+#   user_offsets  uint32[n_users + 1]    into the utf-8 user id blob
+#   user_blob     bytes
+#   movie_offsets uint32[n_movies + 1]
+#   movie_blob    bytes
+#
+# Arrays are read with np.frombuffer, so loading is zero-copy from a Redis
+# value and memory-mapped from a local file.
+
+MAGIC = b"MRSNAP"
+VERSION = 1
+HEADER = struct.Struct("<6sHQQQdQQ")
+
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "/tmp/ratings.snapshot")
+REDIS_SNAPSHOT_KEY = "ratings_snapshot"
+
+
+def _pad(size):
+    return (-size) % 8
+
+
+def _encode_strings(values):
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, b"".join(encoded)
+
+
+def _decode_strings(offsets, blob):
+    blob = bytes(blob)
+    bounds = offsets.tolist()
+    return [blob[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(len(bounds) - 1)]
+
+
+class RatingsSnapshot:
+    def __init__(self, user_ids, movie_ids, user_codes, movie_codes, ratings, created_at=None):
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.user_codes = user_codes
+        self.movie_codes = movie_codes
+        self.ratings = ratings
+        self.created_at = created_at if created_at is not None else time.time()
+
+    def __len__(self):
+        return len(self.ratings)
+
+    @classmethod
+    def from_columns(cls, user_ids, movie_ids, ratings):
+        # Raw (user_id, movie_id, rating) columns -> dictionary encoded snapshot
+        user_uniques, user_codes = np.unique(np.asarray(user_ids, dtype=str), return_inverse=True)
+        movie_uniques, movie_codes = np.unique(np.asarray(movie_ids, dtype=str), return_inverse=True)
+        return cls(
+            user_uniques.tolist(), movie_uniques.tolist(),
+            user_codes.astype(np.int32), movie_codes.astype(np.int32),
+            np.asarray(ratings, dtype=np.float16),
+        )
+
+    def to_bytes(self) -> bytes:
+        user_offsets, user_blob = _encode_strings(self.user_ids)
+        movie_offsets, movie_blob = _encode_strings(self.movie_ids)
+        sections = [
+            np.ascontiguousarray(self.user_codes, dtype=np.int32).tobytes(),
+            np.ascontiguousarray(self.movie_codes, dtype=np.int32).tobytes(),
+            np.ascontiguousarray(self.ratings, dtype=np.float16).tobytes(),
+            user_offsets.tobytes(),
+            user_blob,
+            movie_offsets.tobytes(),
+            movie_blob,
+        ]
+
+        parts = [HEADER.pack(
+            MAGIC, VERSION, len(self.ratings), len(self.user_ids), len(self.movie_ids),
+            self.created_at, len(user_blob), len(movie_blob),
+        )]
+        parts.append(b"\0" * _pad(HEADER.size))
+        for section in sections:
+            parts.append(section)
+            parts.append(b"\0" * _pad(len(section)))
+        return b"".join(parts)
+
+    @classmethod
+    def from_buffer(cls, buf):
+        buf = memoryview(buf).cast("B")
+        if len(buf) < HEADER.size:
+            raise ValueError("Snapshot is truncated")
+        magic, version, n_ratings, n_users, n_movies, created_at, user_blob_size, movie_blob_size = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a ratings snapshot")
+        if version != VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+
+        offset = HEADER.size + _pad(HEADER.size)
+
+        def take(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes + _pad(array.nbytes)
+            return array
+
+        user_codes = take(np.int32, n_ratings)
+        movie_codes = take(np.int32, n_ratings)
+        ratings = take(np.float16, n_ratings)
+        user_offsets = take(np.uint32, n_users + 1)
+        user_blob = take(np.uint8, user_blob_size)
+        movie_offsets = take(np.uint32, n_movies + 1)
+        movie_blob = take(np.uint8, movie_blob_size)
+
+        return cls(
+            _decode_strings(user_offsets, user_blob), _decode_strings(movie_offsets, movie_blob),
+            user_codes, movie_codes, ratings, created_at=created_at,
+        )
+
+    def save(self, path=SNAPSHOT_PATH):
+        # Write then rename, so readers never see a half written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=SNAPSHOT_PATH):
+        return cls.from_buffer(np.memmap(path, dtype=np.uint8, mode="r"))
+
+    def to_redis(self, r, key=REDIS_SNAPSHOT_KEY, ttl=3600):
+        r.setex(key, ttl, self.to_bytes())
+
+    @classmethod
+    def from_redis(cls, r, key=REDIS_SNAPSHOT_KEY):
+        data = r.get(key)
+        if not data:
+            return None
+        return cls.from_buffer(data)
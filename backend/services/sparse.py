@@ -0,0 +1,118 @@
+import numpy as np
+
+# Minimal CSR matrix on top of NumPy.
+# scipy.sparse would do the job, but like scikit-learn it is too heavy for the
+# Lambda package, and we only need a handful of operations.
+
+
+def expand_ranges(starts, counts):
+    # Concatenation of arange(s, s + c) for every (s, c) pair, without a Python loop.
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.arange(total, dtype=np.int64) - offsets + np.repeat(np.asarray(starts, dtype=np.int64), counts)
+
+
+class CSRMatrix:
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = (int(shape[0]), int(shape[1]))
+        self._row_ids = None
+
+    @classmethod
+    def from_coo(cls, rows, cols, values, shape, dtype=np.float32):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = np.asarray(values, dtype=dtype)
+
+        # Sort by (row, col). A stable sort keeps input order for duplicates,
+        # so the last write for a cell wins (same as a DynamoDB put).
+        order = np.lexsort((cols, rows))
+        rows, cols, values = rows[order], cols[order], values[order]
+        if len(rows):
+            last = np.ones(len(rows), dtype=bool)
+            last[:-1] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+            rows, cols, values = rows[last], cols[last], values[last]
+
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+        return cls(indptr, cols.astype(np.int32), values, shape)
+
+    @property
+    def nnz(self):
+        return int(self.indptr[-1])
+
+    @property
+    def nbytes(self):
+        total = self.indptr.nbytes + self.indices.nbytes + self.data.nbytes
+        if self._row_ids is not None:
+            total += self._row_ids.nbytes
+        return total
+
+    @staticmethod
+    def estimate_nbytes(n_rows, nnz, value_itemsize=4):
+        # indptr (int64) + indices (int32) + cached row ids (int32) + data
+        return (n_rows + 1) * 8 + nnz * (4 + 4 + value_itemsize)
+
+    def row(self, i):
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def row_ids(self):
+        # Row index of every stored value (COO rows), computed once
+        if self._row_ids is None:
+            self._row_ids = np.repeat(np.arange(self.shape[0], dtype=np.int32), np.diff(self.indptr))
+        return self._row_ids
+
+    def row_norms(self):
+        sq = np.bincount(self.row_ids(), weights=self.data.astype(np.float64) ** 2, minlength=self.shape[0])
+        return np.sqrt(sq).astype(np.float32)
+
+    def transpose(self):
+        # CSR of the transpose == CSC of this matrix
+        return CSRMatrix.from_coo(self.indices, self.row_ids(), self.data, (self.shape[1], self.shape[0]), dtype=self.data.dtype)
+
+    def dot(self, vec):
+        # self @ vec
+        vec = np.asarray(vec)
+        return np.bincount(self.row_ids(), weights=self.data * vec[self.indices], minlength=self.shape[0])
+
+    def to_dense(self):
+        out = np.zeros(self.shape, dtype=self.data.dtype)
+        out[self.row_ids(), self.indices] = self.data
+        return out
+
+
+def rows_dot_transpose(matrix, transposed, rows, return_counts=False):
+    # Dense block matrix[rows] @ matrix.T, shape (len(rows), matrix.shape[0]).
+    # `transposed` is matrix.transpose() (its CSC). Only the non-zero products
+    # are expanded, so memory is bounded by the block, never by N x N.
+    # With return_counts, also the number of shared non-zero columns (support).
+    rows = np.asarray(rows, dtype=np.int64)
+    n_out = matrix.shape[0]
+
+    starts = matrix.indptr[rows]
+    counts = matrix.indptr[rows + 1] - starts
+    pos = expand_ranges(starts, counts)
+    local_rows = np.repeat(np.arange(len(rows), dtype=np.int64), counts)
+    cols = matrix.indices[pos]
+    values = matrix.data[pos]
+
+    # Every stored value (r, c) meets every other row that has column c
+    col_starts = transposed.indptr[cols]
+    col_counts = transposed.indptr[cols + 1] - col_starts
+    other_pos = expand_ranges(col_starts, col_counts)
+    other_rows = transposed.indices[other_pos]
+    products = np.repeat(values, col_counts) * transposed.data[other_pos]
+
+    flat = np.repeat(local_rows, col_counts) * n_out + other_rows
+    out = np.bincount(flat, weights=products, minlength=len(rows) * n_out)
+    out = out.reshape(len(rows), n_out).astype(np.float32)
+    if return_counts:
+        counts = np.bincount(flat, minlength=len(rows) * n_out).reshape(len(rows), n_out)
+        return out, counts
+    return out
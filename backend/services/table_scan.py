@@ -0,0 +1,62 @@
+import contextvars
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+# Parallel segmented DynamoDB scan shared by the ratings and movies loaders.
+# Each segment pages through its slice of the table on its own thread and
+# appends attribute values straight into per-column lists.
+
+# Degree of parallelism (DynamoDB TotalSegments)
+SCAN_SEGMENTS = int(os.environ.get("SCAN_SEGMENTS", 4))
+
+
+def _scan_segment(client, table_name, columns, segment, total_segments, scan_kwargs):
+    out = {c: [] for c in columns}
+    kwargs = dict(scan_kwargs, TableName=table_name)
+    if total_segments > 1:
+        kwargs['Segment'] = segment
+        kwargs['TotalSegments'] = total_segments
+
+    while True:
+        # The table's client is thread-safe (the resource is not); being the
+        # resource's client it still returns deserialized Python values
+        response = client.scan(**kwargs)
+        items = response.get('Items', [])
+        for c in columns:
+            out[c].extend(item.get(c) for item in items)
+
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key:
+            return out
+        kwargs['ExclusiveStartKey'] = start_key
+
+
+def parallel_scan(table, columns: Iterable[str], segments: Optional[int] = None,
+                  numeric: Iterable[str] = (), **scan_kwargs) -> Dict[str, object]:
+    # Returns {column: list of values}; columns listed in `numeric` come back
+    # as float32 arrays. Missing attributes are None (NaN for numeric columns).
+    columns = list(columns)
+    segments = max(1, segments or SCAN_SEGMENTS)
+    client = table.meta.client
+
+    if segments == 1:
+        parts = [_scan_segment(client, table.name, columns, 0, 1, scan_kwargs)]
+    else:
+        with ThreadPoolExecutor(max_workers=segments) as pool:
+            # Each segment in a copy of the caller's context (request metrics)
+            futures = [
+                pool.submit(contextvars.copy_context().run, _scan_segment,
+                            client, table.name, columns, seg, segments, scan_kwargs)
+                for seg in range(segments)
+            ]
+            parts = [f.result() for f in futures]
+
+    result = {}
+    for c in columns:
+        values = [v for part in parts for v in part[c]]
+        if c in numeric:
+            values = np.array([np.nan if v is None else float(v) for v in values], dtype=np.float32)
+        result[c] = values
+    return result
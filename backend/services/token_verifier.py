@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, Optional, Tuple
+from services.cache import TTLCache
+
+# Firebase ID token verification without a round trip through firebase_admin
+# on every request:
+# - Google's signing keys (JWKS) are fetched once and kept for the max-age
+#   Google sends with them; a token signed with a kid we don't have (keys
+#   rotate every few hours) triggers one early refetch.
+# - Tokens are verified locally (RS256, aud/iss = the Firebase project, exp,
+#   iat, sub), the same checks as auth.verify_id_token (no revocation check).
+# - Verified claims are cached by token hash until the token's exp, so a
+#   client sending the same token again skips parsing and the signature check.
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_MAX_TTL = int(os.environ.get("TOKEN_CACHE_MAX_TTL", 3600))
+TOKEN_LEEWAY = int(os.environ.get("TOKEN_LEEWAY", 5))
+FIREBASE_JWKS_URL = os.environ.get(
+    "FIREBASE_JWKS_URL",
+    "https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com",
+)
+# Keys fetched without a max-age, and the minimum gap between refetches
+# forced by unknown kids (a bad token shouldn't turn into a request to Google)
+JWKS_DEFAULT_MAX_AGE = int(os.environ.get("JWKS_DEFAULT_MAX_AGE", 3600))
+JWKS_MIN_REFRESH_INTERVAL = int(os.environ.get("JWKS_MIN_REFRESH_INTERVAL", 60))
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def fetch_jwks(url: str = FIREBASE_JWKS_URL) -> Tuple[dict, int]:
+    # (JWKS document, max-age seconds from Cache-Control)
+    import urllib.request
+
+    with urllib.request.urlopen(url, timeout=5) as response:
+        body = json.loads(response.read())
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+    return body, int(match.group(1)) if match else JWKS_DEFAULT_MAX_AGE
+
+
+class PublicKeyCache:
+    def __init__(self, fetch: Callable[[], Tuple[dict, int]] = fetch_jwks, clock=time.time):
+        self.fetch = fetch
+        self.clock = clock
+        self.keys = {}
+        self.expires_at = 0.0
+        self.fetched_at = None
+        self.fetches = 0
+        self.lock = threading.Lock()
+
+    def _refresh(self):
+        import jwt
+
+        jwks, max_age = self.fetch()
+        keys = {}
+        for jwk in jwks.get("keys", []):
+            try:
+                keys[jwk["kid"]] = jwt.PyJWK(jwk, algorithm="RS256").key
+            except Exception as e:
+                print(f"Skipping unusable signing key {jwk.get('kid')}: {e}")
+        self.keys = keys
+        self.fetched_at = self.clock()
+        self.expires_at = self.fetched_at + max_age
+        self.fetches += 1
+
+    def get(self, kid: str):
+        with self.lock:
+            now = self.clock()
+            stale = now >= self.expires_at
+            rotated = kid not in self.keys and self.fetched_at is not None \
+                and now - self.fetched_at >= JWKS_MIN_REFRESH_INTERVAL
+            if stale or rotated:
+                try:
+                    self._refresh()
+                except Exception as e:
+                    if not self.keys:
+                        raise
+                    # Google unreachable: keep the keys we have a little longer
+                    print(f"Signing key refresh failed, keeping cached keys: {e}")
+                    self.expires_at = now + JWKS_MIN_REFRESH_INTERVAL
+            key = self.keys.get(kid)
+        if key is None:
+            raise InvalidToken(f"Unknown signing key {kid!r}")
+        return key
+
+
+class TokenVerifier:
+    # project_id=None: no local verification possible, `fallback(token)`
+    # (firebase_admin) decodes instead; its results are cached the same way
+    def __init__(self, project_id: Optional[str], keys: PublicKeyCache = None,
+                 cache_size: int = TOKEN_CACHE_SIZE, clock=time.time, fallback=None):
+        self.project_id = project_id
+        self.keys = keys if keys is not None else PublicKeyCache(clock=clock)
+        self.clock = clock
+        self.fallback = fallback
+        self.cache = TTLCache(cache_size, TOKEN_CACHE_MAX_TTL)
+
+    def _cache_key(self, token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def cached(self, token: str) -> Optional[dict]:
+        # Claims of an already verified, unexpired token (cheap, no I/O)
+        claims = self.cache.get(self._cache_key(token))
+        if claims is None or claims["exp"] <= self.clock():
+            return None
+        return claims
+
+    def verify(self, token: str) -> dict:
+        claims = self.cached(token)
+        if claims is not None:
+            return claims
+
+        claims = self._decode(token) if self.project_id else self.fallback(token)
+        ttl = min(claims["exp"] - self.clock(), TOKEN_CACHE_MAX_TTL)
+        if ttl > 0:
+            self.cache.set(self._cache_key(token), claims, ttl=ttl)
+        return claims
+
+    def _decode(self, token: str) -> dict:
+        import jwt
+
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            if not kid:
+                raise InvalidToken("Token has no kid")
+            claims = jwt.decode(
+                token, self.keys.get(kid), algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=f"https://securetoken.google.com/{self.project_id}",
+                leeway=TOKEN_LEEWAY,
+                options={"require": ["exp", "iat", "sub"]},
+            )
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+        if not isinstance(claims.get("sub"), str) or not claims["sub"] or len(claims["sub"]) > 128:
+            raise InvalidToken("Invalid sub claim")
+        claims["uid"] = claims["sub"]
+        return claims
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "jwks_fetches": self.keys.fetches, "signing_keys": len(self.keys.keys)}
@@ -0,0 +1,202 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from db import get_redis, get_async_redis, get_movies_table
+from services.aggregates import apply_vote_delta
+
+# Write-behind buffer for the per-movie vote aggregates. A rating on a popular
+# movie used to be an UpdateItem on that one movie item every time; instead the
+# deltas are summed in Redis (HINCRBY, shared by every container) and written
+# to DynamoDB by whichever writer finds the buffer full (VOTE_BUFFER_MAX_MOVIES
+# movies) or its oldest delta older than VOTE_BUFFER_FLUSH_INTERVAL seconds:
+# one UpdateItem per movie per flush, however many ratings it received.
+#
+# Readers (movie_store, GET /movies) add the pending deltas to the stored
+# values, so averages include ratings that haven't been flushed yet.
+#
+# Without Redis, or when Redis fails, deltas are written straight through to
+# DynamoDB (the previous behavior), so nothing is ever held only in memory.
+VOTE_BUFFER_ENABLED = os.environ.get("VOTE_BUFFER_ENABLED", "1") == "1"
+VOTE_BUFFER_MAX_MOVIES = int(os.environ.get("VOTE_BUFFER_MAX_MOVIES", 500))
+VOTE_BUFFER_FLUSH_INTERVAL = float(os.environ.get("VOTE_BUFFER_FLUSH_INTERVAL", 30))
+VOTE_BUFFER_FLUSH_THREADS = int(os.environ.get("VOTE_BUFFER_FLUSH_THREADS", 8))
+VOTE_BUFFER_LOCK_MS = int(os.environ.get("VOTE_BUFFER_LOCK_MS", 60000))
+
+KEY_PREFIX = "votes:"
+PENDING_COUNT = KEY_PREFIX + "pending:count"
+PENDING_TOTAL = KEY_PREFIX + "pending:total"
+# Deltas taken by the running flush, still counted by readers until applied
+FLUSHING_COUNT = KEY_PREFIX + "flushing:count"
+FLUSHING_TOTAL = KEY_PREFIX + "flushing:total"
+FIRST_PENDING = KEY_PREFIX + "first_pending"
+FLUSH_LOCK = KEY_PREFIX + "flush_lock"
+# Bumped after every flush: values cached from DynamoDB before it are stale
+GENERATION = KEY_PREFIX + "generation"
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class VoteBuffer:
+    def __init__(self, redis_client=None, max_movies: int = VOTE_BUFFER_MAX_MOVIES,
+                 flush_interval: float = VOTE_BUFFER_FLUSH_INTERVAL, async_redis=get_async_redis):
+        self.redis = redis_client
+        # Factory for the request path's redis.asyncio client (per event loop)
+        self.async_redis = async_redis
+        self.max_movies = max_movies
+        self.flush_interval = flush_interval
+
+    def add(self, movies_table, movie_id: str, count_delta: int, total_delta: float) -> bool:
+        # Same contract as aggregates.apply_vote_delta
+        if count_delta == 0 and total_delta == 0:
+            return False
+        if self.redis is None:
+            return apply_vote_delta(movies_table, movie_id, count_delta, total_delta)
+
+        now = time.time()
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.hincrby(PENDING_COUNT, movie_id, int(count_delta))
+            pipe.hincrbyfloat(PENDING_TOTAL, movie_id, float(total_delta))
+            pipe.hlen(PENDING_COUNT)
+            pipe.set(FIRST_PENDING, now, nx=True)
+            pipe.get(FIRST_PENDING)
+            _, _, size, _, first = pipe.execute()
+        except Exception as e:
+            print(f"Vote buffer error, writing through: {e}")
+            return apply_vote_delta(movies_table, movie_id, count_delta, total_delta)
+
+        if size >= self.max_movies or now - float(_text(first) or now) >= self.flush_interval:
+            try:
+                self.flush(movies_table)
+            except Exception as e:
+                # The deltas stay in Redis for the next flush
+                print(f"Vote buffer flush failed: {e}")
+        return True
+
+    def flush(self, movies_table=None) -> int:
+        # Applies the buffered deltas, one UpdateItem per movie. One flusher
+        # at a time (SET NX lock); returns the number of movies updated.
+        if self.redis is None:
+            return 0
+        token = uuid.uuid4().hex
+        if not self.redis.set(FLUSH_LOCK, token, nx=True, px=VOTE_BUFFER_LOCK_MS):
+            return 0
+        try:
+            # Deltas left by a flush that died half way go first; otherwise
+            # move the pending hashes aside atomically (writers start new ones)
+            if not self.redis.exists(FLUSHING_COUNT):
+                if not self.redis.exists(PENDING_COUNT):
+                    return 0
+                pipe = self.redis.pipeline(transaction=True)
+                pipe.rename(PENDING_COUNT, FLUSHING_COUNT)
+                pipe.rename(PENDING_TOTAL, FLUSHING_TOTAL)
+                pipe.delete(FIRST_PENDING)
+                pipe.execute()
+
+            counts = {_text(k): int(v) for k, v in self.redis.hgetall(FLUSHING_COUNT).items()}
+            totals = {_text(k): float(v) for k, v in self.redis.hgetall(FLUSHING_TOTAL).items()}
+            table = movies_table if movies_table is not None else get_movies_table()
+
+            def apply(movie_id):
+                updated = apply_vote_delta(
+                    table, movie_id, counts.get(movie_id, 0), round(totals.get(movie_id, 0.0), 6),
+                )
+                # Applied, so readers stop adding it (a reader in between
+                # this and the update may briefly count it twice)
+                pipe = self.redis.pipeline(transaction=True)
+                pipe.hdel(FLUSHING_COUNT, movie_id)
+                pipe.hdel(FLUSHING_TOTAL, movie_id)
+                pipe.execute()
+                return updated
+
+            with ThreadPoolExecutor(max_workers=VOTE_BUFFER_FLUSH_THREADS) as pool:
+                updated = sum(pool.map(apply, set(counts) | set(totals)))
+            self.redis.incr(GENERATION)
+            print(f"Flushed vote deltas for {updated} movies")
+            return updated
+        finally:
+            if _text(self.redis.get(FLUSH_LOCK)) == token:
+                self.redis.delete(FLUSH_LOCK)
+
+    def _queue_pending(self, pipe, movie_ids: List[str]):
+        pipe.hmget(PENDING_COUNT, movie_ids)
+        pipe.hmget(PENDING_TOTAL, movie_ids)
+        pipe.hmget(FLUSHING_COUNT, movie_ids)
+        pipe.hmget(FLUSHING_TOTAL, movie_ids)
+        pipe.get(GENERATION)
+
+    def _parse_pending(self, movie_ids: List[str], results):
+        counts, totals, flushing_counts, flushing_totals, generation = results
+        pending = {}
+        for i, movie_id in enumerate(movie_ids):
+            count = int(counts[i] or 0) + int(flushing_counts[i] or 0)
+            total = float(totals[i] or 0) + float(flushing_totals[i] or 0)
+            if count or total:
+                pending[movie_id] = (count, total)
+        return int(generation or 0), pending
+
+    def pending(self, movie_ids: List[str]) -> Tuple[Optional[int], Dict[str, Tuple[int, float]]]:
+        # (flush generation, {movie_id: (count delta, total delta)}) not yet in DynamoDB
+        if self.redis is None or not movie_ids:
+            return None, {}
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            self._queue_pending(pipe, movie_ids)
+            return self._parse_pending(movie_ids, pipe.execute())
+        except Exception as e:
+            print(f"Vote buffer error: {e}")
+            return None, {}
+
+    async def pending_async(self, movie_ids: List[str]) -> Tuple[Optional[int], Dict[str, Tuple[int, float]]]:
+        if self.redis is None or not movie_ids:
+            return None, {}
+        try:
+            pipe = self.async_redis().pipeline(transaction=False)
+            self._queue_pending(pipe, movie_ids)
+            return self._parse_pending(movie_ids, await pipe.execute())
+        except Exception as e:
+            print(f"Vote buffer error: {e}")
+            return None, {}
+
+
+def with_pending(item: dict, pending: Dict[str, Tuple[int, float]]) -> dict:
+    # Copy of a movie dict (catalog or table item) with its pending votes added
+    delta = pending.get(item.get('movie_id'))
+    if not delta:
+        return item
+    return {
+        **item,
+        'vote_count': int(item.get('vote_count') or 0) + delta[0],
+        'vote_total': float(item.get('vote_total') or 0) + delta[1],
+    }
+
+
+def _connect():
+    if not VOTE_BUFFER_ENABLED:
+        return None
+    try:
+        client = get_redis()
+        client.ping()
+        return client
+    except Exception as e:
+        print(f"Vote buffer disabled, writing aggregates through: {e}")
+        return None
+
+
+_buffer = None
+
+
+def get_vote_buffer() -> VoteBuffer:
+    global _buffer
+    if _buffer is None:
+        _buffer = VoteBuffer(_connect())
+    return _buffer
+
+
+def peek_vote_buffer() -> Optional[VoteBuffer]:
+    # The buffer if this container has already connected it, without connecting
+    return _buffer
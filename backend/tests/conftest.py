@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The app imports its modules from the backend directory (as on Lambda:
+# services.x, routers.x, db), so the tests do too, whichever directory
+# pytest runs from. One import root: no module is loaded twice under two names.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
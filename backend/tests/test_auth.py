@@ -0,0 +1,134 @@
+import os
+import asyncio
+import json
+import time
+import pytest
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+jwt = pytest.importorskip("jwt")
+rsa = pytest.importorskip("cryptography.hazmat.primitives.asymmetric.rsa")
+
+from fastapi import HTTPException
+import auth
+from services.token_verifier import TokenVerifier, PublicKeyCache, InvalidToken
+
+PROJECT = "movie-recs-test"
+
+def _key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update(kid=kid, alg="RS256", use="sig")
+    return private_key, jwk
+
+class FakeGoogle:
+    # Stands in for the JWKS endpoint: serves whichever keys are "published"
+    def __init__(self, *jwks, max_age=3600):
+        self.jwks = list(jwks)
+        self.max_age = max_age
+        self.fetches = 0
+
+    def __call__(self):
+        self.fetches += 1
+        return {"keys": list(self.jwks)}, self.max_age
+
+def _token(private_key, kid, uid="u1", ttl=3600, **overrides):
+    now = int(time.time())
+    claims = {"iss": f"https://securetoken.google.com/{PROJECT}", "aud": PROJECT,
+              "sub": uid, "iat": now, "exp": now + ttl, "auth_time": now}
+    claims.update(overrides)
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": kid})
+
+@pytest.fixture(scope="module")
+def keys():
+    return _key("k1"), _key("k2")
+
+def test_verifies_locally_and_caches_until_exp(keys):
+    (private_key, jwk), _ = keys
+    google = FakeGoogle(jwk)
+    verifier = TokenVerifier(PROJECT, PublicKeyCache(google))
+
+    token = _token(private_key, "k1")
+    assert verifier.cached(token) is None
+    claims = verifier.verify(token)
+    assert claims["uid"] == "u1"
+    assert verifier.cached(token) is claims
+    assert verifier.verify(token) is claims
+    assert google.fetches == 1
+    assert verifier.stats()["hits"] >= 2
+
+    # A cached token stops being accepted once its exp passes
+    clock = [time.time()]
+    verifier = TokenVerifier(PROJECT, PublicKeyCache(google), clock=lambda: clock[0])
+    verifier.verify(token)
+    clock[0] += 3601
+    assert verifier.cached(token) is None
+
+def test_rejects_bad_tokens(keys):
+    (private_key, jwk), (other_key, _) = keys
+    verifier = TokenVerifier(PROJECT, PublicKeyCache(FakeGoogle(jwk)))
+
+    bad_tokens = [
+        _token(private_key, "k1", ttl=-60),                              # expired
+        _token(private_key, "k1", aud="another-project"),                # wrong audience
+        _token(private_key, "k1", iss="https://evil.example.com"),       # wrong issuer
+        _token(other_key, "k1"),                                         # wrong signature
+        _token(private_key, "k1", uid=""),                               # empty sub
+        jwt.encode({"sub": "u1"}, "s" * 32, algorithm="HS256", headers={"kid": "k1"}),
+    ]
+    for token in bad_tokens:
+        with pytest.raises(InvalidToken):
+            verifier.verify(token)
+        assert verifier.cached(token) is None
+
+def test_signing_key_rotation(keys, monkeypatch):
+    (key1, jwk1), (key2, jwk2) = keys
+    google = FakeGoogle(jwk1)
+    clock = [time.time()]
+    public_keys = PublicKeyCache(google, clock=lambda: clock[0])
+    verifier = TokenVerifier(PROJECT, public_keys, clock=lambda: clock[0])
+    verifier.verify(_token(key1, "k1"))
+
+    # Google publishes k2 before our copy expires: an unknown kid refetches
+    # (at most once per JWKS_MIN_REFRESH_INTERVAL)
+    google.jwks = [jwk1, jwk2]
+    with pytest.raises(InvalidToken):
+        verifier.verify(_token(key2, "k2"))
+    assert google.fetches == 1
+    clock[0] += 61
+    assert verifier.verify(_token(key2, "k2", uid="u2"))["uid"] == "u2"
+    assert google.fetches == 2
+
+    # Expired key set: refetched; if Google is unreachable the old keys stay in use
+    def unreachable():
+        raise OSError("network down")
+
+    clock[0] += 7200
+    public_keys.fetch = unreachable
+    assert verifier.verify(_token(key1, "k1", uid="u3"))["uid"] == "u3"
+
+def test_verify_token_dependency_uses_the_cache(keys, monkeypatch):
+    (private_key, jwk), _ = keys
+    verifier = TokenVerifier(PROJECT, PublicKeyCache(FakeGoogle(jwk)))
+    monkeypatch.setattr(auth, "_verifier", verifier)
+
+    token = _token(private_key, "k1", uid="alice")
+    assert asyncio.run(auth.verify_token(f"Bearer {token}"))["uid"] == "alice"
+    assert asyncio.run(auth.verify_token(f"Bearer {token}"))["uid"] == "alice"
+    assert verifier.stats()["misses"] == 2 and verifier.stats()["hits"] == 1
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(auth.verify_token(f"Bearer {token[:-4]}abcd"))
+    assert error.value.status_code == 401
+    assert asyncio.run(auth.verify_token("Bearer test-token"))["uid"] == "test_user"
+
+def test_without_project_id_firebase_results_are_cached():
+    calls = []
+
+    def firebase(token):
+        calls.append(token)
+        return {"uid": "u1", "sub": "u1", "exp": time.time() + 600}
+
+    verifier = TokenVerifier(None, fallback=firebase)
+    verifier.verify("opaque")
+    verifier.verify("opaque")
+    assert calls == ["opaque"]
@@ -0,0 +1,58 @@
+import json
+import os
+import subprocess
+import sys
+from decimal import Decimal
+
+from scripts.benchmark_api import MemoryTable, generate
+from services.aggregates import apply_vote_delta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_memory_table_pages_and_projects_like_dynamodb():
+    table = MemoryTable("ratings", "user_id", "movie_id")
+    for i in range(5):
+        table.put_item(Item={"user_id": "u1", "movie_id": f"m{i}", "rating": Decimal(i)})
+    table.put_item(Item={"user_id": "u2", "movie_id": "m0", "rating": Decimal(1)})
+    assert table.put_item(Item={"user_id": "u1", "movie_id": "m0", "rating": Decimal(4)},
+                          ReturnValues="ALL_OLD")["Attributes"]["rating"] == 0
+
+    seen, kwargs = [], dict(KeyConditionExpression="user_id = :uid", ExpressionAttributeValues={":uid": "u1"},
+                            ProjectionExpression="movie_id, #r", ExpressionAttributeNames={"#r": "rating"}, Limit=2)
+    while True:
+        response = table.query(**kwargs)
+        seen += response["Items"]
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    assert [item["movie_id"] for item in seen] == [f"m{i}" for i in range(5)]
+    assert seen[0] == {"movie_id": "m0", "rating": 4}
+
+    movies = MemoryTable("movies", "movie_id")
+    movies.put_item(Item={"movie_id": "m1", "vote_count": 1, "vote_total": Decimal("4.5")})
+    apply_vote_delta(movies, "m1", 1, -1.5)
+    assert movies.get_item(Key={"movie_id": "m1"})["Item"]["vote_total"] == 3
+    apply_vote_delta(movies, "m2", 1, 4.0)
+    assert movies.get_item(Key={"movie_id": "m2"})["Item"] == {"movie_id": "m2", "vote_count": 1, "vote_total": 4}
+
+def test_synthetic_data_is_consistent():
+    users, movies, ratings, movie_items = generate(200, 300, 10, seed=1)
+    assert len(set(zip(users.tolist(), movies.tolist()))) == len(ratings)
+    assert sum(item["vote_count"] for item in movie_items) == len(ratings)
+    # Long-tailed: the most rated movie is far above the median
+    counts = sorted(item["vote_count"] for item in movie_items)
+    assert counts[-1] > 5 * max(counts[len(counts) // 2], 1)
+
+def test_benchmark_runs_end_to_end(tmp_path):
+    out = tmp_path / "results.json"
+    env = dict(os.environ, AWS_DEFAULT_REGION="us-east-1")
+    subprocess.run(
+        [sys.executable, "scripts/benchmark_api.py", "--users", "80", "--movies", "120",
+         "--requests", "10", "--warmup", "2", "--concurrency", "2", "--json", str(out)],
+        cwd=BACKEND_DIR, env=env, check=True, capture_output=True, timeout=120,
+    )
+    results = json.loads(out.read_text())
+    assert set(results["scenarios"]) == {"recommendations", "search", "user_ratings", "rate"}
+    for scenario in results["scenarios"].values():
+        assert scenario["requests"] == 10 and scenario["errors"] == 0
+        assert 0 < scenario["p50_ms"] <= scenario["p99_ms"] and scenario["peak_rss_mb"] > 0
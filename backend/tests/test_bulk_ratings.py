@@ -0,0 +1,98 @@
+import os
+import pytest
+from decimal import Decimal
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import db
+import services.bulk_ratings as bulk_ratings
+from services.bulk_ratings import import_ratings
+from scripts.import_ratings import read_ratings
+
+def _create_tables(resource):
+    movies = resource.create_table(
+        TableName=db.MOVIES_TABLE_NAME,
+        KeySchema=[{"AttributeName": "movie_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "movie_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    ratings = resource.create_table(
+        TableName=db.RATINGS_TABLE_NAME,
+        KeySchema=[{"AttributeName": "user_id", "KeyType": "HASH"},
+                   {"AttributeName": "movie_id", "KeyType": "RANGE"}],
+        AttributeDefinitions=[{"AttributeName": "user_id", "AttributeType": "S"},
+                              {"AttributeName": "movie_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return movies, ratings
+
+def test_import_batches_writes_and_merges_aggregates(monkeypatch):
+    moto = pytest.importorskip("moto")
+    monkeypatch.setattr(db, "_dynamodb", None)
+    with moto.mock_aws():
+        movies, ratings = _create_tables(db.get_dynamodb())
+        for i in range(3):
+            movies.put_item(Item={"movie_id": f"m{i}", "vote_count": 0, "vote_total": Decimal(0)})
+        # An existing rating the import re-rates
+        ratings.put_item(Item={"user_id": "u0", "movie_id": "m0", "rating": Decimal(1), "timestamp": 0})
+        movies.put_item(Item={"movie_id": "m0", "vote_count": 1, "vote_total": Decimal(1)})
+
+        rows = [(f"u{u}", f"m{u % 3}", 1 + u % 5, 100) for u in range(60)]
+        rows.append(("u1", "m1", 5, 200))  # repeated pair: last one wins
+        before = db.client_stats()["dynamodb_requests"]
+        result = import_ratings(iter(rows), chunk_size=25)
+        requests = db.client_stats()["dynamodb_requests"] - before
+
+        assert result == {"ratings_written": 61, "movies_updated": 3}
+        # 3 chunks x (1 BatchGetItem + 1 BatchWriteItem) + 3 UpdateItems, not 3 calls per rating
+        assert requests == 9
+
+        stored = {}
+        for item in ratings.scan()["Items"]:
+            stored.setdefault(item["movie_id"], []).append(float(item["rating"]))
+        for movie_id, values in stored.items():
+            movie = movies.get_item(Key={"movie_id": movie_id})["Item"]
+            assert movie["vote_count"] == len(values)
+            assert float(movie["vote_total"]) == sum(values)
+        assert ratings.get_item(Key={"user_id": "u1", "movie_id": "m1"})["Item"]["rating"] == 5
+
+def test_failed_import_counts_written_ratings_and_keeps_its_error(monkeypatch):
+    moto = pytest.importorskip("moto")
+    monkeypatch.setattr(db, "_dynamodb", None)
+    with moto.mock_aws():
+        movies, ratings = _create_tables(db.get_dynamodb())
+
+        def rows():
+            # Movies missing from the catalog, then a broken source
+            for u in range(30):
+                yield (f"u{u}", "unknown", 4, 100)
+            raise ValueError("bad input")
+
+        with pytest.raises(ValueError, match="bad input"):
+            import_ratings(rows(), chunk_size=25)
+        # The first chunk was written and counted
+        movie = movies.get_item(Key={"movie_id": "unknown"})["Item"]
+        assert movie["vote_count"] == 25 and movie["vote_total"] == 100
+
+        # The aggregates failing as well does not hide the import's error
+        def broken(*args):
+            raise RuntimeError("throttled")
+        monkeypatch.setattr(bulk_ratings, "apply_vote_delta", broken)
+        with pytest.raises(ValueError, match="bad input"):
+            import_ratings(rows(), chunk_size=25)
+
+def test_read_ratings_formats():
+    movielens_csv = ["userId,movieId,rating,timestamp\n", "1,31,2.5,1260759144\n", "1,1029,3.0,1260759179\n"]
+    assert list(read_ratings(iter(movielens_csv), "movielens", user_prefix="ml-")) == [
+        ("ml-1", "31", 2.5, 1260759144), ("ml-1", "1029", 3.0, 1260759179),
+    ]
+
+    movielens_dat = ["1::1193::5::978300760\n", "2::661::3::978302109\n"]
+    assert list(read_ratings(iter(movielens_dat), "movielens")) == [
+        ("1", "1193", 5.0, 978300760), ("2", "661", 3.0, 978302109),
+    ]
+
+    history = ["movie_id,rating\n", "m1,4\n", "\n", "m2,oops\n", "m3,2\n"]
+    assert list(read_ratings(iter(history), user="uid")) == [
+        ("uid", "m1", 4.0, None), ("uid", "m3", 2.0, None),
+    ]
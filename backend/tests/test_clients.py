@@ -0,0 +1,53 @@
+import os
+import pytest
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import db
+
+def test_dynamodb_resource_is_shared_and_tuned(monkeypatch):
+    monkeypatch.setattr(db, "_dynamodb", None)
+    resource = db.get_dynamodb()
+    assert db.get_dynamodb() is resource
+    assert db.get_movies_table().meta.client is db.get_ratings_table().meta.client
+
+    config = resource.meta.client.meta.config
+    assert config.max_pool_connections == db.DYNAMODB_MAX_POOL
+    assert config.tcp_keepalive is True
+    assert config.retries["mode"] == "adaptive"
+    assert config.connect_timeout == db.DYNAMODB_CONNECT_TIMEOUT
+
+def test_dynamodb_requests_are_counted(monkeypatch):
+    moto = pytest.importorskip("moto")
+    monkeypatch.setattr(db, "_dynamodb", None)
+    with moto.mock_aws():
+        table = db.get_dynamodb().create_table(
+            TableName=db.MOVIES_TABLE_NAME,
+            KeySchema=[{"AttributeName": "movie_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "movie_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        before = db.client_stats()["dynamodb_requests"]
+        table.put_item(Item={"movie_id": "m1"})
+        db.get_movies_table().get_item(Key={"movie_id": "m1"})
+        stats = db.client_stats()
+    assert stats["dynamodb_requests"] - before == 2
+    assert stats["dynamodb_initialized"]
+
+def test_redis_clients_share_one_pool(monkeypatch):
+    pytest.importorskip("redis")
+    monkeypatch.setattr(db, "_redis_pool", None)
+    first, second = db.get_redis(), db.get_redis()
+    assert first.connection_pool is second.connection_pool
+    assert first.connection_pool.max_connections == db.REDIS_MAX_CONNECTIONS
+    assert db.client_stats()["redis_initialized"]
+
+def test_diagnostics_route_reports_client_stats():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    client = TestClient(app)
+    response = client.get("/diagnostics/clients", headers={"Authorization": "Bearer test-token"})
+    assert response.status_code == 200
+    assert "dynamodb_requests" in response.json()
+    assert client.get("/diagnostics/clients").status_code == 422
@@ -0,0 +1,132 @@
+import os
+import time
+import pytest
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import main
+import routers.metrics as metrics_route
+from services import metrics
+from services.aio import run_io
+from services.metrics import MetricsMiddleware, Registry, span, instrument_dynamodb, cache_samples
+
+def _app(handler):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    app.get("/items/{item_id}")(handler)
+    return TestClient(app)
+
+def _timings(response):
+    return {part.split(";")[0]: part for part in response.headers["Server-Timing"].split(", ")}
+
+def test_spans_reach_server_timing_and_histograms():
+    def hydrate():
+        with span("hydration"):
+            time.sleep(0.002)
+
+    async def handler(item_id: str):
+        with span("scoring"):
+            time.sleep(0.001)
+        await run_io(hydrate)  # spans on the I/O pool count towards the request
+        return {"id": item_id}
+
+    response = _app(handler).get("/items/42")
+    timings = _timings(response)
+    assert set(timings) == {"scoring", "hydration", "total"}
+    assert float(timings["hydration"].split("dur=")[1]) >= 2
+
+    text = metrics.render()
+    # Labelled with the route template, not the raw path
+    assert 'movie_recs_request_duration_seconds_count{method="GET",route="/items/{item_id}"}' in text
+    assert 'movie_recs_requests_total{method="GET",route="/items/{item_id}",status="200"}' in text
+    assert 'movie_recs_span_duration_seconds_bucket{span="hydration",le="+Inf"}' in text
+
+def test_dynamodb_calls_and_capacity_are_counted_per_request():
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    with moto.mock_aws():
+        client = boto3.client("dynamodb", region_name="us-east-1")
+        instrument_dynamodb(client)
+        client.create_table(
+            TableName="metrics-test", KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}], BillingMode="PAY_PER_REQUEST",
+        )
+
+        def write_and_read(item_id):
+            client.put_item(TableName="metrics-test", Item={"id": {"S": item_id}})
+            return client.get_item(TableName="metrics-test", Key={"id": {"S": item_id}})
+
+        async def handler(item_id: str):
+            response = await run_io(write_and_read, item_id)
+            return {"consumed": response["ConsumedCapacity"]["CapacityUnits"]}
+
+        response = _app(handler).get("/items/a")
+
+    # ReturnConsumedCapacity was added to the calls
+    assert response.json()["consumed"] > 0
+    assert '"2 calls ' in _timings(response)["dynamodb"]
+    text = metrics.render()
+    assert 'movie_recs_dynamodb_request_duration_seconds_count{operation="PutItem"}' in text
+    assert 'movie_recs_dynamodb_consumed_capacity_units_total{table="metrics-test"}' in text
+
+def test_exposition_format():
+    registry = Registry()
+    for value in (0.0005, 0.003, 0.2, 60):
+        registry.observe("span_duration_seconds", (("span", "scoring"),), value)
+    registry.register(lambda: cache_samples("a", {"hits": 3, "misses": 1, "hit_ratio": 0.75, "size": 2})
+                      + cache_samples("b", {"hits": 0, "misses": 2, "hit_ratio": 0.0, "size": 0}))
+    lines = registry.render().splitlines()
+
+    buckets = [line for line in lines if line.startswith("movie_recs_span_duration_seconds_bucket")]
+    values = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert values == sorted(values) and values[-1] == 4 and 'le="+Inf"' in buckets[-1]
+    assert 'movie_recs_span_duration_seconds_count{span="scoring"} 4' in lines
+    # One HELP/TYPE per family, its samples right after it
+    types = [line.split()[2] for line in lines if line.startswith("# TYPE")]
+    assert len(types) == len(set(types))
+    hits = [i for i, line in enumerate(lines) if line.startswith("movie_recs_cache_hits_total")]
+    assert hits == list(range(hits[0], hits[0] + 2))
+    assert 'movie_recs_cache_hit_ratio{cache="a"} 0.75' in lines
+
+def test_metrics_route(monkeypatch):
+    client = TestClient(main.app)
+    client.get("/")
+    # Off without a token
+    monkeypatch.setattr(metrics_route, "METRICS_TOKEN", None)
+    assert client.get("/metrics").status_code == 404
+
+    monkeypatch.setattr(metrics_route, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'movie_recs_requests_total{method="GET",route="/",status="200"}' in response.text
+    assert "movie_recs_client_stat" in response.text
+    assert "server-timing" in response.headers
+
+def test_model_metrics():
+    from test_recommendation_engine import make_engine
+    samples = {name: value for name, _, _, _, value in make_engine().metrics()}
+    assert 0 <= samples["model_age_seconds"] < 60
+    assert samples["model_ratings"] == 11 and samples["model_users"] == 4
+
+def test_spans_count_every_block_and_are_off_when_disabled(monkeypatch):
+    # Timing lives in scripts/benchmark_metrics.py; this checks what a span records
+    def count():
+        histogram = metrics.registry.histograms.get(("span_duration_seconds", (("span", "counted"),)))
+        return histogram.count if histogram else 0
+
+    before = count()
+    for _ in range(100):
+        with span("counted"):
+            pass
+    assert count() == before + 100
+
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    with span("counted"):
+        pass
+    assert count() == before + 100
@@ -0,0 +1,95 @@
+import os
+import time
+from decimal import Decimal
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from services.cache import TTLCache
+import services.movie_store as movie_store
+from services.vote_buffer import VoteBuffer
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+class FakeDynamo:
+    # batch_get_item that leaves every other key unprocessed on the first call
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self.calls = []
+
+    def batch_get_item(self, RequestItems):
+        keys = RequestItems[self.table_name]["Keys"]
+        self.calls.append(len(keys))
+        served, unprocessed = (keys[::2], keys[1::2]) if len(self.calls) == 1 else (keys, [])
+        items = [{"movie_id": k["movie_id"], "title": k["movie_id"], "genres": [], "year": 2000,
+                  "vote_count": Decimal(2), "vote_total": Decimal(7)} for k in served]
+        response = {"Responses": {self.table_name: items}}
+        if unprocessed:
+            response["UnprocessedKeys"] = {self.table_name: {"Keys": unprocessed}}
+        return response
+
+def test_get_movies_by_ids_batches_retries_and_caches(monkeypatch):
+    table_name = movie_store.get_movies_table().name
+    fake = FakeDynamo(table_name)
+    monkeypatch.setattr(movie_store, "get_dynamodb", lambda: fake)
+    monkeypatch.setattr(movie_store, "movie_cache", TTLCache(1000, 60))
+    monkeypatch.setattr(movie_store, "get_vote_buffer", lambda: VoteBuffer(None))
+    monkeypatch.setattr(movie_store.time, "sleep", lambda s: None)
+
+    ids = [f"m{i}" for i in range(150)]
+    movies = movie_store.get_movies_by_ids(ids)
+    assert set(movies) == set(ids)
+    assert movies["m0"].average_rating == 3.5
+    # 2 chunks (100 + 50), the first one retried for its unprocessed half
+    assert fake.calls == [100, 50, 50]
+
+    movie_store.get_movies_by_ids(ids[:10])
+    assert len(fake.calls) == 3
+    assert movie_store.movie_cache.stats()["hits"] == 10
+
+    movie_store.invalidate_movie("m0")
+    movie_store.get_movies_by_ids(["m0"])
+    assert fake.calls[-1] == 1
+
+def test_async_hydration_fetches_chunks_concurrently(monkeypatch):
+    import asyncio
+    import threading
+
+    class SlowDynamo:
+        # Every chunk waits at the barrier until all 5 are in flight; fetched
+        # one after another, the first one times out and the test fails
+        def __init__(self, table_name):
+            self.table_name = table_name
+            self.barrier = threading.Barrier(5, timeout=10)
+
+        def batch_get_item(self, RequestItems):
+            self.barrier.wait()
+            keys = RequestItems[self.table_name]["Keys"]
+            return {"Responses": {self.table_name: [
+                {"movie_id": k["movie_id"], "title": k["movie_id"], "genres": [], "year": 2000} for k in keys
+            ]}}
+
+    fake = SlowDynamo(movie_store.get_movies_table().name)
+    monkeypatch.setattr(movie_store, "get_dynamodb", lambda: fake)
+    monkeypatch.setattr(movie_store, "get_vote_buffer", lambda: VoteBuffer(None))
+    monkeypatch.setattr(movie_store, "movie_cache", TTLCache(1000, 60))
+
+    ids = [f"m{i}" for i in range(450)]
+    movies = asyncio.run(movie_store.get_movies_by_ids_async(ids))
+    assert set(movies) == set(ids)
+    # 5 chunks in flight together, not one after another
+    assert not fake.barrier.broken
@@ -0,0 +1,130 @@
+import os
+from decimal import Decimal
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from fastapi.testclient import TestClient
+import main
+import routers.movies as movies
+import routers.ratings as ratings
+import services.response_cache as response_cache
+from models import Movie
+from services.pagination import encode_cursor, decode_cursor
+
+client = TestClient(main.app)
+AUTH = {"Authorization": "Bearer test-token"}
+
+class PagedTable:
+    # Scan/Query over sorted items honoring Limit, ExclusiveStartKey and a
+    # small "1 MB" page when no Limit is given
+    def __init__(self, items, key, page_size=3):
+        self.items = sorted(items, key=lambda item: tuple(item[k] for k in key))
+        self.key = key
+        self.page_size = page_size
+        self.calls = []
+
+    def _page(self, kwargs):
+        self.calls.append(kwargs)
+        items = self.items
+        if "ExclusiveStartKey" in kwargs:
+            start = tuple(kwargs["ExclusiveStartKey"][k] for k in self.key)
+            items = [item for item in items if tuple(item[k] for k in self.key) > start]
+        size = kwargs.get("Limit", self.page_size)
+        page = items[:size]
+        response = {"Items": [dict(item) for item in page]}
+        if len(items) > size:
+            response["LastEvaluatedKey"] = {k: page[-1][k] for k in self.key}
+        return response
+
+    def scan(self, **kwargs):
+        return self._page(kwargs)
+
+    def query(self, **kwargs):
+        return self._page(kwargs)
+
+def test_cursor_round_trip_and_validation():
+    key = {"user_id": "u1", "movie_id": "m/42"}
+    cursor = encode_cursor(key)
+    assert "=" not in cursor and decode_cursor(cursor) == key
+    assert encode_cursor(None) is None and decode_cursor(None) is None
+    assert client.get("/movies/", params={"cursor": "not-a-cursor"}).status_code == 400
+
+def test_movie_listing_pages_through_the_table(monkeypatch):
+    table = PagedTable([
+        {"movie_id": f"m{i:02d}", "title": f"Movie {i}", "genres": ["Drama"], "year": 2000 + i,
+         "vote_count": Decimal(2), "vote_total": Decimal(7)}
+        for i in range(7)
+    ], ("movie_id",))
+    monkeypatch.setattr(movies, "get_movies_table", lambda: table)
+    monkeypatch.setattr(response_cache, "_cache", response_cache.ResponseCache())
+
+    seen, cursor = [], None
+    while True:
+        response = client.get("/movies/", params={"limit": 3, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        seen += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert [m["movie_id"] for m in seen] == [f"m{i:02d}" for i in range(7)]
+    assert seen[0]["average_rating"] == 3.5
+    assert table.calls[0]["ProjectionExpression"] == "movie_id, title, genres, #y, vote_count, vote_total"
+    assert len(table.calls) == 3
+
+def test_user_ratings_follow_every_query_page(monkeypatch):
+    table = PagedTable([
+        {"user_id": "test_user", "movie_id": f"m{i:02d}", "rating": Decimal(i % 5 + 1)} for i in range(8)
+    ], ("user_id", "movie_id"))
+    monkeypatch.setattr(ratings, "get_ratings_table", lambda: table)
+
+    async def hydrate(movie_ids):
+        return {mid: Movie(movie_id=mid, title=mid, genres=[], year=2000) for mid in movie_ids}
+
+    monkeypatch.setattr(ratings, "get_movies_by_ids_async", hydrate)
+
+    # No limit: all 8 ratings across 3 query pages (it used to stop after the first)
+    response = client.get("/ratings/", headers=AUTH)
+    assert [r["movie_id"] for r in response.json()] == [f"m{i:02d}" for i in range(8)]
+    assert response.json()[1]["my_rating"] == 2
+    assert "X-Next-Cursor" not in response.headers
+    assert len(table.calls) == 3
+    assert table.calls[0]["ProjectionExpression"] == "movie_id, rating"
+
+    # With a limit: one page and a cursor for the next
+    response = client.get("/ratings/", params={"limit": 5}, headers=AUTH)
+    assert len(response.json()) == 5
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get("/ratings/", params={"limit": 5, "cursor": cursor}, headers=AUTH)
+    assert [r["movie_id"] for r in response.json()] == ["m05", "m06", "m07"]
+    assert "X-Next-Cursor" not in response.headers
+
+    # Another user's cursor is rejected
+    other = encode_cursor({"user_id": "someone_else", "movie_id": "m01"})
+    assert client.get("/ratings/", params={"cursor": other}, headers=AUTH).status_code == 400
+
+def test_failing_page_does_not_produce_a_well_formed_partial_list(monkeypatch):
+    import json
+    import pytest
+
+    class FailingTable(PagedTable):
+        def query(self, **kwargs):
+            if "ExclusiveStartKey" in kwargs:
+                raise RuntimeError("throttled")
+            return self._page(kwargs)
+
+    table = FailingTable([
+        {"user_id": "test_user", "movie_id": f"m{i:02d}", "rating": Decimal(3)} for i in range(8)
+    ], ("user_id", "movie_id"))
+    monkeypatch.setattr(ratings, "get_ratings_table", lambda: table)
+
+    async def hydrate(movie_ids):
+        return {mid: Movie(movie_id=mid, title=mid, genres=[], year=2000) for mid in movie_ids}
+
+    monkeypatch.setattr(ratings, "get_movies_by_ids_async", hydrate)
+
+    # The first page was already sent when the second one fails
+    with pytest.raises(RuntimeError):
+        client.get("/ratings/", headers=AUTH)
+    response = TestClient(main.app, raise_server_exceptions=False).get("/ratings/", headers=AUTH)
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(response.text)
@@ -0,0 +1,108 @@
+import os
+import re
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import routers.ratings as ratings
+from routers.ratings import RatingRequest, rate_movie, delete_rating
+from services.vote_buffer import VoteBuffer
+
+class FakeTable:
+    # Item-level atomicity like DynamoDB: each call is atomic on its own, with
+    # a pause in the middle so unsynchronized read-modify-write would interleave
+    def __init__(self, key):
+        self.key = key
+        self.items = {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _key(self, item):
+        return tuple(item[k] for k in self.key)
+
+    def _record(self, name):
+        with self.lock:
+            self.calls.append(name)
+        time.sleep(0.001)
+
+    def put_item(self, Item, ReturnValues="NONE"):
+        self._record("put_item")
+        with self.lock:
+            old = self.items.get(self._key(Item))
+            self.items[self._key(Item)] = dict(Item)
+        return {"Attributes": old} if old and ReturnValues == "ALL_OLD" else {}
+
+    def delete_item(self, Key, ReturnValues="NONE"):
+        self._record("delete_item")
+        with self.lock:
+            old = self.items.pop(self._key(Key), None)
+        return {"Attributes": old} if old and ReturnValues == "ALL_OLD" else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues):
+        # SET a = if_not_exists(a, :zero) + :x, ... only
+        self._record("update_item")
+        with self.lock:
+            item = self.items.setdefault(self._key(Key), dict(Key))
+            for name, value in re.findall(r"(\w+) = if_not_exists\(\1, :zero\) \+ (:\w+)", UpdateExpression):
+                item[name] = item.get(name, 0) + ExpressionAttributeValues[value]
+        return {}
+
+def _patch(monkeypatch):
+    from services.recommendation_engine import engine
+
+    ratings_table = FakeTable(("user_id", "movie_id"))
+    movies_table = FakeTable(("movie_id",))
+    movies_table.items[("m1",)] = {"movie_id": "m1", "vote_count": 0, "vote_total": Decimal(0)}
+    monkeypatch.setattr(ratings, "get_ratings_table", lambda: ratings_table)
+    monkeypatch.setattr(ratings, "get_movies_table", lambda: movies_table)
+    monkeypatch.setattr(ratings, "invalidate_movie", lambda movie_id: None)
+    # No Redis: votes are written through, nothing cached to invalidate
+    monkeypatch.setattr(ratings, "get_vote_buffer", lambda: VoteBuffer(None))
+    monkeypatch.setattr(ratings, "invalidate_responses", lambda user_id, movie_ids: None)
+    monkeypatch.setattr(ratings, "get_results_store", lambda: type("Store", (), {"invalidate": lambda self, u: None})())
+    monkeypatch.setattr(engine, "record_rating", lambda *args: None)
+    monkeypatch.setattr(engine, "record_removal", lambda *args: None)
+    return ratings_table, movies_table
+
+def test_rating_writes_take_two_round_trips(monkeypatch):
+    ratings_table, movies_table = _patch(monkeypatch)
+    user = {"uid": "u1"}
+
+    asyncio.run(rate_movie(RatingRequest(movie_id="m1", rating=4), user=user))
+    asyncio.run(rate_movie(RatingRequest(movie_id="m1", rating=2), user=user))
+    asyncio.run(rate_movie(RatingRequest(movie_id="m1", rating=2), user=user))
+    assert ratings_table.calls.count("put_item") == 3
+    # the unchanged re-rate needs no aggregate update
+    assert movies_table.calls == ["update_item"] * 2
+    assert movies_table.items[("m1",)]["vote_count"] == 1
+    assert movies_table.items[("m1",)]["vote_total"] == 2
+
+    asyncio.run(delete_rating("m1", user=user))
+    assert ratings_table.calls[-1] == "delete_item"
+    assert movies_table.items[("m1",)]["vote_count"] == 0
+    assert movies_table.items[("m1",)]["vote_total"] == 0
+
+def test_concurrent_writes_keep_aggregates_consistent(monkeypatch):
+    ratings_table, movies_table = _patch(monkeypatch)
+
+    def write(i):
+        user = {"uid": f"u{i % 10}"}
+        if i % 7 == 6:
+            try:
+                asyncio.run(delete_rating("m1", user=user))
+            except Exception:
+                pass  # 404 when the rating is already gone
+        else:
+            asyncio.run(rate_movie(RatingRequest(movie_id="m1", rating=1 + i % 5), user=user))
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(write, range(300)))
+
+    stored = [float(item["rating"]) for item in ratings_table.items.values()]
+    movie = movies_table.items[("m1",)]
+    assert movie["vote_count"] == len(stored)
+    assert float(movie["vote_total"]) == sum(stored)
@@ -0,0 +1,728 @@
+import os
+import time
+import threading
+import numpy as np
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from services.sparse import CSRMatrix
+from services.rating_matrix import RatingMatrix
+from services.neighbors import NeighborIndex
+from services.popularity import PopularityIndex
+from services.snapshot import RatingsSnapshot
+from services.recommendation_engine import RecommendationEngine
+
+RATINGS = [
+    ("u1", "m1", 5.0), ("u1", "m2", 3.0), ("u1", "m3", 4.0),
+    ("u2", "m1", 4.5), ("u2", "m2", 2.0), ("u2", "m4", 5.0),
+    ("u3", "m3", 1.0), ("u3", "m4", 4.0), ("u3", "m5", 5.0),
+    ("u4", "m1", 5.0), ("u4", "m5", 4.5),
+]
+
+def build_matrix(ratings=RATINGS, **kwargs):
+    users, movies, values = zip(*ratings)
+    return RatingMatrix.from_ratings(users, movies, values, **kwargs)
+
+def dense(matrix):
+    return matrix.by_user.to_dense().astype(np.float64)
+
+def test_csr_last_write_wins():
+    csr = CSRMatrix.from_coo([0, 0, 1], [1, 1, 0], [2.0, 4.0, 3.0], (2, 2))
+    assert csr.nnz == 2
+    assert csr.to_dense().tolist() == [[0.0, 4.0], [3.0, 0.0]]
+
+def test_matrix_matches_dense_pivot():
+    matrix = build_matrix()
+    values = dense(matrix)
+    for user, movie, rating in RATINGS:
+        assert values[matrix.user_index[user], matrix.movie_index[movie]] == rating
+    assert matrix.nnz == len(RATINGS)
+    assert np.allclose(matrix.by_movie.to_dense(), values.T)
+
+def test_user_similarities_match_dense_cosine():
+    matrix = build_matrix()
+    values = dense(matrix)
+    normalized = values / np.linalg.norm(values, axis=1, keepdims=True)
+    expected = normalized @ normalized.T
+    for i in range(matrix.shape[0]):
+        assert np.allclose(matrix.user_similarities(i), expected[i], atol=1e-6)
+
+def test_memory_is_reported_and_bounded():
+    matrix = build_matrix()
+    usage = matrix.memory_usage()
+    assert usage["nnz"] == len(RATINGS)
+    assert usage["total_bytes"] > 0
+    try:
+        build_matrix(max_bytes=64)
+        assert False, "expected MemoryError"
+    except MemoryError:
+        pass
+
+def random_ratings(n_users=60, n_movies=40, density=0.2, seed=0):
+    rng = np.random.default_rng(seed)
+    mask = rng.random((n_users, n_movies)) < density
+    users, movies = np.nonzero(mask)
+    values = rng.integers(1, 11, size=len(users)) / 2.0
+    return [(f"u{u}", f"m{m}", float(v)) for u, m, v in zip(users, movies, values)]
+
+def test_neighbor_index_matches_exact_top_k():
+    matrix = build_matrix(random_ratings())
+    values = dense(matrix)
+    norms = np.linalg.norm(values, axis=1, keepdims=True)
+    norms[norms == 0] = 1e-10
+    expected = (values / norms) @ (values / norms).T
+    np.fill_diagonal(expected, -np.inf)
+
+    index = NeighborIndex.for_ratings(matrix, k=5, block_size=7)
+    for i in range(matrix.shape[0]):
+        neighbors, scores = index.lookup(i)
+        assert i not in neighbors
+        assert np.allclose(scores, np.sort(expected[i])[::-1][:len(scores)], atol=1e-5)
+        assert np.allclose(expected[i][neighbors], scores, atol=1e-5)
+
+def test_neighbor_index_blocked_equals_full():
+    matrix = build_matrix(random_ratings(seed=1))
+    blocked = NeighborIndex.for_ratings(matrix, k=8, block_size=5)
+    full = NeighborIndex.for_ratings(matrix, k=8, block_size=0)
+    assert blocked.neighbors.dtype == np.int32 and blocked.scores.dtype == np.float32
+    assert np.array_equal(blocked.neighbors, full.neighbors)
+    assert np.allclose(blocked.scores, full.scores)
+
+def test_popularity_uses_damped_mean_and_min_votes():
+    ratings = [("a", "one_hit", 5.0), ("b", "one_hit", 5.0)]
+    ratings += [(f"u{i}", "classic", 4.5) for i in range(50)]
+    ratings += [(f"u{i}", "average", 3.0) for i in range(50)]
+    popularity = PopularityIndex.from_matrix(build_matrix(ratings), min_votes=1)
+    assert popularity.top(3) == ["classic", "one_hit", "average"]
+    popularity = PopularityIndex.from_matrix(build_matrix(ratings), min_votes=3)
+    assert popularity.top(3) == ["classic", "average"]
+
+def test_popularity_by_genre_and_year():
+    ratings = [(f"u{i}", m, r) for i in range(5) for m, r in (("m1", 5.0), ("m2", 4.0), ("m3", 3.0))]
+    metadata = {
+        "m1": {"genres": ["Drama"], "year": 1999},
+        "m2": {"genres": ["Comedy", "Drama"], "year": 2001},
+        "m3": {"genres": ["Comedy"], "year": 2001},
+    }
+    popularity = PopularityIndex.from_matrix(build_matrix(ratings))
+    assert popularity.top(5, genre="comedy", metadata=metadata) == ["m2", "m3"]
+    assert popularity.top(5, year=2001, metadata=metadata) == ["m2", "m3"]
+    assert popularity.top(5, genre="Drama", year=1999, metadata=metadata) == ["m1"]
+
+    # Without a catalog nothing matches, and that is not remembered
+    popularity = PopularityIndex.from_matrix(build_matrix(ratings))
+    assert popularity.top(5, genre="comedy", metadata={}) == []
+    assert popularity.top(5, genre="comedy", metadata=metadata) == ["m2", "m3"]
+    # One entry per client filter, up to a fixed number
+    popularity._segments.maxsize = 3
+    for year in range(1900, 1950):
+        assert popularity.top(5, year=year, metadata=metadata) == []
+    assert len(popularity._segments) == 3
+
+def make_engine(ratings=RATINGS):
+    engine = RecommendationEngine()
+    engine._load_snapshot(RatingsSnapshot.from_columns(*zip(*ratings)))
+    # Skip DynamoDB hydration, return the ids
+    engine._get_movie_details = lambda movie_ids: list(movie_ids)
+    return engine
+
+def test_engine_reuses_matrix_between_requests():
+    engine = make_engine()
+    matrix = engine.matrix
+    engine.get_recommendations("u1", 3)
+    engine.get_recommendations("u2", 3)
+    assert engine.matrix is matrix
+
+def test_engine_recommends_unwatched_movies():
+    engine = make_engine()
+    recs = engine.get_recommendations("u1", 3)
+    assert recs
+    assert not set(recs) & {"m1", "m2", "m3"}
+
+def test_incremental_updates_match_rebuild():
+    ratings = random_ratings(seed=2)
+    matrix = build_matrix(ratings)
+    index = NeighborIndex.for_ratings(matrix, k=6)
+
+    changes = [("u3", "m7", 5.0), ("u3", "m8", 1.0), ("u10", "m7", 4.0), ("new_user", "m7", 5.0), ("u5", "new_movie", 3.0)]
+    for user, movie, rating in changes:
+        idx = matrix.set_rating(user, movie, rating)
+        index.update(idx, *matrix.similar_users(idx), matrix.shape[0])
+    removed = matrix.remove_rating(*ratings[0][:2])
+    index.update(removed, *matrix.similar_users(removed), matrix.shape[0])
+
+    rebuilt = build_matrix(
+        [r for r in ratings if r[:2] != ratings[0][:2] and r[:2] not in {c[:2] for c in changes}] + changes
+    )
+    compacted = matrix.compact()
+    for user in rebuilt.user_ids:
+        i, j = compacted.user_index[user], rebuilt.user_index[user]
+        movies_a, values_a = compacted.user_row(i)
+        movies_b, values_b = rebuilt.user_row(j)
+        assert [compacted.movie_ids[m] for m in movies_a] == [rebuilt.movie_ids[m] for m in movies_b]
+        assert np.allclose(values_a, values_b)
+        assert np.isclose(matrix.norms[i], rebuilt.norms[j])
+
+    # Updated users get an exact neighbor list, every listed score stays exact
+    exact = NeighborIndex.for_ratings(compacted, k=6)
+    for user in ("u3", "u10", "new_user", "u5"):
+        idx = matrix.user_index[user]
+        assert np.array_equal(index.lookup(idx)[0], exact.lookup(idx)[0])
+    for i in range(matrix.shape[0]):
+        neighbors, scores = index.lookup(i)
+        assert np.allclose(matrix.user_similarities(i)[neighbors], scores, atol=1e-5)
+
+def test_engine_applies_rating_deltas_without_refetch():
+    engine = make_engine()
+    last_fetch = engine.last_fetch
+    engine.record_rating("u5", "m1", 5.0)
+    engine.record_rating("u5", "m4", 5.0)
+    recs = engine.get_recommendations("u5", 3)
+    assert engine.last_fetch == last_fetch
+    assert "u5" in engine.matrix.user_index
+    assert recs and not set(recs) & {"m1", "m4"}
+
+    engine.record_removal("u5", "m1")
+    engine.record_removal("u5", "m4")
+    engine.get_recommendations("u5", 3)
+    assert len(engine.matrix.user_row(engine.matrix.user_index["u5"])[0]) == 0
+
+def test_rating_deltas_never_change_a_model_being_scored():
+    engine = make_engine(random_ratings(n_users=80, n_movies=50, seed=4))
+    matrix, neighbors = engine.matrix, engine.neighbors
+    shape, lists = matrix.shape, neighbors.neighbors.copy()
+    engine.record_rating("newcomer", "new_movie", 5.0)
+    engine.record_rating("u1", "m2", 1.0)
+    engine._apply_deltas()
+    # The previous model is left as it was, the new one has the deltas
+    assert matrix.shape == shape and matrix.find_user("newcomer") is None
+    assert np.array_equal(neighbors.neighbors, lists)
+    assert engine.matrix.shape == (shape[0] + 1, shape[1] + 1)
+
+    errors, done = [], threading.Event()
+    users = list(matrix.user_ids)
+
+    def score():
+        try:
+            while not done.is_set():
+                engine.recommend_many(users, k=5)
+                engine.recommend_many(users[:10], k=5, mode="item")
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=score) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    # New users and movies grow the matrix while the readers score
+    for i in range(200):
+        engine.record_rating(f"new{i}", f"new_movie{i}", 4.0)
+        engine.record_rating(users[i % len(users)], f"new_movie{i}", 3.0)
+        engine._apply_deltas()
+    done.set()
+    for reader in readers:
+        reader.join()
+    assert not errors
+    assert engine.matrix.shape[1] == shape[1] + 201
+
+def test_rating_deltas_only_touch_related_rows():
+    engine = make_engine(random_ratings(n_users=80, n_movies=50, seed=9))
+    neighbors = engine.neighbors
+    built = neighbors.neighbors.copy()
+    engine.record_rating("u1", "m2", 1.0)
+    engine._apply_deltas()
+    # The built arrays are shared, not copied; the changed lists are u1's own
+    # and the lists it is (or now gets) in
+    updated = engine.neighbors
+    assert updated.neighbors is neighbors.neighbors and np.array_equal(updated.neighbors, built)
+    idx = engine.matrix.find_user("u1")
+    users, _ = engine.matrix.similar_users(idx)
+    assert set(updated.row_overrides) <= {idx} | set(users.tolist())
+    assert len(updated.row_overrides) < engine.matrix.shape[0]
+
+    exact = NeighborIndex.for_ratings(engine.matrix.compact())
+    assert np.array_equal(updated.lookup(idx)[0], exact.lookup(idx)[0])
+    assert np.array_equal(updated.fold().neighbors[idx], exact.neighbors[idx])
+
+def test_compaction_runs_off_the_request_path(monkeypatch):
+    import services.recommendation_engine as recommendation_engine
+    monkeypatch.setattr(recommendation_engine, "MAX_OVERRIDE_ROWS", 2)
+    engine = make_engine(random_ratings(n_users=60, n_movies=40, seed=10))
+    started, release = threading.Event(), threading.Event()
+    for_ratings = NeighborIndex.for_ratings
+
+    def slow_for_ratings(matrix, **kwargs):
+        started.set()
+        assert release.wait(10)
+        return for_ratings(matrix, **kwargs)
+
+    monkeypatch.setattr(recommendation_engine.NeighborIndex, "for_ratings", slow_for_ratings)
+    for user in ("u1", "u2", "u3"):
+        engine.record_rating(user, "m1", 5.0)
+    engine.recommend_many(["u1"], 5)
+    # The request returned while the compaction is still building
+    assert started.wait(10) and not release.is_set()
+    assert len(engine.matrix.row_overrides) == 3
+
+    # Deltas applied meanwhile are kept through the swap
+    engine.record_rating("u4", "m2", 1.0)
+    engine.record_rating("late_user", "m3", 4.0)
+    engine.recommend_many(["late_user"], 5)
+    release.set()
+    engine.compact_thread.join(10)
+    assert engine.compact_deltas is None and not engine.refresh_lock.locked()
+
+    matrix = engine.matrix
+    assert set(matrix.row_overrides) == {matrix.find_user("u4"), matrix.find_user("late_user")}
+    for user, movie, rating in (("u1", "m1", 5.0), ("u4", "m2", 1.0), ("late_user", "m3", 4.0)):
+        movies, values = matrix.user_row(matrix.find_user(user))
+        assert rating in values[movies == matrix.find_movie(movie)]
+    exact = NeighborIndex.for_ratings(matrix.compact())
+    for user in ("u1", "u4", "late_user"):
+        idx = matrix.find_user(user)
+        assert np.array_equal(engine.neighbors.lookup(idx)[0], exact.lookup(idx)[0])
+
+def test_scoring_matches_dense_weighted_sum():
+    engine = make_engine(random_ratings(n_users=80, n_movies=400, density=0.1, seed=3))
+    matrix = engine.matrix
+    values = dense(matrix)
+    for user_idx in (0, 17, 42):
+        neighbors, sims = engine.neighbors.lookup(user_idx)
+        expected = sims.astype(np.float64) @ values[neighbors]
+        expected[values[user_idx] > 0] = -np.inf
+        order = np.lexsort((np.arange(len(expected)), -expected))
+        expected_ids = [matrix.movie_ids[j] for j in order if expected[j] > 0][:250]
+
+        ranked = engine.recommend(user_idx, 250)
+        assert [movie for movie, _ in ranked] == expected_ids
+        scores = [score for _, score in ranked]
+        assert scores == sorted(scores, reverse=True)
+        assert engine.recommend(user_idx, 250) == ranked
+
+def test_batch_scoring_matches_single_user():
+    engine = make_engine(random_ratings(n_users=70, n_movies=120, density=0.15, seed=4))
+    engine.record_rating("u3", "m5", 5.0)
+    engine.record_rating("brand_new", "m7", 4.0)
+    users = ["u1", "u3", "nobody", "brand_new", "u50"]
+    batch = engine.recommend_many(users, 10)
+    for user in users:
+        assert batch[user] == engine.recommend_many([user], 10)[user]
+    assert batch["nobody"] == engine._popular_scores(10)
+
+def test_precompute_workers_score_from_shared_memory():
+    import scripts.precompute_recommendations as job
+    from services.scoring import score_users, score_users_by_items
+
+    engine = make_engine(random_ratings(seed=5))
+    csr = engine.matrix.by_user
+    for mode, table, scorer in (
+        ("user", engine.neighbors, score_users),
+        ("item", engine._get_item_neighbors(), score_users_by_items),
+    ):
+        shared = [job.share_array(a) for a in (csr.indptr, csr.indices, csr.data, table.neighbors, table.scores)]
+        try:
+            job._init_worker([spec for _, spec in shared], csr.shape, mode)
+            top, scores = job._score_chunk(list(range(10)), 5)
+            expected_top, expected_scores = scorer(csr, table, list(range(10)), 5)
+            assert np.array_equal(top, expected_top) and np.allclose(scores, expected_scores)
+        finally:
+            for shm in job._attached:
+                shm.close()
+            job._attached.clear()
+            for shm, _ in shared:
+                shm.close()
+                shm.unlink()
+
+def test_precomputed_results_are_served_for_their_mode_only(monkeypatch):
+    import services.recommendation_engine as recommendation_engine
+    from services.results_store import ResultsStore
+
+    store = ResultsStore(None)
+    monkeypatch.setattr(recommendation_engine, "get_results_store", lambda: store)
+    engine = make_engine()
+    store.put_many({"u1": [("m9", 9.0), ("m8", 8.0)]}, mode="item")
+    assert engine.get_recommendations("u1", 2, mode="item") == ["m9", "m8"]
+    assert engine.get_recommendations("u1", 2, mode="user") == [m for m, _ in engine.recommend_many(["u1"], 2)["u1"]]
+    # Lists stored before the mode was recorded are not served
+    store.local["u1"] = [("m9", 9.0), ("m8", 8.0)]
+    assert store.get("u1", "item") is None
+
+def test_batch_endpoint_saves_results_and_caps_users(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    import services.recommendation_engine as recommendation_engine
+    import services.results_store as results_store
+    from auth import get_current_user
+    from routers import recommendations
+
+    engine = make_engine()
+    store = results_store.ResultsStore(None)
+    monkeypatch.setattr(recommendation_engine, "engine", engine)
+    monkeypatch.setattr(results_store, "_store", store)
+    monkeypatch.setattr(recommendations, "BATCH_MAX_USERS", 3)
+    app = FastAPI()
+    app.include_router(recommendations.router)
+    app.dependency_overrides[get_current_user] = lambda: {"uid": "job"}
+    client = TestClient(app)
+
+    response = client.post("/recommendations/batch", json={"user_ids": ["u1", "u2"], "num_recommendations": 2, "mode": "item"})
+    assert response.status_code == 200
+    ranked = [(m["movie_id"], m["score"]) for m in response.json()["u1"]]
+    assert store.get("u1", "item") == ranked and store.get("u1", "user") is None
+    assert store.get("u2", "item") is not None
+
+    response = client.post("/recommendations/batch", json={"user_ids": ["u1", "u2", "u3", "u4"]})
+    assert response.status_code == 413
+
+def test_users_with_nothing_to_score_get_no_recommendations():
+    from services.scoring import score_users, score_users_by_items
+    matrix = build_matrix()
+    # No neighbors / no similar movies at all
+    empty = NeighborIndex(np.full((5, 3), -1, dtype=np.int32), np.zeros((5, 3), dtype=np.float32))
+    for scorer in (score_users, score_users_by_items):
+        top, scores = scorer(matrix.by_user, empty, [0, 1], 2)
+        assert (top == -1).all() and (scores == 0).all()
+
+def test_item_neighbors_respect_min_support():
+    matrix = build_matrix(random_ratings(n_users=50, n_movies=30, density=0.3, seed=6))
+    values = dense(matrix).T
+    support = (values > 0).astype(int) @ (values > 0).T.astype(int)
+    norms = np.linalg.norm(values, axis=1, keepdims=True)
+    expected = (values / norms) @ (values / norms).T
+    expected[support < 4] = 0
+    np.fill_diagonal(expected, -np.inf)
+
+    table = NeighborIndex.for_items(matrix, k=5, block_size=7, min_support=4)
+    for j in range(matrix.shape[1]):
+        neighbors, scores = table.lookup(j)
+        assert (support[j, neighbors] >= 4).all()
+        assert np.allclose(scores, np.sort(expected[j])[::-1][:len(scores)], atol=1e-5)
+
+def test_item_mode_matches_dense_item_scores(tmp_path):
+    engine = make_engine(random_ratings(n_users=60, n_movies=50, density=0.2, seed=7))
+    matrix = engine.matrix
+    table = engine._get_item_neighbors()
+    values = dense(matrix)
+    sims = np.zeros((matrix.shape[1], matrix.shape[1]))
+    for j in range(matrix.shape[1]):
+        neighbors, scores = table.lookup(j)
+        sims[j, neighbors] = scores
+    for user_idx in (0, 9, 33):
+        expected = values[user_idx] @ sims
+        expected[values[user_idx] > 0] = -np.inf
+        order = np.lexsort((np.arange(len(expected)), -expected))
+        expected_ids = [matrix.movie_ids[j] for j in order if expected[j] > 0][:10]
+        assert [m for m, _ in engine.recommend(user_idx, 10, mode="item")] == expected_ids
+
+    # A saved table is remapped onto the current movie index
+    path = str(tmp_path / "items.npz")
+    table.save(path, matrix.movie_ids)
+    reversed_index = {mid: i for i, mid in enumerate(reversed(matrix.movie_ids))}
+    loaded = NeighborIndex.load(path, reversed_index)
+    n = len(matrix.movie_ids)
+    for j in range(n):
+        neighbors, scores = table.lookup(j)
+        loaded_neighbors, loaded_scores = loaded.lookup(n - 1 - j)
+        assert sorted((n - 1 - neighbors).tolist()) == sorted(loaded_neighbors.tolist())
+        assert np.allclose(sorted(scores), sorted(loaded_scores))
+
+def test_als_half_step_matches_per_row_least_squares(monkeypatch):
+    import services.factorization as factorization
+    # Force several blocks
+    monkeypatch.setattr(factorization, "_BLOCK_BYTES", 8 * 4 * 4 * 7)
+    matrix = build_matrix(random_ratings(n_users=30, n_movies=20, density=0.3, seed=8))
+    values = dense(matrix)
+    items = np.random.default_rng(1).standard_normal((20, 4)).astype(np.float32)
+    csr = matrix.by_user
+
+    users = factorization.solve_rows(csr.indptr, csr.indices, csr.data, items, 0.1)
+    implicit = factorization.solve_rows(csr.indptr, csr.indices, csr.data, items, 0.1, implicit=True, alpha=2.0)
+    Y = items.astype(np.float64)
+    for u in range(30):
+        rated = values[u] > 0
+        A = Y[rated].T @ Y[rated] + 0.1 * max(rated.sum(), 1) * np.eye(4)
+        assert np.allclose(users[u], np.linalg.solve(A, Y[rated].T @ values[u, rated]), atol=1e-4)
+
+        c = 1 + 2.0 * values[u]
+        A = Y.T @ (c[:, None] * Y) + 0.1 * np.eye(4)
+        assert np.allclose(implicit[u], np.linalg.solve(A, Y.T @ (c * rated)), atol=1e-4)
+
+def test_als_mode_serves_factor_scores_and_folds_in_new_users(tmp_path, monkeypatch):
+    import services.recommendation_engine as recommendation_engine
+    from services.factorization import FactorModel
+
+    engine = make_engine(random_ratings(n_users=40, n_movies=30, density=0.3, seed=9))
+    matrix = engine.matrix
+    model = FactorModel.train(matrix, factors=8, reg=0.1, iterations=15)
+    predicted = model.user_factors[matrix.by_user.row_ids()] * model.item_factors[matrix.by_user.indices]
+    assert np.sqrt(np.mean((predicted.sum(axis=1) - matrix.by_user.data) ** 2)) < 1.0
+
+    path = str(tmp_path / "factors.npz")
+    model.save(path)
+    monkeypatch.setattr(recommendation_engine, "ALS_FACTORS_PATH", path)
+    loaded = FactorModel.load(path)
+    assert loaded.user_factors.dtype == np.float32
+    assert np.array_equal(loaded.item_factors, model.item_factors)
+
+    values = dense(matrix)
+    scores = model.user_factors @ model.item_factors.T
+    for user_idx in (0, 13, 27):
+        expected = scores[user_idx].astype(np.float64)
+        expected[values[user_idx] > 0] = -np.inf
+        order = np.lexsort((np.arange(len(expected)), -expected))
+        expected_ids = [model.movie_ids[j] for j in order if expected[j] > 0][:5]
+        assert [m for m, _ in engine.recommend(user_idx, 5, mode="als")] == expected_ids
+
+    # A user who rated after training is folded in against the fixed item factors
+    engine.record_rating("new", matrix.movie_ids[0], 5.0)
+    engine.record_rating("new", matrix.movie_ids[1], 1.0)
+    recs = engine.recommend_many(["new"], 5, mode="als")["new"]
+    assert recs and not {m for m, _ in recs} & set(matrix.movie_ids[:2])
+    Y = model.item_factors[:2].astype(np.float64)
+    vector = np.linalg.solve(Y.T @ Y + 0.1 * 2 * np.eye(8), Y.T @ np.array([5.0, 1.0]))
+    assert np.isclose(recs[0][1], (model.item_factors @ vector).max(where=np.arange(30) >= 2, initial=-np.inf), atol=1e-3)
+
+def test_ivf_search_with_every_list_probed_is_exact():
+    from services.ann import IVFIndex, normalize_rows
+    vectors = normalize_rows(np.random.default_rng(10).standard_normal((300, 16)))
+    index = IVFIndex.build(vectors, n_lists=12)
+    assert sorted(index.order.tolist()) == list(range(300))
+
+    queries = np.arange(0, 300, 7)
+    top, scores = index.search(vectors[queries], 10, nprobe=12, exclude=queries)
+    sims = vectors[queries] @ vectors.T
+    sims[np.arange(len(queries)), queries] = -np.inf
+    expected = np.argsort(-sims, axis=1, kind='stable')[:, :10]
+    assert np.array_equal(top, expected)
+    assert np.allclose(scores, np.take_along_axis(sims, expected, axis=1), atol=1e-5)
+
+def test_approximate_neighbors_match_exact_when_search_is_exhaustive():
+    matrix = build_matrix(random_ratings(n_users=80, n_movies=40, density=0.2, seed=11))
+    exact = NeighborIndex.for_ratings(matrix, k=5)
+    approx = NeighborIndex.build_approximate(matrix.by_user, matrix.norms, k=5, block_size=16, nprobe=100, candidates=100)
+    assert np.array_equal(approx.neighbors, exact.neighbors)
+    assert np.allclose(approx.scores, exact.scores, atol=1e-5)
+
+    exact_items = NeighborIndex.for_items(matrix, k=5, min_support=2)
+    approx_items = NeighborIndex.build_approximate(
+        matrix.by_movie, matrix.by_movie.row_norms(), k=5, min_support=2, nprobe=100, candidates=100,
+    )
+    assert np.array_equal(approx_items.neighbors, exact_items.neighbors)
+
+def test_ann_recall_on_clustered_ratings():
+    from services.ann import CosineANN, recall_at_k
+    rng = np.random.default_rng(12)
+    ratings = []
+    for u in range(400):
+        cluster = u % 8
+        movies = rng.choice(np.arange(cluster * 25, cluster * 25 + 25), 10, replace=False)
+        ratings += [(f"u{u}", f"m{m:03d}", float(rng.integers(1, 6))) for m in movies]
+    matrix = build_matrix(ratings)
+    exact = NeighborIndex.for_ratings(matrix, k=10)
+
+    ann = CosineANN.for_users(matrix, n_lists=8)
+    approx, _ = ann.query(np.arange(400), 10, nprobe=2)
+    assert recall_at_k(exact.neighbors, approx) > 0.9
+
+def test_async_recommendations_match_sync():
+    import asyncio
+    engine = make_engine(random_ratings(n_users=30, n_movies=25, density=0.3, seed=13))
+
+    async def details(movie_ids):
+        return list(movie_ids)
+    engine._get_movie_details_async = details
+
+    for user_id in ("u0", "u7", "nobody"):
+        expected = engine.get_recommendations(user_id, 5)
+        assert asyncio.run(engine.get_recommendations_async(user_id, 5)) == expected
+    assert asyncio.run(engine.get_popular_async(3)) == engine.get_popular(3)
+
+class LockRedis:
+    # The few commands the refresh coordinator uses, on plain dicts
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value.encode() if isinstance(value, str) else value
+            return True
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def exists(self, key):
+        self.polls = getattr(self, "polls", 0) + 1
+        return int(key in self.data)
+
+    def pexpire(self, key, ms):
+        self.renewals = getattr(self, "renewals", 0) + 1
+        return int(key in self.data)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+def _refresh_setup(monkeypatch, tmp_path, ratings, redis=None):
+    # DynamoDB scans count their calls and block until `release` is set;
+    # `finished` counts the ones that returned
+    import services.recommendation_engine as recommendation_engine
+
+    scans, finished, release = [], [], threading.Event()
+    release.set()
+
+    def scan(table, names, **kwargs):
+        scans.append(time.time())
+        release.wait(30)
+        finished.append(time.time())
+        users, movies, values = zip(*ratings)
+        return {"user_id": list(users), "movie_id": list(movies), "rating": list(values)}
+
+    def no_redis():
+        raise ConnectionError("no redis")
+
+    monkeypatch.setattr(recommendation_engine, "parallel_scan", scan)
+    monkeypatch.setattr(recommendation_engine, "get_ratings_table", lambda: None)
+    monkeypatch.setattr(recommendation_engine, "get_redis", (lambda: redis) if redis else no_redis)
+    monkeypatch.setattr(recommendation_engine, "SNAPSHOT_PATH", str(tmp_path / "snapshot.bin"))
+    monkeypatch.setattr(recommendation_engine, "MODEL_REFRESH_POLL", 0.01)
+    return scans, finished, release
+
+def test_stale_model_is_served_while_one_worker_rebuilds_it(monkeypatch, tmp_path):
+    fresh = RATINGS + [("u5", "m1", 5.0), ("u5", "m2", 4.0)]
+    scans, finished, release = _refresh_setup(monkeypatch, tmp_path, fresh)
+    engine = make_engine()
+    old_matrix = engine.matrix
+    engine.last_fetch = time.time() - 7200
+    release.clear()
+
+    # Every request during the rebuild answers from the old model, without
+    # waiting: they all return while the scan is still held back
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(engine.get_recommendations("u1", 3))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert finished == []
+    assert len(results) == 8 and all(r == results[0] for r in results)
+    while not scans and engine.refresh_thread.is_alive():
+        time.sleep(0.01)
+    assert engine.matrix is old_matrix and len(scans) == 1
+
+    release.set()
+    engine.refresh_thread.join(5)
+    assert engine.matrix is not old_matrix and "u5" in engine.matrix.user_index
+    assert time.time() - engine.last_fetch < 5
+    engine.get_recommendations("u1", 3)
+    assert len(scans) == 1
+
+def test_cold_containers_wait_for_the_lock_holders_snapshot(monkeypatch, tmp_path):
+    import services.recommendation_engine as recommendation_engine
+
+    redis = LockRedis()
+    scans, _, _ = _refresh_setup(monkeypatch, tmp_path, RATINGS, redis)
+    # Another container is scanning; it publishes its snapshot and unlocks
+    redis.set(recommendation_engine.REFRESH_LOCK_KEY, "other", nx=True)
+
+    def publish():
+        time.sleep(0.1)
+        RatingsSnapshot.from_columns(*zip(*RATINGS)).to_redis(redis)
+        redis.delete(recommendation_engine.REFRESH_LOCK_KEY)
+
+    threading.Thread(target=publish).start()
+    engine = RecommendationEngine()
+    engine._fetch_data()
+    assert scans == [] and engine.matrix.nnz == len(RATINGS)
+
+    # Stale, and this time the holder never publishes: the background worker
+    # gives up without scanning and the old model stays
+    monkeypatch.setattr(recommendation_engine, "MODEL_REFRESH_WAIT", 0.1)
+    os.remove(tmp_path / "snapshot.bin")
+    redis.delete("ratings_snapshot")
+    redis.set(recommendation_engine.REFRESH_LOCK_KEY, "other", nx=True)
+    engine.last_fetch = 0
+    engine.snapshot.created_at = time.time() - 7200
+    matrix = engine.matrix
+    assert engine.refresh_in_background()
+    engine.refresh_thread.join(5)
+    assert scans == [] and engine.matrix is matrix
+    assert not engine.refresh_in_background()
+
+    # Lock free: this container scans, publishes and unlocks
+    redis.delete(recommendation_engine.REFRESH_LOCK_KEY)
+    engine.refresh_failed_at = 0
+    assert engine.refresh_in_background()
+    engine.refresh_thread.join(5)
+    assert len(scans) == 1 and engine.matrix is not matrix
+    assert redis.exists(recommendation_engine.REFRESH_LOCK_KEY) == 0
+    assert RatingsSnapshot.from_redis(redis).created_at == engine.snapshot.created_at
+
+def test_refresh_lock_is_renewed_while_the_holder_scans(monkeypatch, tmp_path):
+    import services.recommendation_engine as recommendation_engine
+
+    redis = LockRedis()
+    scans, _, release = _refresh_setup(monkeypatch, tmp_path, RATINGS, redis)
+    monkeypatch.setattr(recommendation_engine, "MODEL_REFRESH_LOCK_MS", 30)
+    release.clear()
+    engine = RecommendationEngine()
+    worker = threading.Thread(target=engine._fetch_data)
+    worker.start()
+    while getattr(redis, "renewals", 0) < 3 and worker.is_alive():
+        time.sleep(0.01)
+    assert redis.exists(recommendation_engine.REFRESH_LOCK_KEY) == 1
+
+    release.set()
+    worker.join(5)
+    renewals = redis.renewals
+    time.sleep(0.05)
+    # Released with the scan, and no longer renewed
+    assert redis.exists(recommendation_engine.REFRESH_LOCK_KEY) == 0
+    assert redis.renewals == renewals and len(scans) == 1
+
+def test_cold_container_wait_fits_in_the_invocation(monkeypatch, tmp_path):
+    import services.recommendation_engine as recommendation_engine
+    from services.deadline import invocation_deadline
+
+    class LambdaContext:
+        def get_remaining_time_in_millis(self):
+            return 200
+
+    redis = LockRedis()
+    scans, _, _ = _refresh_setup(monkeypatch, tmp_path, RATINGS, redis)
+    monkeypatch.setattr(recommendation_engine, "MODEL_REFRESH_WAIT", 60)
+    # The holder never publishes (e.g. it died with the lock)
+    redis.set(recommendation_engine.REFRESH_LOCK_KEY, "other", nx=True)
+
+    engine = RecommendationEngine()
+    with invocation_deadline(LambdaContext()):
+        engine._fetch_data()
+    # Gave up after half the 200 ms left (about 10 polls, not 60 s worth)
+    # and built the model itself
+    assert redis.polls < 100
+    assert len(scans) == 1 and engine.matrix.nnz == len(RATINGS)
+
+def test_model_too_big_serves_popularity_and_backs_off(monkeypatch, tmp_path):
+    import services.rating_matrix as rating_matrix
+    import services.recommendation_engine as recommendation_engine
+
+    scans, _, _ = _refresh_setup(monkeypatch, tmp_path, RATINGS)
+    monkeypatch.setattr(rating_matrix, "MAX_MATRIX_MB", 1e-6)
+    engine = RecommendationEngine()
+
+    # No model fits: the popularity ranking is served, from one scan only
+    for _ in range(3):
+        assert engine.recommend_many(["u1", "nobody"], k=3) == {
+            "u1": engine._popular_scores(3), "nobody": engine._popular_scores(3),
+        }
+    assert engine.matrix is None and len(scans) == 1
+    assert [movie_id for movie_id, _ in engine._popular_scores(3)] == PopularityIndex.from_matrix(build_matrix(max_bytes=1e9)).top(3)
+
+    # Past MODEL_BUILD_RETRY it tries again
+    monkeypatch.setattr(rating_matrix, "MAX_MATRIX_MB", 96)
+    engine.build_failed_at -= recommendation_engine.MODEL_BUILD_RETRY
+    engine.recommend_many(["u1"], k=3)
+    assert engine.matrix is not None and engine.matrix.nnz == len(RATINGS)
@@ -0,0 +1,124 @@
+import os
+import asyncio
+import pytest
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+import services.response_cache as response_cache
+from services.response_cache import ResponseCache, cached_json, user_tag, invalidate
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(response_cache, "_cache", ResponseCache())
+    computed = []
+    app = FastAPI()
+
+    @app.get("/recs/{user_id}")
+    async def recs(user_id: str, request: Request):
+        async def compute():
+            computed.append(user_id)
+            return [{"movie_id": f"m{user_id}", "title": "T"}, {"movie_id": "shared", "title": "S"}]
+        return await cached_json(request, f"recs:{user_id}", compute, tags=[user_tag(user_id)], private=True)
+
+    @app.get("/page")
+    async def page(request: Request):
+        async def compute():
+            computed.append("page")
+            return [{"movie_id": "m1"}], {"X-Next-Cursor": "abc"}
+        return await cached_json(request, "page", compute, connect=False)
+
+    return TestClient(app), computed
+
+def test_hits_etags_and_headers(app):
+    client, computed = app
+    first = client.get("/recs/u1")
+    second = client.get("/recs/u1")
+    assert first.json() == second.json() and computed == ["u1"]
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    not_modified = client.get("/recs/u1", headers={"If-None-Match": f'W/{first.headers["ETag"]}, "other"'})
+    assert not_modified.status_code == 304 and not_modified.content == b""
+    assert client.get("/recs/u1", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+    page = client.get("/page")
+    assert page.headers["X-Next-Cursor"] == "abc" and page.headers["Cache-Control"] == "public, no-cache"
+    assert client.get("/page").headers["X-Next-Cursor"] == "abc"
+    assert computed.count("page") == 1
+
+def test_rating_writes_invalidate_exactly_the_affected_responses(app):
+    client, computed = app
+    for uid in ("u1", "u2"):
+        client.get(f"/recs/{uid}")
+    client.get("/page")
+    assert computed == ["u1", "u2", "page"]
+
+    # u1 rated a movie shown to nobody else: only u1's response is recomputed
+    invalidate("u1", ["unrelated"])
+    for uid in ("u1", "u2"):
+        client.get(f"/recs/{uid}")
+    client.get("/page")
+    assert computed == ["u1", "u2", "page", "u1"]
+
+    # A movie everyone's list shows changed its aggregates
+    invalidate(None, ["shared"])
+    for uid in ("u1", "u2"):
+        client.get(f"/recs/{uid}")
+    client.get("/page")
+    assert computed == ["u1", "u2", "page", "u1", "u1", "u2"]
+
+def test_response_computed_during_an_invalidation_is_not_cached(app, monkeypatch):
+    cache = response_cache._cache
+
+    async def compute():
+        # The user rates while their recommendations are being computed
+        cache.invalidate([user_tag("u1")])
+        return [{"movie_id": "m1"}]
+
+    request = Request({"type": "http", "headers": []})
+    asyncio.run(cached_json(request, "recs:u1", compute, tags=[user_tag("u1")]))
+    assert asyncio.run(cache.get("recs:u1")) is None
+
+class SharedRedis:
+    # Sync (invalidation) and async (request path) views of one fake Redis
+    def __init__(self):
+        self.strings, self.hash = {}, {}
+
+    def pipeline(self, transaction=False):
+        redis = self
+
+        class Pipe:
+            def hincrby(self, key, field, amount):
+                redis.hash[field] = redis.hash.get(field, 0) + amount
+
+            def execute(self):
+                pass
+        return Pipe()
+
+    def async_client(self):
+        redis = self
+
+        class Client:
+            async def hmget(self, key, fields):
+                return [str(redis.hash[f]).encode() if f in redis.hash else None for f in fields]
+
+            async def get(self, key):
+                return redis.strings.get(key)
+
+            async def set(self, key, value, ex=None):
+                redis.strings[key] = value.encode()
+        return Client()
+
+def test_shared_tier_serves_and_invalidates_across_containers():
+    redis = SharedRedis()
+    a = ResponseCache(redis, async_redis=redis.async_client)
+    b = ResponseCache(redis, async_redis=redis.async_client)
+
+    entry = asyncio.run(a.put("recs:u1", b'[{"movie_id":"m1"}]', [user_tag("u1"), "movie:m1"]))
+    # Container b has never computed it
+    assert asyncio.run(b.get("recs:u1")).etag == entry.etag
+    # A rating handled by container a invalidates b's copy
+    a.invalidate(["movie:m1"])
+    assert asyncio.run(b.get("recs:u1")) is None
@@ -0,0 +1,68 @@
+from services.search_index import TitleSearchIndex, normalize
+
+TITLES = [
+    "Toy Story (1995)",
+    "Amélie (2001)",
+    "Star Wars: Episode IV - A New Hope (1977)",
+    "Spider-Man (2002)",
+    "The Lost Star",
+    "Starship Troopers (1997)",
+    "Stardust (2007)",
+]
+
+def titles_for(index, query, limit=20):
+    return [TITLES[d] for d in index.search(query, limit)]
+
+def test_normalize_folds_case_accents_and_punctuation():
+    assert normalize("  AMÉLIE!! ") == "amelie"
+    assert normalize("Spider-Man") == "spider man"
+
+def test_accent_and_case_insensitive_substring():
+    index = TitleSearchIndex(TITLES)
+    assert titles_for(index, "amelie") == ["Amélie (2001)"]
+    assert titles_for(index, "NEW HOPE") == ["Star Wars: Episode IV - A New Hope (1977)"]
+    assert titles_for(index, "spider-man") == ["Spider-Man (2002)"]
+    assert titles_for(index, "zzz") == []
+
+def test_prefix_matches_rank_first():
+    index = TitleSearchIndex(TITLES)
+    results = titles_for(index, "star")
+    # Title prefixes (shortest first), then word prefixes
+    assert results == [
+        "Stardust (2007)",
+        "Starship Troopers (1997)",
+        "Star Wars: Episode IV - A New Hope (1977)",
+        "The Lost Star",
+    ]
+    assert titles_for(index, "st", limit=2) == ["Stardust (2007)", "Starship Troopers (1997)"]
+
+def test_substring_matches_inside_words():
+    index = TitleSearchIndex(TITLES)
+    assert titles_for(index, "ardu") == ["Stardust (2007)"]
+
+def large_catalog(n=10000):
+    words = ["star", "love", "night", "dark", "story", "return", "king", "city", "blue", "last"]
+    return [f"{words[i % 10]} {words[(i // 10) % 10]} {words[(i // 100) % 10]} {i}" for i in range(n)]
+
+def test_large_catalog_matches_a_full_scan(monkeypatch):
+    # Timing lives in scripts/benchmark_search.py; this checks the indexed
+    # lookups against ranking every title by hand
+    titles = large_catalog()
+    index = TitleSearchIndex(titles)
+
+    def scan(query, limit=20):
+        def group(title):
+            if title.startswith(query):
+                return 0
+            if any(word.startswith(query) for word in title.split()):
+                return 1
+            return 2 if len(query) >= 3 and query in title else None
+        ranked = sorted((group(t), len(t), t, d) for d, t in enumerate(index.titles) if group(t) is not None)
+        return [d for *_, d in ranked[:limit]]
+
+    for query in ["sta", "love night", "ing", "9999", "k", "ark 12"]:
+        assert index.search(query) == scan(query)
+
+    # Enough prefix matches: the trigram lists are not even consulted
+    monkeypatch.setattr(index, "_substring_docs", lambda query: 1 / 0)
+    assert len(index.search("sta")) == 20
@@ -0,0 +1,45 @@
+import numpy as np
+from services.snapshot import RatingsSnapshot
+
+def make_snapshot():
+    return RatingsSnapshot.from_columns(
+        ["u1", "u1", "ü2", "u3"],
+        ["m1", "m2", "m1", "filmé"],
+        [5.0, 3.5, 4.0, 0.5],
+    )
+
+def assert_same(a, b):
+    assert a.user_ids == b.user_ids
+    assert a.movie_ids == b.movie_ids
+    assert np.array_equal(a.user_codes, b.user_codes)
+    assert np.array_equal(a.movie_codes, b.movie_codes)
+    assert np.array_equal(a.ratings, b.ratings)
+    assert a.created_at == b.created_at
+
+def test_snapshot_round_trip_bytes():
+    snapshot = make_snapshot()
+    loaded = RatingsSnapshot.from_buffer(snapshot.to_bytes())
+    assert_same(snapshot, loaded)
+    assert loaded.user_codes.dtype == np.int32
+    assert loaded.ratings.dtype == np.float16
+
+def test_snapshot_round_trip_file_is_memory_mapped(tmp_path):
+    path = str(tmp_path / "ratings.snapshot")
+    snapshot = make_snapshot()
+    snapshot.save(path)
+    loaded = RatingsSnapshot.load(path)
+    assert_same(snapshot, loaded)
+    assert not loaded.ratings.flags.owndata
+
+def test_snapshot_rejects_other_versions():
+    data = bytearray(make_snapshot().to_bytes())
+    data[6] = 99
+    try:
+        RatingsSnapshot.from_buffer(bytes(data))
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+def test_empty_snapshot():
+    snapshot = RatingsSnapshot.from_columns([], [], [])
+    assert len(RatingsSnapshot.from_buffer(snapshot.to_bytes())) == 0
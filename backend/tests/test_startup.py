@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+from scripts.profile_startup import profile_startup, HEAVY_MODULES, BACKEND_DIR
+
+# Cold `import main` budget. Generous for CI machines; the Lambda itself sits
+# well under it once numpy/boto3/firebase are out of the import path.
+STARTUP_BUDGET_MS = float(os.environ.get("STARTUP_BUDGET_MS", 1500))
+
+
+def test_cold_import_is_within_budget_and_light():
+    result = profile_startup()
+    assert result["loaded"] == []
+    assert result["import_ms"] < STARTUP_BUDGET_MS, f"import main took {result['import_ms']:.0f} ms"
+
+
+def test_root_and_movie_listing_do_not_load_heavy_modules():
+    code = f"""
+import sys
+import main
+import routers.movies as movies
+from fastapi.testclient import TestClient
+
+class FakeTable:
+    def scan(self, **kwargs):
+        return {{"Items": [{{"movie_id": "m1", "title": "Heat", "genres": ["Crime"], "year": 1995}}]}}
+
+movies.get_movies_table = lambda: FakeTable()
+client = TestClient(main.app)
+assert client.get("/").status_code == 200
+assert client.get("/movies/").json()[0]["title"] == "Heat"
+print([m for m in {HEAVY_MODULES!r} if m in sys.modules])
+"""
+    proc = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True,
+        env={**os.environ, "AWS_DEFAULT_REGION": "us-east-1"},
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,42 @@
+import os
+import pytest
+from decimal import Decimal
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+moto = pytest.importorskip("moto")
+import boto3
+
+from services.table_scan import parallel_scan
+
+@pytest.fixture
+def ratings_table():
+    with moto.mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        table = dynamodb.create_table(
+            TableName="ratings-table",
+            KeySchema=[
+                {"AttributeName": "user_id", "KeyType": "HASH"},
+                {"AttributeName": "movie_id", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "user_id", "AttributeType": "S"},
+                {"AttributeName": "movie_id", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        with table.batch_writer() as batch:
+            for u in range(40):
+                for m in range(10):
+                    batch.put_item(Item={"user_id": f"u{u}", "movie_id": f"m{m}", "rating": Decimal(str((u + m) % 5 + 0.5))})
+        yield table
+
+@pytest.mark.parametrize("segments", [1, 4])
+def test_parallel_scan_reads_every_item(ratings_table, segments):
+    columns = parallel_scan(
+        ratings_table, ["user_id", "movie_id", "rating"], segments=segments,
+        numeric=["rating"], ProjectionExpression="user_id, movie_id, rating", Limit=25,
+    )
+    assert len(columns["user_id"]) == 400
+    assert columns["rating"].dtype.name == "float32"
+    rows = set(zip(columns["user_id"], columns["movie_id"], columns["rating"].tolist()))
+    assert rows == {(f"u{u}", f"m{m}", (u + m) % 5 + 0.5) for u in range(40) for m in range(10)}
@@ -0,0 +1,233 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from services.cache import TTLCache
+import services.movie_store as movie_store
+from services.vote_buffer import VoteBuffer, with_pending
+
+class FakeRedis:
+    # The handful of commands the vote buffer uses, bytes in and out like redis-py
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.RLock()
+
+    def _b(self, value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def hincrby(self, key, field, amount):
+        with self.lock:
+            h = self.data.setdefault(key, {})
+            h[self._b(field)] = self._b(int(h.get(self._b(field), 0)) + amount)
+            return int(h[self._b(field)])
+
+    def hincrbyfloat(self, key, field, amount):
+        with self.lock:
+            h = self.data.setdefault(key, {})
+            h[self._b(field)] = self._b(repr(float(h.get(self._b(field), 0)) + amount))
+            return float(h[self._b(field)])
+
+    def hlen(self, key):
+        return len(self.data.get(key, {}))
+
+    def hmget(self, key, fields):
+        h = self.data.get(key, {})
+        return [h.get(self._b(f)) for f in fields]
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hdel(self, key, field):
+        with self.lock:
+            h = self.data.get(key, {})
+            h.pop(self._b(field), None)
+            if not h:
+                self.data.pop(key, None)
+
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = self._b(value)
+            return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def rename(self, src, dst):
+        with self.lock:
+            self.data[dst] = self.data.pop(src)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def incr(self, key):
+        with self.lock:
+            self.data[key] = self._b(int(self.data.get(key, 0)) + 1)
+            return int(self.data[key])
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        with self.redis.lock:
+            return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+class AsyncFakePipeline(FakePipeline):
+    async def execute(self):
+        return FakePipeline.execute(self)
+
+class MoviesTable:
+    def __init__(self):
+        self.items = {}
+        self.updates = 0
+        self.lock = threading.Lock()
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues):
+        with self.lock:
+            self.updates += 1
+            item = self.items.setdefault(Key["movie_id"], {"movie_id": Key["movie_id"], "vote_count": 0, "vote_total": Decimal(0)})
+            item["vote_total"] += ExpressionAttributeValues[":val"]
+            item["vote_count"] += ExpressionAttributeValues.get(":inc", 0)
+
+def _buffer(redis, **kwargs):
+    return VoteBuffer(redis, async_redis=lambda: type("R", (), {"pipeline": lambda self, transaction=False: AsyncFakePipeline(redis)})(), **kwargs)
+
+def test_hot_movie_deltas_are_coalesced_into_one_update():
+    redis, table = FakeRedis(), MoviesTable()
+    buffer = _buffer(redis, max_movies=100, flush_interval=3600)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda i: buffer.add(table, "hot", 1, 1 + i % 5), range(200)))
+    buffer.add(table, "other", 1, 2.5)
+    buffer.add(table, "hot", 0, -1.0)  # a re-rate
+    assert table.updates == 0
+
+    generation, pending = buffer.pending(["hot", "other", "cold"])
+    assert pending == {"hot": (200, 599.0), "other": (1, 2.5)}
+    assert buffer.pending_async and asyncio.run(buffer.pending_async(["hot"]))[1] == {"hot": (200, 599.0)}
+
+    assert buffer.flush(table) == 2
+    assert table.updates == 2
+    assert table.items["hot"]["vote_count"] == 200 and table.items["hot"]["vote_total"] == 599
+    new_generation, pending = buffer.pending(["hot", "other"])
+    assert pending == {} and new_generation == generation + 1
+
+def test_flush_triggers_on_size_and_interval():
+    redis, table = FakeRedis(), MoviesTable()
+    buffer = _buffer(redis, max_movies=3, flush_interval=3600)
+    buffer.add(table, "m1", 1, 4)
+    buffer.add(table, "m2", 1, 4)
+    assert table.updates == 0
+    buffer.add(table, "m3", 1, 4)
+    assert table.updates == 3 and buffer.pending(["m1", "m2", "m3"])[1] == {}
+
+    buffer = _buffer(redis, max_movies=100, flush_interval=0)
+    buffer.add(table, "m1", 1, 2)
+    assert table.items["m1"]["vote_count"] == 2
+
+def test_writes_through_without_redis():
+    table = MoviesTable()
+    buffer = VoteBuffer(None)
+    assert buffer.add(table, "m1", 1, 3) and table.updates == 1
+    assert buffer.add(table, "m1", 0, 0) is False and table.updates == 1
+
+    class BrokenRedis(FakeRedis):
+        def pipeline(self, transaction=True):
+            raise ConnectionError("down")
+
+    assert VoteBuffer(BrokenRedis()).add(table, "m1", 1, 5) and table.updates == 2
+    assert table.items["m1"]["vote_count"] == 2
+
+def test_readers_add_pending_votes(monkeypatch):
+    redis, table = FakeRedis(), MoviesTable()
+    buffer = _buffer(redis, max_movies=100, flush_interval=3600)
+    monkeypatch.setattr(movie_store, "get_vote_buffer", lambda: buffer)
+    monkeypatch.setattr(movie_store, "movie_cache", TTLCache(1000, 60))
+    monkeypatch.setattr(movie_store, "_generation", None)
+
+    stored = {"m1": {"movie_id": "m1", "title": "Heat", "genres": [], "year": 1995,
+                     "vote_count": Decimal(1), "vote_total": Decimal(2)}}
+    fetches = []
+
+    def batch_get(table_name, movie_ids):
+        fetches.append(list(movie_ids))
+        item = dict(stored["m1"])
+        item.update(table.items.get("m1", {}))
+        return [item]
+
+    monkeypatch.setattr(movie_store, "_batch_get", batch_get)
+    table.items["m1"] = {"movie_id": "m1", "vote_count": 1, "vote_total": Decimal(2)}
+
+    assert movie_store.get_movies_by_ids(["m1"])["m1"].average_rating == 2.0
+    buffer.add(table, "m1", 1, 4)
+    movie = movie_store.get_movies_by_ids(["m1"])["m1"]
+    assert (movie.vote_count, movie.average_rating) == (2, 3.0)
+    assert len(fetches) == 1  # served from the cache plus the pending delta
+
+    # After a flush the cached value is stale: the cache is dropped and refetched
+    buffer.flush(table)
+    movie = asyncio.run(movie_store.get_movies_by_ids_async(["m1"]))["m1"]
+    assert (movie.vote_count, movie.average_rating) == (2, 3.0)
+    assert len(fetches) == 2
+
+    item = {"movie_id": "m1", "vote_count": Decimal(2), "vote_total": Decimal(6)}
+    assert with_pending(item, {"m1": (1, 3.0)})["vote_count"] == 3
+    assert with_pending(item, {}) is item
+
+def test_search_hits_are_not_stale_after_a_flush(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    import services.movie_catalog as movie_catalog
+    import services.response_cache as response_cache
+    from routers import movies
+
+    redis, table = FakeRedis(), MoviesTable()
+    buffer = _buffer(redis, max_movies=100, flush_interval=3600)
+    monkeypatch.setattr(movie_store, "get_vote_buffer", lambda: buffer)
+    monkeypatch.setattr(movie_store, "movie_cache", TTLCache(1000, 60))
+    monkeypatch.setattr(movie_store, "_generation", None)
+    monkeypatch.setattr(response_cache, "_cache", response_cache.ResponseCache())
+
+    heat = {"movie_id": "m1", "title": "Heat", "genres": [], "year": 1995, "vote_count": 1, "vote_total": 2.0}
+    # Loaded before the votes below, as after a warm start from /tmp
+    catalog = movie_catalog.MovieCatalog([dict(heat)])
+    monkeypatch.setattr(movie_catalog, "get_catalog", lambda: catalog)
+    table.items["m1"] = {"movie_id": "m1", "vote_count": 1, "vote_total": Decimal(2)}
+
+    def batch_get(table_name, movie_ids):
+        return [{**heat, **table.items["m1"]}]
+
+    monkeypatch.setattr(movie_store, "_batch_get", batch_get)
+    app = FastAPI()
+    app.include_router(movies.router)
+    client = TestClient(app)
+
+    def search():
+        response_cache._cache = response_cache.ResponseCache()
+        [movie] = client.get("/movies/", params={"search": "heat"}).json()
+        return movie["vote_count"], movie["vote_total"]
+
+    buffer.add(table, "m1", 1, 4)
+    assert search() == (2, 6.0)
+    # The flush moves the vote into the table and clears the buffer: the
+    # search still counts it
+    buffer.flush(table)
+    assert search() == (2, 6.0)
+    buffer.add(table, "m1", 1, 5)
+    assert search() == (3, 11.0)